@@ -0,0 +1,337 @@
+# archive.py
+import argparse
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from config import ARCHIVE_INDEX_PATH, ARCHIVE_PATH
+import metrics
+
+# アーカイブに書くHTTPヘッダーから除くもの
+# （本文はrequestsが展開済みで保存するので、転送時のエンコーディングは含めない）
+DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length"}
+
+# 内容が前回と同じ応答はrevisitレコード（ヘッダーのみ）にする
+REVISIT_PROFILE = "http://netpreserve.org/warc/1.1/revisit/identical-payload-digest"
+
+
+def _warc_date(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _warc_record(fields: list, block: bytes) -> bytes:
+    """WARC/1.1のレコード1件（ヘッダー + ブロック + 区切りの空行2つ）"""
+    lines = ["WARC/1.1", *(f"{k}: {v}" for k, v in fields), f"Content-Length: {len(block)}"]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + block + b"\r\n\r\n"
+
+
+def _http_head(res) -> bytes:
+    """ステータス行とヘッダー（本文の長さは展開後のもの）"""
+    lines = [f"HTTP/1.1 {res.status_code} {res.reason or ''}".rstrip()]
+    for key, value in res.headers.items():
+        if key.lower() not in DROPPED_HEADERS:
+            lines.append(f"{key}: {value}")
+    lines.append(f"Content-Length: {len(res.content)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "replace")
+
+
+def parse_record(data: bytes) -> dict:
+    """
+    展開済みのWARCレコードを読む
+    返り値: {"type", "url", "fetched_at", "status", "headers", "content"}
+    """
+    head, _, rest = data.partition(b"\r\n\r\n")
+    fields = {}
+    for line in head.decode("utf-8").split("\r\n")[1:]:
+        key, _, value = line.partition(":")
+        fields[key.strip().lower()] = value.strip()
+    block = rest[: int(fields.get("content-length", len(rest)))]
+    record = {
+        "type": fields.get("warc-type"),
+        "url": fields.get("warc-target-uri"),
+        "fetched_at": datetime.strptime(fields["warc-date"], "%Y-%m-%dT%H:%M:%S.%fZ")
+        .replace(tzinfo=timezone.utc)
+        .timestamp(),
+        "status": None,
+        "headers": {},
+        "content": b"",
+        "digest": (fields.get("warc-payload-digest") or "").partition(":")[2],
+        "record_id": fields.get("warc-record-id"),
+    }
+    if record["type"] in ("response", "revisit"):
+        http_head, _, body = block.partition(b"\r\n\r\n")
+        lines = http_head.decode("latin-1").split("\r\n")
+        record["status"] = int(lines[0].split(" ")[1])
+        for line in lines[1:]:
+            key, _, value = line.partition(":")
+            record["headers"][key.strip()] = value.strip()
+        record["content"] = body
+    return record
+
+
+def iter_members(f, start: int = 0, chunk_size: int = 1 << 20):
+    """
+    gzipメンバー（= レコード）を先頭から順に読み、(オフセット, 長さ, 展開後のバイト列) を返す
+    末尾の書きかけのメンバーは返さない
+    """
+    f.seek(start)
+    offset = start
+    d = zlib.decompressobj(31)
+    out = []
+    fed = 0
+    buf = b""
+    while True:
+        if not buf:
+            buf = f.read(chunk_size)
+            if not buf:
+                return
+        try:
+            out.append(d.decompress(buf))
+        except zlib.error:
+            # 書きかけのメンバーの後に次のメンバーが続いている（途中で落ちた書き込み）
+            return
+        fed += len(buf)
+        if not d.eof:
+            buf = b""
+            continue
+        tail = d.unused_data
+        length = fed - len(tail)
+        yield offset, length, b"".join(out)
+        offset += length
+        d = zlib.decompressobj(31)
+        out = []
+        fed = 0
+        buf = tail
+
+
+class ResponseArchive:
+    """
+    取得した生のレスポンスを追記していくアーカイブ（WARC/1.1形式、1レコードずつgzip圧縮）
+    - レコードごとに独立したgzipメンバーなので、索引のオフセットから1件だけ読み出せる
+      （ファイル全体は通常の.warc.gzとしてWARCツールでも読める）
+    - 索引（SQLite）にURL・ステータス・取得時刻・本文のSHA-256・オフセット・長さを記録
+    - 本文が前回と同じ応答は、ヘッダーだけのrevisitレコードにする
+    - 書き込みの途中で落ちた場合は、次に開いたときに索引にない末尾のレコードを索引し直す
+    """
+
+    def __init__(self, path: str = ARCHIVE_PATH, index_path: str = ARCHIVE_INDEX_PATH):
+        self.path = path
+        self.index_path = index_path
+        for p in (path, index_path):
+            os.makedirs(os.path.dirname(p) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY,
+                record_id TEXT,
+                url TEXT,
+                type TEXT,
+                status INTEGER,
+                content_type TEXT,
+                fetched_at REAL,
+                digest TEXT,
+                offset INTEGER,
+                length INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS records_url ON records (url, id);
+            """
+        )
+        self._conn.commit()
+        self._file = open(path, "a+b")
+        self._recover()
+        if os.path.getsize(path) == 0:
+            self._write_warcinfo()
+
+    # ===== 書き込み =====
+    def _append(self, data: bytes) -> tuple:
+        """レコードを1つのgzipメンバーとして追記し、(オフセット, 長さ) を返す（ロック内で呼ぶ）"""
+        member = gzip.compress(data, compresslevel=6)
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(member)
+        self._file.flush()
+        return offset, len(member)
+
+    def _write_warcinfo(self):
+        block = b"software: recipe-scraper\r\nformat: WARC File Format 1.1\r\n"
+        fields = [
+            ("WARC-Type", "warcinfo"),
+            ("WARC-Record-ID", f"<urn:uuid:{uuid.uuid4()}>"),
+            ("WARC-Date", _warc_date(time.time())),
+            ("WARC-Filename", os.path.basename(self.path)),
+            ("Content-Type", "application/warc-fields"),
+        ]
+        with self._lock:
+            self._append(_warc_record(fields, block))
+
+    def record(self, url: str, res, fetched_at: float = None):
+        """
+        requestsのResponseを1件記録する（本文は展開済みのもの）
+        同じURLの直前の記録と同じステータス・本文なら、revisitレコードにする
+        """
+        fetched_at = fetched_at or time.time()
+        content = res.content or b""
+        digest = hashlib.sha256(content).hexdigest()
+        record_id = f"<urn:uuid:{uuid.uuid4()}>"
+        head = _http_head(res)
+        fields = [
+            ("WARC-Record-ID", record_id),
+            ("WARC-Date", _warc_date(fetched_at)),
+            ("WARC-Target-URI", url),
+            ("WARC-Payload-Digest", f"sha256:{digest}"),
+            ("Content-Type", "application/http; msgtype=response"),
+        ]
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT record_id FROM records"
+                " WHERE url = ? AND type = 'response' AND status = ? AND digest = ?"
+                " ORDER BY id DESC LIMIT 1",
+                (url, res.status_code, digest),
+            ).fetchone()
+            if previous and content:
+                kind = "revisit"
+                fields = [("WARC-Type", kind), *fields]
+                fields += [("WARC-Refers-To", previous[0]), ("WARC-Profile", REVISIT_PROFILE)]
+                data = _warc_record(fields, head)
+            else:
+                kind = "response"
+                data = _warc_record([("WARC-Type", kind), *fields], head + content)
+            offset, length = self._append(data)
+            self._index(
+                record_id, url, kind, res.status_code, res.headers.get("Content-Type"),
+                fetched_at, digest, offset, length,
+            )
+
+    def _index(self, *row):
+        self._conn.execute(
+            "INSERT INTO records (record_id, url, type, status, content_type, fetched_at,"
+            " digest, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            row,
+        )
+        self._conn.commit()
+
+    def _index_member(self, offset: int, length: int, data: bytes) -> bool:
+        """読み直したレコードを索引する（warcinfoなど応答以外は索引しない）"""
+        record = parse_record(data)
+        if record["type"] not in ("response", "revisit"):
+            return False
+        self._index(
+            record["record_id"], record["url"], record["type"], record["status"],
+            record["headers"].get("Content-Type"), record["fetched_at"], record["digest"],
+            offset, length,
+        )
+        return True
+
+    def _recover(self):
+        """索引の最後のレコードより後ろを読み直して索引し、書きかけの末尾は切り詰める"""
+        row = self._conn.execute("SELECT MAX(offset + length) FROM records").fetchone()
+        end = row[0] or 0
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        if size <= end:
+            return
+        recovered = 0
+        with open(self.path, "rb") as f:
+            for offset, length, data in iter_members(f, end):
+                recovered += self._index_member(offset, length, data)
+                end = offset + length
+        if end < size:
+            self._file.truncate(end)
+        if recovered or end < size:
+            metrics.log_event(
+                "archive_recovered",
+                f"  ♻️  アーカイブの末尾を復旧: {recovered}件を索引、{size - end}バイトを切り詰め",
+                recovered=recovered,
+                truncated_bytes=size - end,
+            )
+
+    # ===== 読み出し =====
+    def has_body(self, url: str) -> bool:
+        """URLの200応答（本文つき）が記録済みか"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM records WHERE url = ? AND type = 'response' AND status = 200 LIMIT 1",
+                (url,),
+            ).fetchone()
+        return row is not None
+
+    def latest(self):
+        """
+        URLごとの最新の200応答の索引を、記録した順に返す
+        返り値: (url, content_type, fetched_at, offset, length) のリスト
+        （最新がrevisitの場合は同じ本文（ペイロードダイジェスト）を持つresponseレコードを指す。
+        取得時刻は最新のもの。内容がA→B→Aと戻った場合もBではなくAの本文になる）
+        """
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT n.url, n.content_type, n.fetched_at, b.offset, b.length
+                FROM records n
+                JOIN records b ON b.id = (
+                    SELECT MAX(id) FROM records
+                    WHERE url = n.url AND type = 'response' AND status = 200 AND digest = n.digest
+                )
+                WHERE n.id = (SELECT MAX(id) FROM records WHERE url = n.url AND status = 200)
+                ORDER BY n.id
+                """
+            ).fetchall()
+
+    def read(self, offset: int, length: int) -> dict:
+        """索引のオフセット・長さからレコードを1件読む（parse_recordの返り値）"""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        return parse_record(gzip.decompress(data))
+
+    def stats(self) -> dict:
+        with self._lock:
+            records, urls = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT url) FROM records"
+            ).fetchone()
+        return {"records": records, "urls": urls, "bytes": os.path.getsize(self.path)}
+
+    def reindex(self) -> int:
+        """アーカイブ全体を読み直して索引を作り直す（索引ファイルをなくした場合など）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM records")
+            self._conn.commit()
+            count = 0
+            with open(self.path, "rb") as f:
+                for offset, length, data in iter_members(f):
+                    count += self._index_member(offset, length, data)
+        return count
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._conn.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="レスポンスアーカイブの件数を表示する")
+    parser.add_argument("--path", default=ARCHIVE_PATH, help="アーカイブファイル")
+    parser.add_argument("--index", default=ARCHIVE_INDEX_PATH, help="索引ファイル")
+    parser.add_argument(
+        "--reindex", action="store_true", help="アーカイブ全体を読み直して索引を作り直す"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    archive = ResponseArchive(args.path, args.index)
+    try:
+        if args.reindex:
+            print(f"🗂  索引を作り直しました: {archive.reindex()}件")
+        print(f"🗂  {args.path}: {archive.stats()}")
+    finally:
+        archive.close()
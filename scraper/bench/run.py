@@ -0,0 +1,312 @@
+# bench/run.py
+"""
+スクレイパーのオフラインベンチマーク（本番サイト・本番DBにはアクセスしない）
+
+- micro: 保存済みフィクスチャと合成ページで、デコード・逐次パース・soup生成・各抽出関数を計測
+- e2e: ローカルのStandInSiteに向けてmain()を実行し、ステージごとのレイテンシを計測
+  （書き出し先は既定でmongomock、--mongo-uriでローカルのmongodも使える）
+
+結果はステージごとの pages/s と p50 / p99 レイテンシをJSONで出力する
+--compareに前回の結果を渡すと、ステージごとのpages/sの変化を表示する
+
+使い方（scraper/ディレクトリで実行）:
+    python bench/run.py --pages 500 --output bench.json
+    python bench/run.py --only micro --compare bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from functools import wraps
+from pathlib import Path
+
+SCRAPER_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SCRAPER_DIR))
+
+# config.pyは読み込み時に環境変数を読むので、スクレイパーのモジュールより先に設定する
+# （明示的に設定された値は上書きしないので、設定を変えた比較もできる）
+BENCH_ENV = {
+    # ローカルサーバー相手なのでレート制限で頭打ちにしない
+    "FETCH_RATE_PER_SEC": "1000",
+    "FETCH_BURST": "1000",
+    # 毎回本文を取得・パースした場合を計測する
+    "HTTP_CACHE_PATH": "",
+    # Chromeは起動しない
+    "LISTING_MODE": "http",
+    # ローカルサイトに画像はないので、画像ステージは動かさない
+    "IMAGE_ENABLED": "0",
+    # 変更マニフェストのJSONLは書かない（scrape_runs（mongomock）には件数だけが残る）
+    "MANIFEST_DIR": "",
+    "MONGODB_URI": "mongodb://localhost:27017",
+    "DB_NAME": "recipe_bench",
+}
+for _key, _value in BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+from standin import StandInSite, build_site, fixture_names, load_fixture  # noqa: E402
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """最近傍順位法のパーセンタイル"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Timings:
+    """ステージ名ごとの所要時間（秒）を集める"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def wrap(self, stage: str, func):
+        """funcの呼び出しを計測する関数を返す（コルーチン関数はコルーチン関数のまま）"""
+        if asyncio.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self.measure(stage):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.measure(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def summary(self) -> dict:
+        result = {}
+        for stage, values in self.samples.items():
+            values = sorted(values)
+            total = sum(values)
+            result[stage] = {
+                "count": len(values),
+                "total_s": round(total, 6),
+                "pages_per_s": round(len(values) / total, 2) if total else None,
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+            }
+        return result
+
+
+# ===== マイクロベンチマーク =====
+def micro_inputs(synthetic: int, seed: int) -> list:
+    """(名前, 生バイト列) のリスト: フィクスチャの詳細ページ + 合成した詳細ページ"""
+    inputs = [(name, load_fixture(name)) for name in fixture_names("detail_")]
+    site = build_site(synthetic, seed)
+    inputs.extend((path, body) for path, body in site.items() if "/menu/" in path)
+    return inputs
+
+
+def run_micro(iterations: int, synthetic: int, seed: int) -> dict:
+    import scraper
+    from extract import PageSections, make_soup, resolve_backend
+    from listing import extract_listing_urls
+
+    timings = Timings()
+    inputs = micro_inputs(synthetic, seed)
+    categories = [(name, load_fixture(name)) for name in fixture_names("category_")]
+
+    for _ in range(iterations):
+        for name, content in inputs:
+            url = f"https://www.maff.go.jp/{name}"
+            with timings.measure("decode"):
+                html = scraper.decode_body(content, url)
+            with timings.measure("read_detail_sections"):
+                scraper.read_detail_sections(content, url)
+            with timings.measure("make_soup"):
+                soup = make_soup(html)
+            with timings.measure("get_soup"):
+                make_soup(scraper.decode_body(content, url))
+            with timings.measure("sections"):
+                sections = PageSections(soup)
+            with timings.measure("parse_ingredients"):
+                ingredients = scraper.parse_ingredients(sections)
+            with timings.measure("parse_cooking_method"):
+                scraper.parse_cooking_method(sections)
+            with timings.measure("get_section_clean"):
+                scraper.get_section_clean(sections, "主な使用食材")
+                scraper.get_section_clean(sections, "飲食方法")
+            with timings.measure("with_quantities"):
+                scraper.with_quantities(ingredients)
+            with timings.measure("ingredients_to_string"):
+                scraper.ingredients_to_string(ingredients)
+            with timings.measure("parse_detail_bytes"):
+                scraper.parse_detail_bytes(content, url)
+        for name, content in categories:
+            url = f"https://www.maff.go.jp/{name}"
+            html = scraper.decode_body(content, url)
+            with timings.measure("extract_listing_urls"):
+                extract_listing_urls(html, url)
+
+    return {
+        "parser_backend": resolve_backend(),
+        "pages": len(inputs),
+        "iterations": iterations,
+        "stages": timings.summary(),
+    }
+
+
+# ===== エンドツーエンド =====
+def use_mongomock():
+    """storageの共有クライアントをmongomockに差し替える"""
+    try:
+        import mongomock
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit(
+            "mongomock / mongomock-motor がありません: "
+            "pip install -r bench/requirements.txt するか --mongo-uri を指定してください"
+        )
+    import storage
+
+    # 同期・非同期クライアントで同じデータを共有する（実際のMongoDBと同じ見え方）
+    storage._client = mongomock.MongoClient()
+    storage._async_client = AsyncMongoMockClient(mock_mongo_client=storage._client)
+
+
+def run_e2e(pages: int, crawl: bool, latency: float, mongo_uri: str, seed: int) -> dict:
+    import pipeline
+    import scraper
+    import storage
+
+    if mongo_uri:
+        storage.MONGO_URI = mongo_uri
+    else:
+        use_mongomock()
+    storage.get_collection().drop()
+
+    timings = Timings()
+    fetcher = scraper.get_fetcher()
+    fetcher.get = timings.wrap("http", fetcher.get)
+    scraper.fetch_html = timings.wrap("listing", scraper.fetch_html)
+    scraper.collect_listings = timings.wrap("listing", scraper.collect_listings)
+    scraper.DetailStages.fetch = timings.wrap("fetch", scraper.DetailStages.fetch)
+    scraper.DetailStages.parse = timings.wrap("parse", scraper.DetailStages.parse)
+    pipeline.bulk_upsert = timings.wrap("sink", pipeline.bulk_upsert)
+
+    cwd = os.getcwd()
+    with StandInSite(pages, latency, seed) as site, tempfile.TemporaryDirectory() as tmp:
+        scraper.CATEGORY_LIST_PAGES = site.category_urls
+        # ジャーナル・既知URL索引・CSVは一時ディレクトリに書き出す
+        os.chdir(tmp)
+        try:
+            started = time.perf_counter()
+            # スクレイパーのログは計測のじゃまになるので捨てる
+            with contextlib.redirect_stdout(io.StringIO()):
+                scraper.main(crawl=crawl)
+            wall = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+        stored = storage.get_collection().count_documents({})
+        if not mongo_uri:
+            # mongomockのクライアントは閉じる必要がない
+            storage._client = storage._async_client = None
+        requests = site.requests
+        details = site.detail_count
+
+    return {
+        "mode": "crawl" if crawl else "top",
+        "site_pages": details,
+        "latency_s": latency,
+        "requests": requests,
+        "stored": stored,
+        "wall_s": round(wall, 3),
+        "pages_per_s": round(stored / wall, 2) if wall else None,
+        "stages": timings.summary(),
+    }
+
+
+# ===== 結果の比較 =====
+def compare(result: dict, baseline: dict):
+    """ステージごとのpages/sを前回の結果と比べて表示する"""
+    for section in ("micro", "e2e"):
+        new = (result.get(section) or {}).get("stages", {})
+        old = (baseline.get(section) or {}).get("stages", {})
+        for stage in sorted(set(new) & set(old)):
+            before = old[stage]["pages_per_s"]
+            after = new[stage]["pages_per_s"]
+            if not before or not after:
+                continue
+            change = (after / before - 1) * 100
+            print(
+                f"{section:5} {stage:22} {before:>12.2f} → {after:>12.2f} pages/s ({change:+.1f}%)",
+                file=sys.stderr,
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="スクレイパーのオフラインベンチマーク")
+    parser.add_argument("--only", choices=["micro", "e2e"], help="片方だけ実行する")
+    parser.add_argument("--pages", type=int, default=500, help="e2eのローカルサイトの詳細ページ数")
+    parser.add_argument("--synthetic", type=int, default=200, help="microで使う合成ページ数")
+    parser.add_argument("--iterations", type=int, default=3, help="microの繰り返し回数")
+    parser.add_argument(
+        "--mode", choices=["crawl", "top"], default="crawl", help="e2eでのmain()の実行モード"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="ローカルサイトの応答遅延（秒）")
+    parser.add_argument("--mongo-uri", help="mongomockの代わりに使うMongoDB（ローカルのmongod）")
+    parser.add_argument("--seed", type=int, default=0, help="合成ページの乱数シード")
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル（省略時は標準出力）")
+    parser.add_argument("--compare", help="比較する前回の結果JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from extract import resolve_backend
+
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parser_backend": resolve_backend(),
+        "env": {key: os.environ.get(key) for key in BENCH_ENV if key != "MONGODB_URI"},
+    }
+    if args.only in (None, "micro"):
+        result["micro"] = run_micro(args.iterations, args.synthetic, args.seed)
+    if args.only in (None, "e2e"):
+        result["e2e"] = run_e2e(
+            args.pages, args.mode == "crawl", args.latency, args.mongo_uri, args.seed
+        )
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        compare(result, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        import storage
+
+        storage.close_clients()
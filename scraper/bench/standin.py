@@ -0,0 +1,227 @@
+# bench/standin.py
+"""
+ベンチマーク用のwww.maff.go.jpの代わりになるローカルサイト
+- 詳細ページ・カテゴリーページ・都道府県別一覧ページを合成して生成（乱数シード固定で再現可能）
+- ThreadingHTTPServerでメモリ上のページを返す（latencyで応答遅延を模擬）
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+
+SITE_PREFIX = "/j/keikaku/syokubunka/k_ryouri/search_menu"
+CATEGORIES = ["rice", "noodles", "soup", "meat_vegetable", "fish"]
+PREFECTURES = [
+    "hokkaido", "aomori", "iwate", "miyagi", "akita", "yamagata", "fukushima",
+    "ibaraki", "tochigi", "gunma", "saitama", "chiba", "tokyo", "kanagawa",
+    "niigata", "toyama", "ishikawa", "fukui", "yamanashi", "nagano", "gifu",
+    "shizuoka", "aichi", "mie", "shiga", "kyoto", "osaka", "hyogo", "nara",
+    "wakayama", "tottori", "shimane", "okayama", "hiroshima", "yamaguchi",
+    "tokushima", "kagawa", "ehime", "kochi", "fukuoka", "saga", "nagasaki",
+    "kumamoto", "oita", "miyazaki", "kagoshima", "okinawa",
+]
+
+INGREDIENTS = [
+    "米", "もち米", "水", "鶏もも肉", "豚肉", "牛肉", "さわら", "さば", "いか", "えび",
+    "ごぼう", "にんじん", "大根", "里芋", "しいたけ", "こんにゃく", "油揚げ", "豆腐",
+    "ねぎ", "しょうが", "しょうゆ", "みそ", "砂糖", "みりん", "酒", "酢", "塩", "だし汁",
+]
+AMOUNTS = [
+    "450g（3合）", "630ml", "200g", "1/2本（80g）", "大さじ3", "大さじ1と1/2",
+    "小さじ1", "1かけ", "適量", "少々", "2カップ", "1尾（約1.5kg）", "4枚", "100cc",
+]
+STEPS = [
+    "米は洗って分量の水に30分以上浸しておく。",
+    "ごぼうはささがきにして水にさらし、鶏肉は1cm角に切る。",
+    "鍋に油を熱して具材を炒め、調味料を加えて汁気がなくなるまで煮る。",
+    "炊き上がったご飯に具を混ぜ合わせ、5分ほど蒸らす。",
+    "刺身に切って3％の塩をあて20分位おいた後、さっと洗い水気を取る。",
+    "だし汁に野菜を入れて柔らかくなるまで煮て、みそを溶き入れる。",
+    "器に盛り、ねぎを散らす。",
+]
+HISTORY = (
+    "古くから祝い事や来客時に作られてきた料理で、地域の集まりでは大鍋で作られた。"
+    "家庭ごとに味付けが異なり、親から子へと作り方が受け継がれている。"
+)
+
+
+def load_fixture(name: str) -> bytes:
+    return (FIXTURE_DIR / name).read_bytes()
+
+
+def fixture_names(prefix: str) -> list:
+    return sorted(p.name for p in FIXTURE_DIR.glob(f"{prefix}*.html"))
+
+
+def _page(title: str, body: str) -> str:
+    # 実ページと同程度のヘッダー・フッターを付け、パースのコストを近づける
+    nav = "".join(
+        f'<li><a href="/j/{p}/index.html">{p}</a></li>'
+        for p in ("aboutus", "press", "soshiki", "toukei", "sinsei", "kids", "use")
+    )
+    return (
+        '<!DOCTYPE html>\n<html lang="ja"><head><meta charset="utf-8">'
+        f"<title>{title} | うちの郷土料理：農林水産省</title>"
+        '<link rel="stylesheet" href="/j/shared_new/shared/css/style.css">'
+        '<script src="/j/shared_new/shared/js/jquery.js"></script></head><body>'
+        f'<div id="wrapper"><header id="header"><ul class="header_nav">{nav}</ul></header>'
+        f'<main id="main"><div class="contents">{body}</div></main>'
+        f'<footer id="footer"><ul class="footer_nav">{nav}</ul>'
+        '<p class="copyright">Copyright : Ministry of Agriculture, Forestry and Fisheries</p>'
+        "</footer></div></body></html>"
+    )
+
+
+def detail_page(slug: str, rng: random.Random) -> str:
+    """実ページと同じ構造の詳細ページを合成する"""
+    title = f"郷土料理{slug}"
+    main_items = "、".join(rng.sample(INGREDIENTS, rng.randint(2, 6)))
+    materials = "".join(
+        f'<li><ul class="list"><li>{rng.choice(INGREDIENTS)}</li>'
+        f"<li>{rng.choice(AMOUNTS)}</li></ul></li>"
+        for _ in range(rng.randint(3, 15))
+    )
+    steps = "".join(
+        f'<li><div class="num">{i + 1}</div><div class="txt">{rng.choice(STEPS)}</div></li>'
+        for i in range(rng.randint(2, 10))
+    )
+    body = (
+        f'<div class="menu_main clearfix"><h1 class="tit01"><span class="name">{title}</span></h1>'
+        f'<div class="photo"><img class="resp_img" src="images/{slug}_1.jpg" alt=""></div></div>'
+        '<ul class="menu_info clm2 mt30">'
+        f"<li><h3>主な使用食材</h3><p>{main_items}</p></li>"
+        f"<li><h3>歴史・由来・関連行事</h3><p>{HISTORY * rng.randint(1, 4)}</p></li>"
+        "<li><h3>飲食方法</h3><p>取り分けてそのまま食べる。保存する場合は冷蔵庫で2日程度。</p></li>"
+        "</ul>"
+        '<h2 class="tit05 mt50">材料<span class="small">（4人分）</span></h2>'
+        f'<ul class="menu_material clm2 mt10">{materials}</ul>'
+        f'<h2 class="tit05 mt50">作り方</h2><ul class="recipe mt10">{steps}</ul>'
+    )
+    return _page(title, body)
+
+
+def _cards(slugs: list) -> str:
+    return "".join(
+        f'<div class="list"><p class="tit"><a href="../menu/{s}.html">{s}</a></p></div>'
+        for s in slugs
+    )
+
+
+def category_page(category: str, slugs: list) -> str:
+    """全候補カードを含むカテゴリーページ（都道府県別一覧へのリンク付き）"""
+    body = (
+        f'<h1 class="tit01">{category}</h1>'
+        '<ul class="search_nav"><li><a href="../area/index.html">都道府県から探す</a></li></ul>'
+        f'<div id="SearchMenu1" class="search_menu">{_cards(slugs)}</div>'
+    )
+    return _page(category, body)
+
+
+def area_index_page(prefs: list) -> str:
+    links = "".join(f'<li><a href="{p}.html">{p}</a></li>' for p in prefs)
+    return _page("都道府県から探す", f'<ul class="area_list">{links}</ul>')
+
+
+def area_page(pref: str, slugs: list) -> str:
+    return _page(pref, f'<div id="SearchMenu1" class="search_menu">{_cards(slugs)}</div>')
+
+
+def build_site(pages: int, seed: int = 0) -> dict:
+    """
+    パス → HTMLバイト列 の辞書を作る
+    詳細ページはpages件。カテゴリー・都道府県に振り分け、
+    一部はカテゴリーページに載せず都道府県別一覧からのみ到達できるようにする
+    """
+    rng = random.Random(seed)
+    site = {}
+    by_category = {c: [] for c in CATEGORIES}
+    by_pref = {p: [] for p in PREFECTURES}
+    for i in range(pages):
+        pref = PREFECTURES[i % len(PREFECTURES)]
+        slug = f"dish{i:05d}_{pref}"
+        site[f"{SITE_PREFIX}/menu/{slug}.html"] = detail_page(slug, rng)
+        by_pref[pref].append(slug)
+        if rng.random() < 0.9:
+            by_category[rng.choice(CATEGORIES)].append(slug)
+
+    for category, slugs in by_category.items():
+        site[f"{SITE_PREFIX}/type/{category}.html"] = category_page(category, slugs)
+    site[f"{SITE_PREFIX}/area/index.html"] = area_index_page(PREFECTURES)
+    for pref, slugs in by_pref.items():
+        site[f"{SITE_PREFIX}/area/{pref}.html"] = area_page(pref, slugs)
+    return {path: html.encode("utf-8") for path, html in site.items()}
+
+
+class StandInSite:
+    """
+    build_siteのページを返すローカルHTTPサーバー（別スレッドで起動）
+    with文で使うと終了時に停止する
+    """
+
+    def __init__(self, pages: int = 500, latency: float = 0.0, seed: int = 0):
+        self.pages = build_site(pages, seed)
+        self.latency = latency
+        self.requests = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def category_urls(self) -> list:
+        return [f"{self.base_url}{SITE_PREFIX}/type/{c}.html" for c in CATEGORIES]
+
+    @property
+    def detail_count(self) -> int:
+        return sum(1 for path in self.pages if "/menu/" in path)
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests += 1
+                if site.latency:
+                    time.sleep(site.latency)
+                path = self.path.split("?")[0]
+                if path.endswith("/"):
+                    path += "index.html"
+                body = site.pages.get(path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,357 @@
+# browser.py
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+from config import (
+    BROWSER_MAX_TABS,
+    LISTING_ALLOWED_RESOURCES,
+    LISTING_BLOCK_RESOURCES,
+)
+import metrics
+
+CHROME_ARGS = [
+    "--headless=new",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-software-rasterizer",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-breakpad",
+    "--disable-client-side-phishing-detection",
+    "--disable-default-apps",
+    "--disable-features=TranslateUI",
+    "--disable-hang-monitor",
+    "--disable-ipc-flooding-protection",
+    "--disable-popup-blocking",
+    "--disable-prompt-on-repost",
+    "--disable-renderer-backgrounding",
+    "--disable-sync",
+    "--disable-translate",
+    "--metrics-recording-only",
+    "--no-first-run",
+    "--safebrowsing-disable-auto-update",
+    "--enable-automation",
+    "--password-store=basic",
+    "--use-mock-keychain",
+    "--window-size=1920,1080",
+]
+
+# リスト収集時にブロックできるリソースの種類とURLパターン（Network.setBlockedURLs用）
+# LISTING_ALLOWED_RESOURCESに含めた種類はブロックしない
+BLOCKABLE_RESOURCES = {
+    "image": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.svg*", "*.ico*"],
+    "font": ["*.woff*", "*.woff2*", "*.ttf*", "*.otf*", "*.eot*"],
+    "stylesheet": ["*.css*"],
+    "media": ["*.mp4*", "*.webm*", "*.mp3*", "*.m4a*"],
+    "third_party": [
+        "*google-analytics.com*",
+        "*googletagmanager.com*",
+        "*doubleclick.net*",
+        "*facebook.net*",
+        "*twitter.com*",
+        "*youtube.com*",
+        "*addthis.com*",
+    ],
+}
+
+# Chromeのコンテンツ設定で止められるもの（2 = ブロック）
+# フォント・CSSなどはコンテンツ設定がないため、CDPのURLブロックのみで止める
+CONTENT_SETTING_PREFS = {
+    "image": "profile.managed_default_content_settings.images",
+}
+
+# 1回のページ読み込みで転送したバイト数（Resource Timing APIで計測）
+TRANSFER_BYTES_JS = """
+return performance.getEntriesByType('navigation')
+    .concat(performance.getEntriesByType('resource'))
+    .reduce((sum, e) => sum + (e.transferSize || 0), 0);
+"""
+
+
+def blocked_resource_types(allowed=LISTING_ALLOWED_RESOURCES) -> list:
+    return [kind for kind in BLOCKABLE_RESOURCES if kind not in allowed]
+
+
+def blocked_url_patterns(allowed=LISTING_ALLOWED_RESOURCES) -> list:
+    """許可リストに含まれないリソースのURLパターン一覧"""
+    patterns = []
+    for kind in blocked_resource_types(allowed):
+        patterns.extend(BLOCKABLE_RESOURCES[kind])
+    return patterns
+
+
+# Heroku buildpackがインストールしたChromeのデフォルトパス
+# chrome-for-testing buildpackのパスを優先
+DEFAULT_CHROME_PATHS = [
+    "/app/.chrome-for-testing/chrome-linux64/chrome",  # chrome-for-testing (直接パス)
+    "/app/.chrome-for-testing/chrome/linux-*/chrome-linux64/chrome",  # chrome-for-testing (glob)
+    "/app/.chromedriver/bin/google-chrome",  # 旧buildpack
+    "/usr/bin/google-chrome",
+]
+
+DEFAULT_CHROMEDRIVER_PATHS = [
+    "/app/.chrome-for-testing/chromedriver-linux64/chromedriver",  # chrome-for-testing (直接パス)
+    "/app/.chrome-for-testing/chromedriver/linux-*/chromedriver-linux64/chromedriver",  # chrome-for-testing (glob)
+    "/app/.chromedriver/bin/chromedriver",  # 旧buildpack
+    "/usr/local/bin/chromedriver",
+    "/app/vendor/chromedriver/bin/chromedriver",
+]
+
+
+def _first_existing(path_patterns):
+    """パス候補（globパターン含む）から最初に存在するものを返す"""
+    for path_pattern in path_patterns:
+        if "*" in path_pattern:
+            # globパターンの場合
+            matches = glob.glob(path_pattern)
+            if matches:
+                return matches[0]
+        elif os.path.exists(path_pattern):
+            return path_pattern
+    return None
+
+
+@lru_cache(maxsize=None)
+def find_chrome_binary():
+    """
+    Chrome本体のパスを探す（結果はプロセス内でキャッシュ）
+    heroku-buildpack-chrome-for-testingが設定する環境変数を優先
+    """
+    return (
+        os.getenv("GOOGLE_CHROME_BIN")
+        or os.getenv("CHROME_BIN")
+        or _first_existing(DEFAULT_CHROME_PATHS)
+    )
+
+
+@lru_cache(maxsize=None)
+def find_chromedriver():
+    """ChromeDriverのパスを探す（結果はプロセス内でキャッシュ）"""
+    path = (
+        os.getenv("CHROMEDRIVER_PATH")
+        or os.getenv("CHROMEDRIVER_BIN")
+        or _first_existing(DEFAULT_CHROMEDRIVER_PATHS)
+    )
+    if path:
+        metrics.log_event("chromedriver_found", f"  🔍 Found ChromeDriver at: {path}", path=path)
+    return path
+
+
+def build_options(block_resources: bool = LISTING_BLOCK_RESOURCES) -> Options:
+    """ヘッドレスChromeの起動オプションを組み立てる"""
+    options = Options()
+    for arg in CHROME_ARGS:
+        options.add_argument(arg)
+    # 複数タブを並行して読み込むため、get()はナビゲーション開始直後に戻す
+    options.page_load_strategy = "none"
+
+    if block_resources:
+        # 軽量プロファイル: 許可リスト外のリソースをコンテンツ設定でも止める
+        prefs = {
+            CONTENT_SETTING_PREFS[kind]: 2
+            for kind in blocked_resource_types()
+            if kind in CONTENT_SETTING_PREFS
+        }
+        options.add_experimental_option("prefs", prefs)
+        if "image" in blocked_resource_types():
+            options.add_argument("--blink-settings=imagesEnabled=false")
+
+    chrome_binary = find_chrome_binary()
+    if chrome_binary:
+        options.binary_location = chrome_binary
+        metrics.log_event(
+            "chrome_binary", f"  🔧 Chrome binary: {chrome_binary}", path=chrome_binary
+        )
+    return options
+
+
+def create_driver(block_resources: bool = LISTING_BLOCK_RESOURCES):
+    """Chromeを起動してWebDriverを返す"""
+    options = build_options(block_resources)
+    chromedriver_path = find_chromedriver()
+
+    if chromedriver_path and os.path.exists(chromedriver_path):
+        service = Service(chromedriver_path)
+        metrics.log_event(
+            "chromedriver_service",
+            f"  🔧 Using ChromeDriver: {chromedriver_path}",
+            path=chromedriver_path,
+        )
+        try:
+            return webdriver.Chrome(service=service, options=options)
+        except Exception as e:
+            metrics.log_event(
+                "chrome_error",
+                f"  ❌ Failed to start Chrome with Service: {e}\n"
+                "  ⚠️  Falling back to default ChromeDriver",
+                service=True,
+                error=repr(e),
+            )
+            return webdriver.Chrome(options=options)
+
+    # ローカル環境ではデフォルトのChromeDriverを使用
+    metrics.log_event(
+        "chromedriver_default",
+        "  ⚠️  ChromeDriver path not found, using default\n"
+        "  💡 Make sure Chrome buildpacks are added to Heroku",
+    )
+    try:
+        return webdriver.Chrome(options=options)
+    except Exception as e:
+        metrics.log_event(
+            "chrome_error", f"  ❌ Failed to start Chrome: {e}", service=False, error=repr(e)
+        )
+        raise
+
+
+class BrowserTab:
+    """
+    BrowserSession内の1タブ
+    WebDriverはスレッドセーフではないため、操作はすべてセッションのロック内で
+    対象タブに切り替えてから行う。ページ読み込みの待機はロックの外で行うので、
+    複数タブの読み込みは並行して進む。
+    """
+
+    def __init__(self, session, handle: str):
+        self.session = session
+        self.handle = handle
+
+    def _run(self, func):
+        with self.session.lock:
+            driver = self.session.driver
+            driver.switch_to.window(self.handle)
+            return func(driver)
+
+    def load(self, url: str, timeout: float = 30, poll: float = 0.1):
+        """
+        URLを開き、新しいドキュメントの読み込みが完了するまで待つ
+        （get()はすぐ戻るので、前のページに付けた目印が消えたことで遷移を確認する）
+        """
+        self._run(lambda d: d.execute_script("window.__prevDocument = true"))
+        self._run(lambda d: d.get(url))
+        self._wait(
+            "return !window.__prevDocument && document.readyState === 'complete'",
+            timeout,
+            poll,
+        )
+
+    def wait_for(self, css: str, timeout: float = 10, poll: float = 0.1) -> bool:
+        """CSSセレクタに一致する要素が現れるまで待つ。タイムアウトしたらFalse"""
+        return self._wait(
+            f"return document.querySelector({json.dumps(css)}) !== null", timeout, poll
+        )
+
+    def _wait(self, script: str, timeout: float, poll: float) -> bool:
+        # 待機中はロックを手放し、他のタブの操作を進める
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._run(lambda d: d.execute_script(script)):
+                return True
+            time.sleep(poll)
+        return False
+
+    def transferred_bytes(self) -> int:
+        """現在のページの読み込みで転送されたバイト数"""
+        return int(self._run(lambda d: d.execute_script(TRANSFER_BYTES_JS)) or 0)
+
+    def attrs(self, css: str, attr: str) -> list:
+        """CSSセレクタに一致する要素の属性値リストを返す"""
+        return self._run(
+            lambda d: [
+                e.get_attribute(attr) for e in d.find_elements(By.CSS_SELECTOR, css)
+            ]
+        )
+
+
+class BrowserSession:
+    """
+    Chromeを1回だけ起動し、複数のタブを使い回すセッション
+    - 同時に使うタブ数はmax_tabsで上限を設定（dynoのメモリ対策）
+    - with文で使うと終了時にChromeを終了する
+    - block_resources=Trueでは、画像・フォント・CSS・外部スクリプトなどを
+      各タブでCDPのNetwork.setBlockedURLsによりブロックする（LISTING_ALLOWED_RESOURCESは除く）
+    """
+
+    def __init__(
+        self,
+        max_tabs: int = BROWSER_MAX_TABS,
+        block_resources: bool = LISTING_BLOCK_RESOURCES,
+    ):
+        self.max_tabs = max(1, max_tabs)
+        self.block_resources = block_resources
+        self.driver = None
+        self.lock = threading.RLock()
+        self._free = queue.Queue()
+        self._created = 0
+
+    def start(self):
+        if self.driver is None:
+            started = time.monotonic()
+            self.driver = create_driver(self.block_resources)
+            elapsed = time.monotonic() - started
+            metrics.observe("chrome_startup_seconds", elapsed)
+            metrics.log_event(
+                "chrome_started", f"  🌐 Chrome起動完了 ({elapsed:.1f}秒)", seconds=round(elapsed, 3)
+            )
+        return self
+
+    def quit(self):
+        if self.driver is not None:
+            self.driver.quit()
+            self.driver = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.quit()
+
+    def _apply_blocking(self):
+        """現在のタブにURLブロックを設定（CDPの設定はタブ単位）"""
+        if not self.block_resources:
+            return
+        try:
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": blocked_url_patterns()}
+            )
+        except Exception as e:
+            metrics.log_event(
+                "resource_block_error", f"  ⚠️  リソースブロックの設定に失敗: {e}", error=repr(e)
+            )
+
+    @contextmanager
+    def tab(self):
+        """空きタブを借りる（上限に達していれば返却を待つ）"""
+        self.start()
+        with self.lock:
+            handle = None
+            if self._free.empty() and self._created < self.max_tabs:
+                if self._created == 0:
+                    # 起動時のウィンドウを最初のタブとして使う
+                    handle = self.driver.current_window_handle
+                else:
+                    self.driver.switch_to.new_window("tab")
+                    handle = self.driver.current_window_handle
+                self._apply_blocking()
+                self._created += 1
+        if handle is None:
+            handle = self._free.get()
+        try:
+            yield BrowserTab(self, handle)
+        finally:
+            self._free.put(handle)
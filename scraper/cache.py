@@ -0,0 +1,101 @@
+# cache.py
+import json
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from config import HTTP_CACHE_PATH
+
+# 304応答時に復元するレスポンスヘッダー
+# （本文はrequestsが展開済みで保存するのでContent-Encodingは含めない）
+KEPT_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+
+
+class CacheEntry:
+    def __init__(self, url, etag, last_modified, headers, body, fetched_at):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers = headers
+        self.body = body
+        self.fetched_at = fetched_at
+
+    def conditional_headers(self) -> dict:
+        """再取得時に送る条件付きリクエストヘッダー"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self) -> requests.Response:
+        """キャッシュ内容から200応答相当のResponseを組み立てる"""
+        res = requests.Response()
+        res.status_code = 200
+        res.url = self.url
+        res.headers = CaseInsensitiveDict(self.headers)
+        res._content = self.body
+        res.from_cache = True
+        return res
+
+
+class HttpCache:
+    """
+    URLをキーにしたローカルHTTPキャッシュ（SQLite）
+    ETag / Last-Modifiedとレスポンス本文を保存し、
+    次回の取得時に条件付きリクエスト（If-None-Match / If-Modified-Since）を送る
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT,
+                body BLOB,
+                fetched_at REAL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, url: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, etag, last_modified, headers, body, fetched_at"
+                " FROM http_cache WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if not row:
+            return None
+        url, etag, last_modified, headers, body, fetched_at = row
+        return CacheEntry(url, etag, last_modified, json.loads(headers), body, fetched_at)
+
+    def put(self, url: str, res: requests.Response):
+        """検証用ヘッダー（ETag / Last-Modified）がある応答のみ保存"""
+        etag = res.headers.get("ETag")
+        last_modified = res.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        headers = {k: res.headers[k] for k in KEPT_HEADERS if k in res.headers}
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO http_cache"
+                " (url, etag, last_modified, headers, body, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, json.dumps(headers), res.content, time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,185 @@
+# charset.py
+import codecs
+import re
+import threading
+from urllib.parse import urlsplit
+
+from requests.compat import chardet
+
+import metrics
+
+# <meta charset="..."> / <meta http-equiv="Content-Type" content="text/html; charset=...">
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+?charset\s*=\s*["']?\s*([A-Za-z0-9._:-]+)""", re.I)
+# metaを探すのは先頭のこのバイト数まで（HTML仕様のprescanと同じく先頭だけを見る）
+META_PRESCAN_BYTES = 4096
+
+# 宣言どおりだとデコードできない文字がある文字コードを上位互換に読み替える
+# （Shift_JISと宣言されていても実際はWindowsの機種依存文字を含むことが多い）
+CHARSET_ALIASES = {
+    "shift_jis": "cp932",
+    "shift-jis": "cp932",
+    "sjis": "cp932",
+    "x-sjis": "cp932",
+    "windows-31j": "cp932",
+}
+
+# どんなバイト列でもデコードできてしまう1バイト文字コード（strictで試しても誤りに気付けない）
+# サーバーの既定値（ISO-8859-1など）がそのまま送られることが多いので、UTF-8として読める本文には使わない
+SINGLE_BYTE_CHARSETS = frozenset({"iso8859-1", "iso8859-15", "cp1252"})
+
+# 本文先頭のBOM → 文字コード（長いものから照合する）
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def normalize_charset(name):
+    """文字コード名をPythonのコーデック名にする（不明な名前はNone）"""
+    if not name:
+        return None
+    if isinstance(name, bytes):
+        name = name.decode("ascii", errors="ignore")
+    name = name.strip().strip("\"'").lower()
+    name = CHARSET_ALIASES.get(name, name)
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def header_charset(content_type):
+    """Content-Typeヘッダーのcharsetパラメータ"""
+    if not content_type:
+        return None
+    for param in content_type.split(";")[1:]:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "charset":
+            return normalize_charset(value)
+    return None
+
+
+def bom_charset(content: bytes):
+    """本文先頭のBOMが示す文字コード"""
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            return encoding
+    return None
+
+
+def is_utf8(content: bytes) -> bool:
+    """ASCII以外を含み、UTF-8として厳密にデコードできる"""
+    if content.isascii():
+        return False
+    try:
+        content.decode("utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def meta_charset(content: bytes):
+    """本文先頭の<meta>で宣言されたcharset"""
+    m = META_CHARSET_RE.search(content[:META_PRESCAN_BYTES])
+    return normalize_charset(m.group(1)) if m else None
+
+
+def detect_charset(content: bytes) -> str:
+    """本文全体から統計的に推定する（requestsのapparent_encodingと同じ処理、遅い）"""
+    with metrics.timer("charset_detect_seconds"):
+        return normalize_charset(chardet.detect(content)["encoding"]) or "utf-8"
+
+
+def iter_decode(content: bytes, encoding: str, errors: str = "strict", chunk_size: int = 8192):
+    """バイト列を少しずつデコードして文字列のチャンクを返す（マルチバイト文字の途中で切れても可）"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    view = memoryview(content)
+    for start in range(0, len(content), chunk_size):
+        text = decoder.decode(view[start : start + chunk_size])
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class CharsetResolver:
+    """
+    ページの文字コードを決める
+    1. 本文先頭のBOM
+    2. Content-Typeヘッダーのcharset
+    3. 本文先頭の<meta charset>
+    4. 同じホストで前回使えた文字コード（このページが宣言していない場合の補助）
+    5. 上記でデコードできなければUTF-8、それでもだめなら統計的に推定（errors="replace"）
+    1〜4は厳密にデコードできた場合だけ採用し、使えた文字コードをホストごとに覚える
+    1バイト文字コード（ISO-8859-1など）はどんな本文でもデコードできてしまうので、
+    本文がUTF-8として読める場合は採用しない
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def candidates(self, url: str, content: bytes, content_type=None):
+        """(文字コード, 判定方法) を優先順に返す。最後は必ず推定結果"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            cached = self._hosts.get(host)
+        seen = set()
+        utf8 = None
+        for encoding, source in (
+            (bom_charset(content), "bom"),
+            (header_charset(content_type), "header"),
+            (meta_charset(content), "meta"),
+            (cached, "host"),
+        ):
+            if not encoding or encoding in seen:
+                continue
+            seen.add(encoding)
+            if encoding in SINGLE_BYTE_CHARSETS:
+                if utf8 is None:
+                    utf8 = is_utf8(content)
+                if utf8:
+                    metrics.inc("charset_rejected_total", source=source)
+                    continue
+            yield encoding, source
+        if "utf-8" not in seen:
+            # 宣言がない・使えなかった本文は、まずUTF-8で厳密に試す（推定は遅い）
+            yield "utf-8", "utf8"
+        yield detect_charset(content), "detect"
+
+    def remember(self, url: str, encoding: str):
+        with self._lock:
+            self._hosts[urlsplit(url).netloc] = encoding
+
+    def apply(self, func, url: str, content: bytes, content_type=None):
+        """
+        func(encoding, errors) を候補の文字コードで順に試し、最初に成功した結果を返す
+        funcはデコードできなければUnicodeDecodeErrorを送出すること
+        """
+        for encoding, source in self.candidates(url, content, content_type):
+            errors = "replace" if source == "detect" else "strict"
+            try:
+                result = func(encoding, errors)
+            except UnicodeDecodeError:
+                metrics.inc("charset_rejected_total", source=source)
+                continue
+            metrics.inc("charset_resolved_total", source=source)
+            self.remember(url, encoding)
+            return result
+
+    def decode(self, url: str, content: bytes, content_type=None) -> str:
+        return self.apply(lambda enc, errors: str(content, enc, errors), url, content, content_type)
+
+
+# プロセス内で共有する（ホストごとの文字コードを覚えておく）
+RESOLVER = CharsetResolver()
+
+
+def decode_body(content: bytes, url: str = "", content_type=None) -> str:
+    """レスポンス本文をデコードする（推定はBOM・ヘッダー・metaで決まらない場合のみ）"""
+    with metrics.timer("decode_seconds"):
+        return RESOLVER.decode(url, content, content_type)
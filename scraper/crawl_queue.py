@@ -0,0 +1,361 @@
+# crawl_queue.py
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from config import (
+    CRAWL_QUEUE_COLLECTION,
+    CRAWL_RATE_LIMIT_COLLECTION,
+    FETCH_BURST,
+    FETCH_RATE_PER_SEC,
+    QUEUE_HEARTBEAT_INTERVAL,
+    QUEUE_LEASE_SECONDS,
+    QUEUE_MAX_ATTEMPTS,
+    QUEUE_POLL_INTERVAL,
+)
+from journal import FAILED
+from storage import close_clients, get_collection
+import metrics
+
+# キュー内のURLの状態（pending → leased → done / failed）
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+# crawl_queueコレクションの1件（詳細ページURLごと）:
+#     {
+#         "_id": "https://www.maff.go.jp/...",   # 詳細ページURL
+#         "category": "rice",
+#         "status": "leased",                    # pending / leased / done / failed
+#         "attempts": 1,                         # 取り出された回数
+#         "leaseOwner": "web.1-1234-ab12cd",     # 処理中のワーカー
+#         "leaseExpiresAt": 1700000120.0,        # この時刻を過ぎたら他のワーカーが取り直せる
+#         "enqueuedAt": 1700000000.0,
+#         "updatedAt": 1700000000.0,
+#         "error": "...",                        # 最後の失敗
+#     }
+
+
+def worker_id() -> str:
+    """ワーカーの識別子（Herokuではdyno名、それ以外はホスト名）+ PID + ランダムな6文字"""
+    name = os.getenv("DYNO") or socket.gethostname()
+    return f"{name}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class SharedRateLimit:
+    """
+    複数のワーカーで共有するホストごとのレート制限（Fetcherのトークンバケットの代わりに使う）
+    MongoDBの1ドキュメントに「次に送信してよい時刻」（tat）を持ち、楽観的ロックで進める
+    （GCRA: 容量burst・1秒あたりrate件のトークンバケットと同じ送信間隔になる）
+    時刻は各ワーカーの時計を使うので、dyno間の時計のずれはそのまま間隔の誤差になる
+    """
+
+    def __init__(self, host: str, rate: float = FETCH_RATE_PER_SEC, burst: int = FETCH_BURST):
+        self.host = host
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.col = get_collection(CRAWL_RATE_LIMIT_COLLECTION)
+        try:
+            self.col.update_one({"_id": host}, {"$setOnInsert": {"tat": 0.0}}, upsert=True)
+        except DuplicateKeyError:
+            # 他のワーカーが同時に作成した
+            pass
+
+    def acquire(self):
+        """送信してよい時刻を1つ予約し、その時刻まで待機する"""
+        if self.rate <= 0:
+            return
+        interval = 1 / self.rate
+        while True:
+            tat = self.col.find_one({"_id": self.host})["tat"]
+            now = time.time()
+            start = max(tat, now - (self.burst - 1) * interval)
+            res = self.col.update_one(
+                {"_id": self.host, "tat": tat}, {"$set": {"tat": start + interval}}
+            )
+            if res.modified_count:
+                break
+            # 他のワーカーが先に予約した（読み直してやり直す）
+            metrics.inc("rate_limit_conflicts_total")
+        wait = start - now
+        if wait > 0:
+            metrics.observe("rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+
+
+class CrawlQueue:
+    """
+    MongoDB上の作業キュー（複数のプロセス・dynoで同じクロールを分担する）
+    - find_one_and_updateでURLを1件ずつリースして取り出す（同じURLを2つのワーカーが同時に処理しない）
+    - 処理中のURLはハートビートでリースを延長し、ワーカーが落ちて延長されなくなったURLは他のワーカーが取り直す
+    - max_attempts回取り出しても保存できなかったURLはfailedにする
+    CrawlJournalと同じmark / mark_storedを持つので、DetailStages / JournalSinkにそのまま渡せる
+    """
+
+    def __init__(
+        self,
+        owner: str = None,
+        lease_seconds: float = QUEUE_LEASE_SECONDS,
+        heartbeat_interval: float = QUEUE_HEARTBEAT_INTERVAL,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+        poll_interval: float = QUEUE_POLL_INTERVAL,
+    ):
+        self.owner = owner or worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.col = get_collection(CRAWL_QUEUE_COLLECTION)
+        self.col.create_index([("status", ASCENDING), ("enqueuedAt", ASCENDING)])
+        self.col.create_index([("status", ASCENDING), ("leaseExpiresAt", ASCENDING)])
+        # このワーカーがリースしている（保存・失敗の記録がまだの）URL
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    # ===== 登録 =====
+    def enqueue(self, items) -> int:
+        """
+        (url, category) をpendingで登録する（処理中・未処理のURLはそのまま）
+        以前の実行でdone / failedになったURLは、もう一度pendingに戻す
+        返り値: 新しく登録・再登録した件数
+        """
+        now = time.time()
+        ops = []
+        for url, category in items:
+            pending = {
+                "status": PENDING,
+                "category": category,
+                "attempts": 0,
+                "enqueuedAt": now,
+                "updatedAt": now,
+            }
+            ops.append(UpdateOne({"_id": url, "status": {"$in": [DONE, FAILED]}}, {"$set": pending}))
+            ops.append(UpdateOne({"_id": url}, {"$setOnInsert": pending}, upsert=True))
+        if not ops:
+            return 0
+        result = self.col.bulk_write(ops, ordered=False)
+        return result.upserted_count + result.modified_count
+
+    # ===== 取り出し =====
+    def claim(self):
+        """
+        pending、またはリースが切れたURLを1件リースして返す（なければNone）
+        返り値: キューのドキュメント
+        """
+        now = time.time()
+        doc = self.col.find_one_and_update(
+            {
+                "$or": [
+                    {"status": PENDING},
+                    {"status": LEASED, "leaseExpiresAt": {"$lt": now}},
+                ],
+                "attempts": {"$lt": self.max_attempts},
+            },
+            {
+                "$set": {
+                    "status": LEASED,
+                    "leaseOwner": self.owner,
+                    "leaseExpiresAt": now + self.lease_seconds,
+                    "updatedAt": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("enqueuedAt", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return None
+        if doc["attempts"] > 1:
+            metrics.inc("crawl_queue_reclaimed_total")
+        metrics.inc("crawl_queue_claimed_total")
+        with self._lock:
+            self._held.add(doc["_id"])
+        return doc
+
+    def expire_exhausted(self) -> int:
+        """リースが切れたまま最大回数に達したURLをfailedにする（取り出し対象から外れたもの）"""
+        now = time.time()
+        result = self.col.update_many(
+            {
+                "status": LEASED,
+                "leaseExpiresAt": {"$lt": now},
+                "attempts": {"$gte": self.max_attempts},
+            },
+            {
+                "$set": {"status": FAILED, "error": "lease expired", "updatedAt": now},
+                "$unset": {"leaseOwner": "", "leaseExpiresAt": ""},
+            },
+        )
+        if result.modified_count:
+            metrics.inc("crawl_queue_finished_total", result.modified_count, result="failed")
+        return result.modified_count
+
+    def has_unfinished(self) -> bool:
+        """pending・leasedのURLが残っているか（他のワーカーの処理中・失敗後の再試行を待つため）"""
+        return self.col.count_documents({"status": {"$in": [PENDING, LEASED]}}, limit=1) > 0
+
+    async def iter_claimed(self):
+        """
+        パイプラインのsource: URLを1件ずつリースして (meta, url) として流す
+        取り出せるURLがなくなっても、他のワーカーが処理中のURLが残っている間は
+        poll_interval秒ごとに取り直しを試みる（リース切れ・失敗後の再試行を拾うため）
+        """
+        while True:
+            doc = await asyncio.to_thread(self.claim)
+            if doc is None:
+                await asyncio.to_thread(self.expire_exhausted)
+                if not await asyncio.to_thread(self.has_unfinished):
+                    return
+                await asyncio.sleep(self.poll_interval)
+                continue
+            yield {"url": doc["_id"], "category": doc.get("category")}, doc["_id"]
+
+    # ===== リースの延長 =====
+    def start_heartbeat(self):
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.extend_leases()
+            except Exception as e:
+                # 次の間隔で再試行する（リースが切れる前に回復すれば問題ない）
+                metrics.log_event(
+                    "crawl_queue_error", f"  ⚠️  リースの延長に失敗: {e}", action="extend", error=repr(e)
+                )
+
+    def extend_leases(self) -> int:
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return 0
+        now = time.time()
+        result = self.col.update_many(
+            {"_id": {"$in": held}, "status": LEASED, "leaseOwner": self.owner},
+            {"$set": {"leaseExpiresAt": now + self.lease_seconds, "updatedAt": now}},
+        )
+        return result.modified_count
+
+    # ===== 完了・失敗（CrawlJournalと同じインターフェース） =====
+    def mark(self, url: str, state: str, record: dict = None, error: str = None):
+        """失敗だけを記録する（fetched / parsedの途中経過はキューには残さない）"""
+        if state == FAILED:
+            self.fail(url, error)
+
+    def mark_stored(self, urls: list):
+        """
+        保存済みのURLをdoneにする（自分のリースのものだけ）
+        JournalSinkはMongoDBへの書き込みに失敗した行をここに渡さず、mark(FAILED)で再試行に回す
+        """
+        now = time.time()
+        result = self.col.update_many(
+            {"_id": {"$in": list(urls)}, "leaseOwner": self.owner},
+            {
+                "$set": {"status": DONE, "updatedAt": now},
+                "$unset": {"leaseOwner": "", "leaseExpiresAt": "", "error": ""},
+            },
+        )
+        with self._lock:
+            self._held.difference_update(urls)
+        if result.modified_count:
+            metrics.inc("crawl_queue_finished_total", result.modified_count, result="done")
+
+    def fail(self, url: str, error: str = None):
+        """
+        失敗を記録する。最大回数に達していなければpendingに戻して他のワーカーに任せ、
+        達していればfailedにする
+        """
+        now = time.time()
+        with self._lock:
+            self._held.discard(url)
+        release = {"$unset": {"leaseOwner": "", "leaseExpiresAt": ""}}
+        result = self.col.update_one(
+            {"_id": url, "leaseOwner": self.owner, "attempts": {"$lt": self.max_attempts}},
+            {"$set": {"status": PENDING, "error": error, "updatedAt": now}, **release},
+        )
+        if result.modified_count:
+            metrics.inc("crawl_queue_finished_total", result="retry")
+            return
+        result = self.col.update_one(
+            {"_id": url, "leaseOwner": self.owner},
+            {"$set": {"status": FAILED, "error": error, "updatedAt": now}, **release},
+        )
+        if result.modified_count:
+            metrics.inc("crawl_queue_finished_total", result="failed")
+
+    def release_held(self) -> int:
+        """終了時に、保存できなかったリースをpendingに戻す（リースが切れるのを待たせない）"""
+        with self._lock:
+            held = list(self._held)
+            self._held.clear()
+        if not held:
+            return 0
+        result = self.col.update_many(
+            {"_id": {"$in": held}, "status": LEASED, "leaseOwner": self.owner},
+            {
+                "$set": {"status": PENDING, "updatedAt": time.time()},
+                "$unset": {"leaseOwner": "", "leaseExpiresAt": ""},
+            },
+        )
+        return result.modified_count
+
+    def counts(self) -> dict:
+        rows = self.col.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+        return {row["_id"]: row["count"] for row in rows}
+
+    def retry_failed(self) -> int:
+        """failedのURLをpendingに戻す（原因を直した後の再実行用）"""
+        result = self.col.update_many(
+            {"status": FAILED},
+            {"$set": {"status": PENDING, "attempts": 0, "updatedAt": time.time()}},
+        )
+        return result.modified_count
+
+    def close(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        try:
+            released = self.release_held()
+        except Exception as e:
+            metrics.log_event(
+                "crawl_queue_error", f"  ⚠️  リースの解放に失敗: {e}", action="release", error=repr(e)
+            )
+            return
+        if released:
+            metrics.log_event(
+                "crawl_queue_released",
+                f"  ↩️  未完了のURLをキューに戻しました: {released}件",
+                released=released,
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="分散クロールの作業キュー（crawl_queue）の状態を表示する")
+    parser.add_argument(
+        "--retry-failed", action="store_true", help="failedのURLをpendingに戻す"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        queue = CrawlQueue()
+        if args.retry_failed:
+            print(f"🔁 failed → pending: {queue.retry_failed()}件")
+        print(f"📋 crawl_queue: {queue.counts()}")
+    finally:
+        close_clients()
@@ -0,0 +1,298 @@
+# extract.py
+from bs4 import BeautifulSoup, FeatureNotFound
+
+try:
+    from lxml import etree
+except ImportError:  # lxmlがなければ途中打ち切りなしで全体をパースする
+    etree = None
+
+from config import PARSER_BACKEND
+
+# 速い順に試すBeautifulSoupのパーサー
+# （selectolax等はBeautifulSoupと互換性がなく、既存の抽出関数をそのまま使えないため対象外）
+FAST_BACKENDS = ["lxml", "html.parser"]
+
+_resolved_backend = None
+
+
+def resolve_backend(name: str = PARSER_BACKEND) -> str:
+    """
+    設定値からBeautifulSoupのパーサー名を決める
+    - auto: lxmlがインストールされていればlxml、なければhtml.parser
+    - それ以外: 指定されたパーサー名をそのまま使う（既定はhtml.parser）
+    lxmlとhtml.parserは壊れたマークアップ（閉じていない<p> / <td>、余分な</div>など）で
+    異なる木を作るので、autoにすると抽出結果が変わる場合がある
+    """
+    if name != "auto":
+        return name
+    for backend in FAST_BACKENDS:
+        try:
+            BeautifulSoup("", backend)
+            return backend
+        except FeatureNotFound:
+            continue
+    return "html.parser"
+
+
+def _backend() -> str:
+    global _resolved_backend
+    if _resolved_backend is None:
+        _resolved_backend = resolve_backend()
+    return _resolved_backend
+
+
+def make_soup(markup) -> BeautifulSoup:
+    """設定されたパーサーでBeautifulSoupオブジェクトを作る"""
+    return BeautifulSoup(markup, _backend())
+
+
+def _has_class(tag, cls: str) -> bool:
+    return cls in (tag.get("class") or [])
+
+
+class PageSections:
+    """
+    詳細ページを1回だけ走査して、抽出に必要な要素の対応表を作る
+    - title_span: 最初のspan.name
+    - main_image: div.menu_main配下の最初のimg.resp_img
+    - material_ul: 最初のul.menu_material
+    - tit05: h2.tit05の一覧（文書順）
+    - h3 / h4: (見出しテキスト, 要素) の一覧（文書順）
+    見出しキーワード → 見出し要素の検索結果はキャッシュする
+    """
+
+    TAGS = ["span", "img", "ul", "h2", "h3", "h4"]
+
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+        self.title_span = None
+        self.main_image = None
+        self.material_ul = None
+        self.tit05 = []
+        self.h3 = []
+        self.h4 = []
+        self._headers = {}
+
+        for tag in soup.find_all(self.TAGS):
+            name = tag.name
+            if name == "span":
+                if self.title_span is None and _has_class(tag, "name"):
+                    self.title_span = tag
+            elif name == "img":
+                if (
+                    self.main_image is None
+                    and _has_class(tag, "resp_img")
+                    and tag.find_parent("div", class_="menu_main") is not None
+                ):
+                    self.main_image = tag
+            elif name == "ul":
+                if self.material_ul is None and _has_class(tag, "menu_material"):
+                    self.material_ul = tag
+            elif name == "h2":
+                if _has_class(tag, "tit05"):
+                    self.tit05.append(tag)
+            elif name == "h3":
+                self.h3.append((tag.get_text(), tag))
+            else:
+                self.h4.append((tag.get_text(), tag))
+
+    def section_header(self, keyword: str):
+        """keywordを含む最初のh3（なければh4）を返す"""
+        if keyword not in self._headers:
+            header = None
+            for headings in (self.h3, self.h4):
+                for text, tag in headings:
+                    if keyword in text:
+                        header = tag
+                        break
+                if header is not None:
+                    break
+            self._headers[keyword] = header
+        return self._headers[keyword]
+
+    def tit05_header(self, keyword: str):
+        """
+        keywordを含むh2.tit05を返す
+        テキストが単一の文字列ノードの見出しを優先し、なければ子要素を含むテキスト全体で探す
+        """
+        for h in self.tit05:
+            if h.string and keyword in h.string:
+                return h
+        for h in self.tit05:
+            if h.get_text(strip=True) and keyword in h.get_text():
+                return h
+        return None
+
+
+def as_sections(doc) -> PageSections:
+    """BeautifulSoupまたはPageSectionsを受け取り、PageSectionsを返す"""
+    if isinstance(doc, PageSections):
+        return doc
+    return PageSections(doc)
+
+
+# ===== 必要なセクションだけを読む逐次パース =====
+def _classes(el) -> list:
+    return (el.get("class") or "").split()
+
+
+def _is_element(node) -> bool:
+    # コメント・処理命令はtagが文字列でない
+    return isinstance(node.tag, str)
+
+
+def _text(el) -> str:
+    """BeautifulSoupのget_text()と同じく、コメントを除いた子孫のテキストを連結する"""
+    parts = [el.text or ""]
+    for child in el:
+        if _is_element(child):
+            parts.append(_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def _string(el):
+    """BeautifulSoupの.stringと同じ（子が1つだけならその文字列、それ以外はNone）"""
+    children = [c for c in el if _is_element(c)]
+    if len(el) == 0:
+        return el.text
+    if len(el) == 1 and children and not el.text and not el[0].tail:
+        return _string(el[0])
+    return None
+
+
+class _SectionScan:
+    """
+    見出しから始まる兄弟要素の走査（get_section_clean / parse_cooking_methodと同じ範囲）が
+    確定したかを判定する
+    - 見出しがliの中にある: そのliが閉じたら確定
+    - それ以外: 止めるタグの兄弟要素が現れるか、目的の兄弟要素か親要素が閉じたら確定
+    """
+
+    def __init__(self, header, stop_tags, target_class=None):
+        self.header = header
+        self.parent = header.getparent()
+        self.li = next((a for a in header.iterancestors() if a.tag == "li"), None)
+        self.stop_tags = stop_tags
+        self.target_class = target_class
+        self._after_header = False
+        self.done = False
+
+    def _is_following_sibling(self, el) -> bool:
+        return el.getparent() is self.parent and el is not self.header
+
+    def on_start(self, el):
+        if self.li is None and self._is_following_sibling(el) and el.tag in self.stop_tags:
+            self.done = True
+
+    def on_end(self, el):
+        if self.li is not None:
+            self.done = el is self.li
+        elif el is self.parent:
+            self.done = True
+        elif (
+            self.target_class
+            and self._is_following_sibling(el)
+            and el.tag == "ul"
+            and self.target_class in _classes(el)
+        ):
+            self.done = True
+
+
+class RequiredSections:
+    """
+    lxmlの逐次パーサーのイベントを見て、詳細ページの抽出に必要な要素がすべて
+    閉じたかを判定する（PageSectionsと同じ「最初に一致した要素」を追う）
+    - span.name / div.menu_main内のimg.resp_img / ul.menu_material
+    - keywordsを含む最初のh3のセクション（h3が見つからない場合はh4を探すため最後まで読む）
+    - .stringがtit05_keywordを含む最初のh2.tit05と、その後のul.recipe
+    見つからない要素がある場合は打ち切らない（全体をパースした場合と結果を変えない）
+    """
+
+    def __init__(self, keywords, tit05_keyword):
+        self.keywords = list(keywords)
+        self.tit05_keyword = tit05_keyword
+        self.title = None
+        self.title_done = False
+        self.image_done = False
+        self.material = None
+        self.material_done = False
+        self.scans = {}
+        self.recipe = None
+
+    @property
+    def done(self) -> bool:
+        return (
+            self.title_done
+            and self.image_done
+            and self.material_done
+            and self.recipe is not None
+            and self.recipe.done
+            and all(k in self.scans and self.scans[k].done for k in self.keywords)
+        )
+
+    def _scans(self):
+        if self.recipe is not None:
+            yield self.recipe
+        yield from self.scans.values()
+
+    def on_start(self, el):
+        tag = el.tag
+        if tag == "span" and self.title is None and "name" in _classes(el):
+            self.title = el
+        elif tag == "img" and not self.image_done and "resp_img" in _classes(el):
+            self.image_done = any(
+                a.tag == "div" and "menu_main" in _classes(a) for a in el.iterancestors()
+            )
+        elif tag == "ul" and self.material is None and "menu_material" in _classes(el):
+            self.material = el
+        for scan in self._scans():
+            if not scan.done:
+                scan.on_start(el)
+
+    def on_end(self, el):
+        tag = el.tag
+        if el is self.title:
+            self.title_done = True
+        elif el is self.material:
+            self.material_done = True
+        elif tag == "h3":
+            text = _text(el)
+            for keyword in self.keywords:
+                if keyword not in self.scans and keyword in text:
+                    self.scans[keyword] = _SectionScan(el, ("h3", "h4"))
+        elif tag == "h2" and self.recipe is None and "tit05" in _classes(el):
+            string = _string(el)
+            if string and self.tit05_keyword in string:
+                self.recipe = _SectionScan(el, ("h2", "h3", "h4"), target_class="recipe")
+        for scan in self._scans():
+            if not scan.done:
+                scan.on_end(el)
+
+
+def read_required(chunks, keywords, tit05_keyword):
+    """
+    HTMLの文字列チャンクを順にlxmlの逐次パーサーへ流し、抽出に必要なセクションが
+    すべて閉じた時点で読むのをやめる（残りのデコードとBeautifulSoupでの木の構築を省く）
+    返り値: (読み込んだ部分のHTML, 途中で打ち切ったか)
+    BeautifulSoupのパーサーがlxmlでない場合は木の形が一致しないので打ち切らない
+    """
+    if etree is None or _backend() != "lxml":
+        return "".join(chunks), False
+
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    tracker = RequiredSections(keywords, tit05_keyword)
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        parser.feed(chunk)
+        for event, el in parser.read_events():
+            if not _is_element(el):
+                continue
+            if event == "start":
+                tracker.on_start(el)
+            else:
+                tracker.on_end(el)
+        if tracker.done:
+            return "".join(parts), True
+    return "".join(parts), False
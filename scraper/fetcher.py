@@ -0,0 +1,378 @@
+# fetcher.py
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import HttpCache
+from config import (
+    FETCH_BACKOFF_BASE,
+    FETCH_BACKOFF_MAX,
+    FETCH_BREAKER_COOLDOWN,
+    FETCH_BREAKER_THRESHOLD,
+    FETCH_BURST,
+    FETCH_CONCURRENCY,
+    FETCH_LATENCY_TARGET,
+    FETCH_MAX_CONCURRENCY,
+    FETCH_MIN_CONCURRENCY,
+    FETCH_RATE_PER_SEC,
+    FETCH_RETRIES,
+    FETCH_TIMEOUT,
+    HEADERS,
+    HTTP_CACHE_PATH,
+)
+import metrics
+
+# 再試行するステータス（サーバーが混雑・一時的に応答できない）
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """サーキットブレーカーが開いているホストへのリクエスト（送信せずに失敗させる）"""
+
+
+class TokenBucket:
+    """
+    ホスト単位のトークンバケット式レートリミッター
+    - rate: 1秒あたりに補充されるトークン数
+    - capacity: バケットの最大容量（連続送信できる数）
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得できるまで待機する"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after_seconds(value):
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を待機秒数にする（解釈できなければNone）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt: int, base: float = FETCH_BACKOFF_BASE, cap: float = FETCH_BACKOFF_MAX):
+    """指数バックオフ（full jitter）: 0〜min(cap, base * 2^attempt) の一様乱数"""
+    return random.uniform(0, min(cap, base * (2**attempt)))
+
+
+class HostController:
+    """
+    ホストごとの同時リクエスト数の制御（AIMD）とサーキットブレーカー
+    - 送信枠を使い切っている間に応答がlatency_target秒以内で成功したら、limit件の成功ごとに上限を1増やす
+      （枠が余っている間は増やさない。アイドル後のバーストがそのまま429にならないように）
+    - 429 / 5xx / タイムアウトで上限を半分にする（同時に返ってきた失敗で何度も半減しないよう、
+      前回の減少から直近の応答時間が経つまでは1回とみなす）
+    - Retry-Afterを受け取ったら、その時刻までホストへの送信を止める
+    - 連続してbreaker_threshold回失敗したら、breaker_cooldown秒はリクエストを送らずに失敗させ、
+      その後は試しに1件だけ送って、成功すれば再開する
+    """
+
+    def __init__(
+        self,
+        host: str,
+        initial: int = FETCH_CONCURRENCY,
+        minimum: int = FETCH_MIN_CONCURRENCY,
+        maximum: int = FETCH_MAX_CONCURRENCY,
+        latency_target: float = FETCH_LATENCY_TARGET,
+        breaker_threshold: int = FETCH_BREAKER_THRESHOLD,
+        breaker_cooldown: float = FETCH_BREAKER_COOLDOWN,
+    ):
+        self.host = host
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.latency_target = latency_target
+        self.breaker_threshold = max(1, breaker_threshold)
+        self.breaker_cooldown = breaker_cooldown
+        self.active = 0
+        self.latency = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self._probing = False
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """送信枠を1つ取得する（ブレーカーが開いていればCircuitOpenError）"""
+        with self._cond:
+            probe = False
+            while True:
+                now = time.monotonic()
+                if self.failures >= self.breaker_threshold and not probe:
+                    if now < self.open_until or self._probing:
+                        raise CircuitOpenError(f"{self.host}: サーキットブレーカーが開いています")
+                    # 待機時間が過ぎたら試しに1件だけ送る（half-open）
+                    self._probing = probe = True
+                if now < self._blocked_until:
+                    self._cond.wait(self._blocked_until - now)
+                    continue
+                if self.active < int(self.limit):
+                    self.active += 1
+                    return
+                self._cond.wait()
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def block(self, seconds: float):
+        """Retry-Afterの間、このホストへの送信を止める"""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def on_success(self, elapsed: float):
+        with self._cond:
+            self.latency = elapsed if not self.latency else 0.8 * self.latency + 0.2 * elapsed
+            self.failures = 0
+            self._probing = False
+            # activeにはこの応答の分も含まれる（release()はこの後）
+            saturated = self.active >= int(self.limit)
+            if saturated and elapsed <= self.latency_target and self.limit < self.maximum:
+                previous = int(self.limit)
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                if int(self.limit) != previous:
+                    metrics.inc("http_concurrency_changes_total", direction="up")
+                    self._cond.notify_all()
+
+    def on_failure(self, congestion: bool):
+        """失敗を記録する。congestion=Trueなら同時リクエスト数を半分にする"""
+        with self._cond:
+            now = time.monotonic()
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.breaker_threshold:
+                if now >= self.open_until:
+                    metrics.inc("http_breaker_opened_total")
+                    metrics.log_event(
+                        "http_breaker_open",
+                        f"  🚧 {self.host}: {self.failures}回連続で失敗したため"
+                        f"{self.breaker_cooldown:.0f}秒停止します",
+                        host=self.host,
+                        failures=self.failures,
+                    )
+                self.open_until = now + self.breaker_cooldown
+            if congestion and now - self._last_decrease >= max(self.latency, 0.1):
+                self._last_decrease = now
+                self.limit = max(self.minimum, self.limit / 2)
+                metrics.inc("http_concurrency_changes_total", direction="down")
+                metrics.log_event("http_concurrency", host=self.host, limit=int(self.limit))
+
+
+class Fetcher:
+    """
+    接続を使い回すHTTP取得エンジン
+    - requests.Sessionでkeep-alive（TLS接続を再利用）
+    - gzip/deflateで転送量を削減
+    - ホストごとの同時リクエスト数はHostControllerが応答に合わせて増減（max_concurrencyまで）し、
+      実際のリクエストレートはこれで決まる（429 / 5xxが返るまで増やしてサイトが許容するレートを探る）
+    - ホストごとのトークンバケットは安全のための上限（想定より十分高いレート。AIMDの探索を妨げない）
+      （bucket_factory(host)を渡すと、acquire()を持つ別のリミッターを使う。ワーカー間で共有する場合など）
+    - 429 / 5xx / タイムアウト・接続エラーはバックオフしながら最大retries回再試行
+    - cache_pathを指定するとETag / Last-Modifiedで条件付き再取得（304なら保存済み本文を返す）
+    - archive（archive.ResponseArchive）を指定すると、受け取ったレスポンスをすべて記録する
+    """
+
+    def __init__(
+        self,
+        concurrency: int = FETCH_CONCURRENCY,
+        rate_per_sec: float = FETCH_RATE_PER_SEC,
+        burst: int = FETCH_BURST,
+        timeout: float = FETCH_TIMEOUT,
+        headers: dict = None,
+        cache_path: str = HTTP_CACHE_PATH,
+        max_concurrency: int = FETCH_MAX_CONCURRENCY,
+        retries: int = FETCH_RETRIES,
+        bucket_factory=None,
+        archive=None,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.max_concurrency = max(self.concurrency, max_concurrency)
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.bucket_factory = bucket_factory
+        self.archive = archive
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or HEADERS)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        # 同時実行数の上限ぶんの接続をプールしておく
+        adapter = HTTPAdapter(
+            pool_connections=self.max_concurrency,
+            pool_maxsize=self.max_concurrency,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.cache = HttpCache(cache_path) if cache_path else None
+
+        self._buckets = {}
+        self._controllers = {}
+        self._buckets_lock = threading.Lock()
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                if self.bucket_factory is not None:
+                    bucket = self.bucket_factory(host)
+                else:
+                    bucket = TokenBucket(self.rate_per_sec, self.burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def controller(self, url: str) -> HostController:
+        host = urlsplit(url).netloc
+        with self._buckets_lock:
+            controller = self._controllers.get(host)
+            if controller is None:
+                controller = HostController(
+                    host, initial=self.concurrency, maximum=self.max_concurrency
+                )
+                self._controllers[host] = controller
+            return controller
+
+    def get(self, url: str, use_cache: bool = True, record: bool = True) -> requests.Response:
+        """
+        レート制限に従ってGETし、レスポンスを返す
+        再試行しても429 / 5xxのままならそのレスポンスを返す（呼び出し側でraise_for_status）
+        use_cache=FalseではHTTPキャッシュを使わない（画像など、呼び出し側で保存するもの）
+        record=Falseではarchiveに記録しない
+        """
+        cache = self.cache if use_cache else None
+        archive = self.archive if record else None
+        entry = cache.get(url) if cache else None
+        if entry and archive and not archive.has_body(url):
+            # 304では本文が届かないので、アーカイブに本文がないURLは条件付きにしない
+            entry = None
+        headers = entry.conditional_headers() if entry else None
+        controller = self.controller(url)
+
+        for attempt in range(self.retries + 1):
+            controller.acquire()
+            try:
+                self._bucket(url).acquire()
+                started = time.perf_counter()
+                res = self.session.get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                metrics.inc("http_errors_total", error=type(e).__name__)
+                metrics.log_event("http_error", url=url, error=repr(e), attempt=attempt)
+                controller.on_failure(congestion=isinstance(e, requests.Timeout))
+                retryable = isinstance(e, (requests.Timeout, requests.ConnectionError))
+                if not retryable or attempt == self.retries:
+                    raise
+                delay = backoff_seconds(attempt)
+                reason = type(e).__name__
+            else:
+                elapsed = time.perf_counter() - started
+                self._record(url, res, elapsed)
+                if archive:
+                    archive.record(url, res)
+                if res.status_code not in RETRY_STATUSES:
+                    controller.on_success(elapsed)
+                    break
+                controller.on_failure(congestion=True)
+                retry_after = retry_after_seconds(res.headers.get("Retry-After"))
+                if retry_after is not None:
+                    delay = min(retry_after, FETCH_BACKOFF_MAX)
+                    # 同じホストへの他のリクエストも待たせる
+                    controller.block(delay)
+                else:
+                    delay = backoff_seconds(attempt)
+                if attempt == self.retries:
+                    break
+                reason = str(res.status_code)
+            finally:
+                controller.release()
+            metrics.inc("http_retries_total", reason=reason)
+            metrics.log_event(
+                "http_retry",
+                f"  🔁 {url}: {reason} のため{delay:.1f}秒後に再試行（{attempt + 1}/{self.retries}）",
+                url=url,
+                reason=reason,
+                delay=round(delay, 3),
+                attempt=attempt + 1,
+            )
+            time.sleep(delay)
+
+        if cache:
+            if res.status_code == 304 and entry:
+                return entry.to_response()
+            if res.status_code == 200:
+                cache.put(url, res)
+        return res
+
+    @staticmethod
+    def _record(url: str, res: requests.Response, elapsed: float):
+        status = str(res.status_code)
+        size = len(res.content)
+        metrics.observe("http_request_seconds", elapsed, status=status)
+        metrics.inc("http_responses_total", status=status)
+        metrics.inc("http_response_bytes_total", size)
+        metrics.log_event(
+            "http_fetch",
+            f"[GET] {url} {res.status_code}（{size / 1024:.1f}KB, {elapsed * 1000:.0f}ms）",
+            url=url,
+            status=res.status_code,
+            bytes=size,
+            seconds=round(elapsed, 4),
+        )
+
+    def map(self, func, items):
+        """
+        itemsの各要素にfuncを最大max_concurrency並列で適用する
+        （実際の同時リクエスト数はホストごとのHostControllerが決める）
+        結果は (item, result, error) のタプルで完了順に返す
+        """
+        items = list(items)
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as ex:
+            futures = {ex.submit(func, item): item for item in items}
+            for fut in as_completed(futures):
+                item = futures[fut]
+                try:
+                    yield item, fut.result(), None
+                except Exception as e:
+                    yield item, None, e
+
+    def close(self):
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
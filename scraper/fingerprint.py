@@ -0,0 +1,17 @@
+# fingerprint.py
+import hashlib
+import json
+
+# ハッシュ計算から除外するフィールド（DB側で管理する値、保存後の処理で付ける値）
+# categoryはページの内容ではなくリスト収集で付ける値（クロールモードでは分からない場合がある）
+VOLATILE_FIELDS = {"_id", "scrapeCount", "createdAt", "updatedAt", "contentHash", "image", "category"}
+
+
+def content_hash(record: dict) -> str:
+    """
+    抽出したレシピレコードの内容ハッシュ（SHA-256）
+    キー順に依存しないよう正規化したJSONから計算する
+    """
+    payload = {k: v for k, v in record.items() if k not in VOLATILE_FIELDS}
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
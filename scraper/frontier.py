@@ -0,0 +1,157 @@
+# frontier.py
+import posixpath
+from collections import deque
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+from config import CRAWL_MAX_INDEX_PAGES, CRAWL_SCOPE_PREFIX
+from extract import make_soup
+from listing import DETAIL_URL_RE
+import metrics
+
+# クロール対象外の拡張子（画像・PDFなど）
+SKIP_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg",
+    ".pdf", ".zip", ".xls", ".xlsx", ".doc", ".docx", ".css", ".js",
+)
+
+
+def canonicalize(url: str) -> str:
+    """
+    重複判定用にURLを正規化する
+    - スキーム・ホストを小文字化、既定ポートとフラグメントを除去
+    - パスの ./ ../ を解決し、末尾のindex.htmlはディレクトリと同一視
+    - クエリパラメータはキー順に並べ替え
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not (
+        (scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)
+    ):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    trailing = path.endswith("/")
+    path = posixpath.normpath(path)
+    if path == ".":
+        path = "/"
+    if trailing and not path.endswith("/"):
+        path += "/"
+    if path.endswith("/index.html"):
+        path = path[: -len("index.html")]
+
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def is_detail_url(url: str) -> bool:
+    return DETAIL_URL_RE.fullmatch(url) is not None
+
+
+class UrlFrontier:
+    """
+    幅優先のURLフロンティア（正規化済みURLのメモリ内重複排除つき）
+    一度追加したURLは二度とキューに入らない
+    """
+
+    def __init__(self):
+        self._queue = deque()
+        self._seen = set()
+
+    def add(self, url: str, meta=None) -> bool:
+        url = canonicalize(url)
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        self._queue.append((url, meta))
+        return True
+
+    def seen(self, url: str) -> bool:
+        return canonicalize(url) in self._seen
+
+    def pop(self):
+        return self._queue.popleft()
+
+    def __len__(self):
+        return len(self._queue)
+
+
+class CatalogCrawler:
+    """
+    カテゴリーページを起点に、そこからリンクされた一覧ページ（都道府県別・地域別など）を
+    たどって、到達できるすべての詳細ページURLを列挙する
+    - 一覧ページはフロンティアで重複排除しながら幅優先で取得
+    - 詳細ページは取得せず、(url, category) として呼び出し側に流す
+    - カテゴリーページで見つかった詳細ページにはそのカテゴリー名を付ける
+      （それ以外の一覧ページでのみ見つかった場合はNone）
+    """
+
+    def __init__(
+        self,
+        fetch_html,
+        scope_prefix: str = CRAWL_SCOPE_PREFIX,
+        max_index_pages: int = CRAWL_MAX_INDEX_PAGES,
+    ):
+        self.fetch_html = fetch_html
+        self.scope_prefix = scope_prefix
+        self.max_index_pages = max_index_pages
+        self.index_frontier = UrlFrontier()
+        self.details = set()
+        self.index_pages = 0
+
+    def in_scope(self, url: str, seed_host: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or parts.netloc != seed_host:
+            return False
+        if not parts.path.startswith(self.scope_prefix):
+            return False
+        return not parts.path.lower().endswith(SKIP_EXTENSIONS)
+
+    def iter_detail_urls(self, seeds: list):
+        """
+        seeds: カテゴリーページURLのリスト
+        詳細ページURLを (url, category) で初出順に返すジェネレーター
+        """
+        for seed in seeds:
+            category = seed.split("/")[-1].replace(".html", "")
+            self.index_frontier.add(seed, category)
+
+        while self.index_frontier and self.index_pages < self.max_index_pages:
+            page_url, category = self.index_frontier.pop()
+            try:
+                html = self.fetch_html(page_url)
+            except Exception as e:
+                metrics.log_event(
+                    "crawl_index_error",
+                    f"  ⚠️  一覧ページ取得失敗: {page_url}: {e}",
+                    url=page_url,
+                    error=repr(e),
+                )
+                continue
+            self.index_pages += 1
+            host = urlsplit(page_url).netloc
+
+            new_details = 0
+            for a in make_soup(html).find_all("a", href=True):
+                url = canonicalize(urljoin(page_url, a["href"]))
+                if not self.in_scope(url, host):
+                    continue
+                if is_detail_url(url):
+                    if url not in self.details:
+                        self.details.add(url)
+                        new_details += 1
+                        yield url, category
+                else:
+                    # カテゴリーページ以外の一覧ページからはカテゴリーを引き継がない
+                    self.index_frontier.add(url, None)
+
+            metrics.log_event(
+                "crawl_index_page",
+                f"  🕸  一覧 {self.index_pages}: {page_url} +{new_details}件"
+                f"（詳細 累計{len(self.details)}件 / 未訪問一覧 {len(self.index_frontier)}件）",
+                url=page_url,
+                index_pages=self.index_pages,
+                new=new_details,
+                details=len(self.details),
+                frontier=len(self.index_frontier),
+            )
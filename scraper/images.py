@@ -0,0 +1,335 @@
+# images.py
+import argparse
+import asyncio
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pymongo import UpdateOne
+
+from config import (
+    HEADERS,
+    IMAGE_CONCURRENCY,
+    IMAGE_DIR,
+    IMAGE_ENABLED,
+    IMAGE_PROCESSES,
+    IMAGE_QUALITY,
+    IMAGE_WIDTHS,
+)
+from fetcher import Fetcher
+from storage import close_clients, get_async_collection
+import metrics
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillowがなければ画像ステージは動かさない（main_imageのURLだけを保存）
+    Image = None
+
+# 保存形式 → 拡張子
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+# サムネイルの形式: (Pillowの形式名, 拡張子, レコードのキー)
+THUMBNAIL_FORMATS = (("WEBP", "webp", "webp"), ("JPEG", "jpg", "jpeg"))
+
+
+def original_path(digest: str, ext: str) -> str:
+    """元画像の保存先（IMAGE_DIRからの相対パス、先頭2文字でディレクトリを分ける）"""
+    return f"originals/{digest[:2]}/{digest}.{ext}"
+
+
+def thumbnail_path(digest: str, width: int, ext: str) -> str:
+    return f"thumbs/{digest[:2]}/{digest}_{width}.{ext}"
+
+
+def target_widths(width: int, widths) -> list:
+    """元画像の幅を超えないサムネイル幅（元画像が小さければ元の幅で1つだけ）"""
+    result = sorted(w for w in set(widths) if 0 < w < width)
+    return result or [width]
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    # 書きかけのファイルを配信しないように置き換える
+    os.replace(tmp, path)
+
+
+def render_image(content: bytes, digest: str, image_dir: str, widths, quality: int):
+    """
+    元画像とサムネイルをimage_dirに保存する（画像用プロセスプールで実行）
+    すでにあるファイル（同じ内容の画像を処理済み）は書き直さない
+    返り値: (寸法・パスのdict, ワーカー内で記録したメトリクス)
+    """
+    with metrics.capture() as ops:
+        with metrics.timer("image_render_seconds"):
+            image = Image.open(io.BytesIO(content))
+            image_format = (image.format or "").lower()
+            ext = EXTENSIONS.get(image.format, image_format or "bin")
+            original = original_path(digest, ext)
+            if not os.path.exists(os.path.join(image_dir, original)):
+                _write_atomic(os.path.join(image_dir, original), content)
+
+            # EXIFの回転を反映した向きで寸法・サムネイルを作る
+            image = ImageOps.exif_transpose(image)
+            width, height = image.size
+            thumbnails = []
+            for w in target_widths(width, widths):
+                h = max(1, round(height * w / width))
+                thumb = {"width": w, "height": h}
+                resized = None
+                for fmt, thumb_ext, key in THUMBNAIL_FORMATS:
+                    path = thumbnail_path(digest, w, thumb_ext)
+                    full = os.path.join(image_dir, path)
+                    if not os.path.exists(full):
+                        if resized is None:
+                            resized = image.resize((w, h), Image.LANCZOS)
+                        frame = resized
+                        if fmt == "JPEG" and frame.mode not in ("RGB", "L"):
+                            frame = frame.convert("RGB")
+                        buf = io.BytesIO()
+                        frame.save(buf, fmt, quality=quality)
+                        _write_atomic(full, buf.getvalue())
+                        metrics.inc("image_thumbnails_total", format=key)
+                    thumb[key] = path
+                thumbnails.append(thumb)
+    return {
+        "sha256": digest,
+        "format": image_format,
+        "width": width,
+        "height": height,
+        "bytes": len(content),
+        "path": original,
+        "thumbnails": thumbnails,
+    }, ops
+
+
+def read_original(image_dir: str, digest: str):
+    """保存済みの元画像の内容（なければNone）"""
+    directory = os.path.join(image_dir, os.path.dirname(original_path(digest, "")))
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return None
+    for name in names:
+        # 書きかけの一時ファイル（<ファイル名>.<pid>.tmp）は除く
+        if name.startswith(f"{digest}.") and not name.endswith(".tmp"):
+            with open(os.path.join(directory, name), "rb") as f:
+                return f.read()
+    return None
+
+
+def _files_exist(image: dict, image_dir: str) -> bool:
+    paths = [image.get("path")]
+    for thumb in image.get("thumbnails") or []:
+        paths.extend(thumb.get(key) for _, _, key in THUMBNAIL_FORMATS)
+    return all(p and os.path.exists(os.path.join(image_dir, p)) for p in paths)
+
+
+class ImageStage:
+    """
+    レシピのメイン画像をダウンロードし、内容のSHA-256で保存してサムネイルを作る
+    - ダウンロードは最大concurrency件まで並行（ホストごとのレート制限はFetcherと共有）
+    - 同じ画像（同じSHA-256）は1回だけ保存し、サムネイルも作り直さない
+    - レコードに保存済みの画像と同じURLで、ファイルも残っていればダウンロードしない
+    - サムネイル作成（デコード・縮小・エンコード）はプロセスプールで実行
+    結果はレシピのimageフィールドに書き込む
+    """
+
+    def __init__(
+        self,
+        fetcher: Fetcher = None,
+        image_dir: str = IMAGE_DIR,
+        concurrency: int = IMAGE_CONCURRENCY,
+        processes: int = IMAGE_PROCESSES,
+        widths=IMAGE_WIDTHS,
+        quality: int = IMAGE_QUALITY,
+    ):
+        self._own_fetcher = fetcher is None
+        self.fetcher = fetcher or Fetcher(headers=HEADERS, cache_path="")
+        self.image_dir = image_dir
+        self.widths = list(widths)
+        self.quality = quality
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._executor = ProcessPoolExecutor(max_workers=processes) if processes > 0 else None
+        # 処理中のURL・画像（複数のレシピが同じ画像を使う場合に1回だけ処理する）。完了したら消す
+        self._inflight = {}
+        self._rendering = {}
+        # 処理済みのURL → 画像のSHA-256（2回目以降は保存済みの元画像を使い、ダウンロードしない）
+        self._digests = {}
+
+    async def _render(self, content: bytes, digest: str):
+        args = (content, digest, self.image_dir, self.widths, self.quality)
+        if self._executor is None:
+            image, ops = await asyncio.to_thread(render_image, *args)
+        else:
+            loop = asyncio.get_running_loop()
+            image, ops = await loop.run_in_executor(self._executor, render_image, *args)
+        metrics.METRICS.merge(ops)
+        return image
+
+    @staticmethod
+    def _share(pending: dict, key, make):
+        """同じkeyの処理を1つにまとめる（完了したらpendingから消すので、結果は持ち続けない）"""
+        future = pending.get(key)
+        if future is None:
+            future = pending[key] = asyncio.ensure_future(make())
+            future.add_done_callback(lambda _: pending.pop(key, None))
+        return future
+
+    async def _process_url(self, url: str):
+        digest = self._digests.get(url)
+        content = None
+        if digest is not None:
+            content = await asyncio.to_thread(read_original, self.image_dir, digest)
+        if content is None:
+            async with self._semaphore:
+                # 画像は本文をIMAGE_DIRに保存するので、HTTPキャッシュ・レスポンスアーカイブには入れない
+                res = await asyncio.to_thread(self.fetcher.get, url, False, False)
+                res.raise_for_status()
+            content = res.content
+            digest = hashlib.sha256(content).hexdigest()
+        # URLが違っても内容が同じ画像は同時に1回だけ処理する（作成済みのサムネイルは書き直さない）
+        image = await self._share(self._rendering, digest, lambda: self._render(content, digest))
+        self._digests[url] = digest
+        return {"url": url, **image, "fetchedAt": time.time()}
+
+    async def _image_for(self, url: str, stored: dict):
+        """
+        画像を保存してレシピに書き込むimageを返す
+        保存済みの画像がそのまま使える場合と、失敗した場合はNone（書き込まない）
+        """
+        if stored and stored.get("url") == url and _files_exist(stored, self.image_dir):
+            metrics.inc("images_total", result="unchanged")
+            return None
+        try:
+            image = await self._share(self._inflight, url, lambda: self._process_url(url))
+        except Exception as e:
+            metrics.inc("images_total", result="failed")
+            metrics.log_event(
+                "image_error", f"  ⚠️  画像の保存に失敗: {url}: {e}", url=url, error=repr(e)
+            )
+            return None
+        metrics.inc("images_total", result="stored")
+        return image
+
+    async def process(self, rows: list) -> int:
+        """rowsのメイン画像を処理してレシピに書き込む。返り値: 書き込んだ件数"""
+        rows = [r for r in rows if r.get("main_image")]
+        if not rows:
+            return 0
+        col = get_async_collection()
+        stored = {}
+        async for d in col.find(
+            {"detailUrl": {"$in": [r["detailUrl"] for r in rows]}}, {"detailUrl": 1, "image": 1}
+        ):
+            stored[d["detailUrl"]] = d.get("image")
+
+        images = await asyncio.gather(
+            *(self._image_for(r["main_image"], stored.get(r["detailUrl"])) for r in rows)
+        )
+        ops = [
+            UpdateOne({"detailUrl": r["detailUrl"]}, {"$set": {"image": image}})
+            for r, image in zip(rows, images)
+            if image is not None
+        ]
+        if ops:
+            await col.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._own_fetcher:
+            self.fetcher.close()
+
+
+class ImageSink:
+    """
+    パイプラインのsink: 保存したレシピの画像処理をバックグラウンドで進める
+    （画像のダウンロードを待たずに次のマイクロバッチへ進み、終了時に残りを待つ）
+    - 処理中のバッチはmax_batches個まで。画像の処理が遅れている間はwriteが待つ
+      （遅れた分のバッチがメモリにたまらないようにする）
+    MongoSinkの後に置くこと（書き込み先のレシピが存在している必要がある）
+    """
+
+    def __init__(
+        self, fetcher: Fetcher = None, processes: int = IMAGE_PROCESSES, max_batches: int = 2
+    ):
+        self.stage = None
+        if Image is not None and IMAGE_ENABLED:
+            self.stage = ImageStage(fetcher, processes=processes)
+        self._slots = asyncio.Semaphore(max(1, max_batches))
+        self._tasks = set()
+        self.updated = 0
+
+    async def write(self, rows: list):
+        if self.stage is None:
+            return
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(list(rows)))
+        self._tasks.add(task)
+        # 完了したタスクは手放す
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, rows: list):
+        try:
+            updated = await self.stage.process(rows)
+            self.updated += updated
+        except Exception as e:
+            metrics.log_event("image_error", f"  ⚠️  画像ステージでエラー: {e}", error=repr(e))
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        if self.stage is None:
+            return
+        try:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self.stage.close()
+        if self.updated:
+            metrics.log_event("images_saved", f"🖼  画像を保存: {self.updated}件", updated=self.updated)
+
+
+async def process_all(batch_size: int = 100) -> int:
+    """imageが未作成・URLが変わったレシピをすべて処理する（既存レシピへの反映用）"""
+    stage = ImageStage()
+    updated = 0
+    try:
+        batch = []
+        cursor = get_async_collection().find(
+            {"main_image": {"$nin": [None, ""]}}, {"detailUrl": 1, "main_image": 1}
+        )
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                updated += await stage.process(batch)
+                batch = []
+        if batch:
+            updated += await stage.process(batch)
+    finally:
+        stage.close()
+    metrics.log_event("images_saved", f"🖼  画像を保存: {updated}件", updated=updated)
+    return updated
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="既存レシピのメイン画像をダウンロードしてサムネイルを作る"
+    )
+    parser.add_argument("--batch-size", type=int, default=100, help="1回に処理するレシピ数")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    if Image is None:
+        raise SystemExit("Pillowがインストールされていません: pip install Pillow")
+    args = parse_args()
+    try:
+        asyncio.run(process_all(batch_size=args.batch_size))
+    finally:
+        close_clients()
@@ -0,0 +1,215 @@
+# ingredient_index.py
+import argparse
+import time
+from collections import Counter
+
+from pymongo import InsertOne, UpdateOne
+
+from config import INGREDIENT_INDEX_COLLECTION, MONGO_BATCH_SIZE
+from storage import TOKENS_FIELD, close_clients, get_collection
+import metrics
+
+# ingredient_indexコレクションの1件（材料トークンごと）:
+#     {
+#         "_id": "ごぼう",                    # 正規化済みの材料トークン
+#         "recipeIds": [ObjectId, ...],      # このトークンを持つレシピの_id（昇順）
+#         "count": 12,                       # len(recipeIds)
+#         "categories": {"rice": 5, ...},    # カテゴリーごとのレシピ数
+#         "recipeCategories": {"<_id>": "rice", ...},  # レシピごとに数えたカテゴリー（差分更新の条件に使う）
+#         "updatedAt": 1700000000.0,
+#     }
+# 複数材料での一致数は、コレクション全体を走査せず指定した材料のエントリ数件から求まる
+
+
+def _entries(postings: dict, now: float):
+    """{トークン: {レシピ_id: カテゴリー}} からエントリのdictを作る"""
+    for token, recipes in postings.items():
+        yield {
+            "_id": token,
+            "recipeIds": sorted(recipes),
+            "count": len(recipes),
+            "categories": dict(Counter(c for c in recipes.values() if c)),
+            "recipeCategories": {str(_id): c for _id, c in recipes.items()},
+            "updatedAt": now,
+        }
+
+
+def _collect(recipes) -> dict:
+    """レシピ（_id / category / ingredientTokens）からポスティングを作る"""
+    postings = {}
+    for doc in recipes:
+        for token in doc.get(TOKENS_FIELD) or ():
+            postings.setdefault(token, {})[doc["_id"]] = doc.get("category") or ""
+    return postings
+
+
+def _diff_ops(changes, now: float):
+    """
+    レシピごとの新旧のトークン・カテゴリーから、ingredient_indexへの更新操作を作る
+    返り値: (なくなったトークンからの削除, 増えたトークンへの追加, 削除したトークン)
+    カテゴリーが変わったレシピは、全トークンで削除してから追加し直す
+    削除は「古いカテゴリーで数えられている」、追加は「まだ含まれていない」を条件にするので、
+    同じ差分を2回適用しても（カテゴリーが変わったレシピでも）件数はずれない
+    """
+    removals = []
+    additions = []
+    removed = set()
+    for change in changes:
+        _id = change["_id"]
+        member = f"recipeCategories.{_id}"
+        old_tokens, old_category = change["old"]
+        new_tokens, new_category = change["new"]
+        recategorized = (old_category or "") != (new_category or "")
+        for token in set(old_tokens):
+            if recategorized or token not in new_tokens:
+                inc = {"count": -1}
+                if old_category:
+                    inc[f"categories.{old_category}"] = -1
+                removals.append(
+                    UpdateOne(
+                        {"_id": token, member: old_category or ""},
+                        {
+                            "$pull": {"recipeIds": _id},
+                            "$unset": {member: ""},
+                            "$inc": inc,
+                            "$set": {"updatedAt": now},
+                        },
+                    )
+                )
+                removed.add(token)
+        for token in set(new_tokens):
+            if recategorized or token not in old_tokens:
+                inc = {"count": 1}
+                if new_category:
+                    inc[f"categories.{new_category}"] = 1
+                additions.append(
+                    UpdateOne(
+                        {"_id": token},
+                        {
+                            "$setOnInsert": {
+                                "recipeIds": [],
+                                "count": 0,
+                                "categories": {},
+                                "recipeCategories": {},
+                            }
+                        },
+                        upsert=True,
+                    )
+                )
+                additions.append(
+                    UpdateOne(
+                        {"_id": token, member: {"$exists": False}},
+                        {
+                            "$push": {"recipeIds": {"$each": [_id], "$sort": 1}},
+                            "$inc": inc,
+                            "$set": {member: new_category or "", "updatedAt": now},
+                        },
+                    )
+                )
+    return removals, additions, removed
+
+
+def _cleanup(index, tokens) -> int:
+    """レシピがなくなったトークンのエントリと、0件になったカテゴリーを消す。返り値: 削除したエントリ数"""
+    deleted = index.delete_many({"_id": {"$in": list(tokens)}, "count": {"$lte": 0}}).deleted_count
+    ops = []
+    for entry in index.find({"_id": {"$in": list(tokens)}}, {"categories": 1}):
+        empty = {f"categories.{c}": "" for c, n in (entry.get("categories") or {}).items() if n <= 0}
+        if empty:
+            ops.append(UpdateOne({"_id": entry["_id"]}, {"$unset": empty}))
+    if ops:
+        index.bulk_write(ops, ordered=False)
+    return deleted
+
+
+def update_postings(changes, batch_size: int = MONGO_BATCH_SIZE) -> dict:
+    """
+    内容・カテゴリーが変わったレシピの分だけingredient_indexを差分更新する（書き込んだバッチごとに呼ぶ）
+    changes: storage.UpsertStats.posting_changes（{"_id", "old": (トークン, カテゴリー), "new": (...)}）
+    - なくなったトークンのエントリからは$pull、増えたトークンのエントリには$pushで追加する
+    - recipesは読み直さないので、よく使われる材料（塩・しょうゆなど）でも更新の量は変わったレシピ数に比例する
+    ingredient_indexがrecipesと食い違った場合は、rebuild()（python ingredient_index.py）で作り直す
+    """
+    changes = list(changes)
+    counts = {"recipes": len(changes), "added": 0, "removed": 0, "deleted": 0}
+    if not changes:
+        return counts
+
+    index = get_collection(INGREDIENT_INDEX_COLLECTION)
+    started = time.monotonic()
+    removals, additions, removed = _diff_ops(changes, time.time())
+    # 削除を先に適用する（カテゴリーが変わったレシピは、削除してから追加し直す）
+    # 追加は「エントリの作成 → $push」の順に依存するのでordered=True
+    for ops, key, ordered in ((removals, "removed", False), (additions, "added", True)):
+        for i in range(0, len(ops), max(1, batch_size)):
+            result = index.bulk_write(ops[i : i + batch_size], ordered=ordered)
+            counts[key] += result.modified_count
+    if removed:
+        counts["deleted"] = _cleanup(index, removed)
+
+    elapsed = time.monotonic() - started
+    metrics.observe("ingredient_index_update_seconds", elapsed)
+    metrics.log_event(
+        "ingredient_index_update",
+        f"🧂 ingredient_index更新: レシピ{counts['recipes']}件分 "
+        f"（追加{counts['added']}件, 削除{counts['removed']}件, エントリ削除{counts['deleted']}件）",
+        **counts,
+        seconds=round(elapsed, 3),
+    )
+    return counts
+
+
+def rebuild(batch_size: int = MONGO_BATCH_SIZE) -> dict:
+    """
+    全レシピを1回走査してingredient_indexを作り直す
+    一時コレクションに書き込んでから置き換えるので、作り直し中も検索できる
+    """
+    started = time.monotonic()
+    recipes = get_collection().find(
+        {TOKENS_FIELD: {"$exists": True}}, {TOKENS_FIELD: 1, "category": 1}
+    )
+    postings = _collect(recipes)
+
+    tmp = get_collection(f"{INGREDIENT_INDEX_COLLECTION}_rebuild")
+    tmp.drop()
+    ops = []
+    for entry in _entries(postings, time.time()):
+        ops.append(InsertOne(entry))
+        if len(ops) >= batch_size:
+            tmp.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        tmp.bulk_write(ops, ordered=False)
+
+    if postings:
+        tmp.rename(INGREDIENT_INDEX_COLLECTION, dropTarget=True)
+    else:
+        get_collection(INGREDIENT_INDEX_COLLECTION).drop()
+
+    elapsed = time.monotonic() - started
+    counts = {"tokens": len(postings)}
+    metrics.log_event(
+        "ingredient_index_rebuild",
+        f"🧂 ingredient_index再構築: {counts['tokens']}件 {elapsed:.1f}秒",
+        **counts,
+        seconds=round(elapsed, 3),
+    )
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="レシピ全件からingredient_index（材料 → レシピIDの一覧）を作り直す"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=MONGO_BATCH_SIZE, help="1回のbulk_writeで送る件数"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        rebuild(batch_size=args.batch_size)
+    finally:
+        close_clients()
@@ -0,0 +1,117 @@
+# ingredient_tokens.py
+import argparse
+import re
+import time
+import unicodedata
+from functools import lru_cache
+
+from config import MONGO_BATCH_SIZE
+from storage import TOKENS_FIELD, backfill_documents, close_clients, get_collection
+import metrics
+
+# 材料の区切り（NFKC正規化後の文字。全角カンマ・半角の読点は正規化で「,」「、」になる）
+SEPARATOR_RE = re.compile(r"[、,・\n]+")
+
+# 括弧で囲まれた分量・補足（例: 米（3合） → 米）。全角括弧はNFKCで半角になる
+BRACKET_RE = re.compile(r"\([^()]*\)|\[[^\[\]]*\]|【[^】]*】|〔[^〕]*〕|<[^<>]*>|〈[^〉]*〉")
+
+# 文字列の途中を含むすべての空白
+SPACE_RE = re.compile(r"\s+")
+
+# カタカナ（ァ〜ヶ）→ ひらがな
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+@lru_cache(maxsize=8192)
+def normalize_ingredient(token: str) -> str:
+    """
+    材料名1つを検索用に正規化する
+    - NFKC（全角英数・半角カナなどをそろえる）+ 英字の小文字化
+    - カタカナをひらがなにそろえる（例: ゴボウ / ごぼう）
+    - 括弧で囲まれた分量・補足を除く
+    - 空白を除く
+    """
+    text = _strip_brackets(unicodedata.normalize("NFKC", token).casefold())
+    text = text.translate(_KATAKANA_TO_HIRAGANA)
+    return SPACE_RE.sub("", text)
+
+
+def _strip_brackets(text: str) -> str:
+    # 入れ子の括弧も外側まで消えるよう、変化しなくなるまで繰り返す
+    previous = None
+    while previous != text:
+        previous = text
+        text = BRACKET_RE.sub("", text)
+    return text
+
+
+def split_ingredients(text: str) -> list:
+    """
+    「、」「,」「・」（と改行）で区切った材料名の一覧（正規化前）
+    括弧内の区切り文字で分割しないよう、括弧は先に除く（例: 米（うるち米、3合））
+    """
+    if not text:
+        return []
+    text = _strip_brackets(unicodedata.normalize("NFKC", text))
+    return [part for part in SEPARATOR_RE.split(text) if part.strip()]
+
+
+def ingredient_tokens(main_ingredients: str, ingredients: list) -> list:
+    """
+    main_ingredientsと材料リストの名前から、重複を除いた検索用トークンを作る（出現順）
+    """
+    names = split_ingredients(main_ingredients)
+    for item in ingredients or []:
+        names.extend(split_ingredients(item.get("name") or ""))
+
+    tokens = []
+    seen = set()
+    for name in names:
+        token = normalize_ingredient(name)
+        if token and token not in seen:
+            seen.add(token)
+            tokens.append(token)
+    return tokens
+
+
+def ensure_index(col):
+    """ingredientTokensのマルチキーインデックス（作成済みなら何もしない）"""
+    col.create_index(TOKENS_FIELD)
+
+
+def backfill(batch_size: int = MONGO_BATCH_SIZE) -> dict:
+    """既存ドキュメントのingredientTokensを現在の正規化で作り直し、インデックスを作成する"""
+    started = time.monotonic()
+    ensure_index(get_collection())
+    counts = backfill_documents(
+        lambda doc: {
+            TOKENS_FIELD: ingredient_tokens(doc.get("main_ingredients"), doc.get("ingredients"))
+        },
+        batch_size,
+    )
+    elapsed = time.monotonic() - started
+    metrics.log_event(
+        "ingredient_tokens_backfill",
+        f"🔤 ingredientTokens更新: {counts['updated']}/{counts['scanned']}件 {elapsed:.1f}秒",
+        **counts,
+        seconds=round(elapsed, 3),
+    )
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="既存レシピのingredientTokensを作り直し、インデックスを作成する"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=MONGO_BATCH_SIZE, help="1回のbulk_writeで送る件数"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        backfill(batch_size=args.batch_size)
+    finally:
+        close_clients()
@@ -0,0 +1,176 @@
+# journal.py
+import json
+import sqlite3
+import threading
+import time
+
+from config import CRAWL_JOURNAL_PATH
+import metrics
+
+# URLの処理状態（この順に進む）
+DISCOVERED = "discovered"
+FETCHED = "fetched"
+PARSED = "parsed"
+STORED = "stored"
+FAILED = "failed"
+
+
+class CrawlJournal:
+    """
+    クロールの進行状況をURL単位で記録するディスク上のジャーナル（SQLite WALモード）
+    dynoが途中で再起動しても、--resumeで未完了のURLだけを処理し直せる
+    - parsedの時点で抽出済みレコードも保存するので、再開時は再取得・再パースが不要
+    - リスト収集（またはクロール）が最後まで終わったかどうかもメタ情報として記録
+    """
+
+    def __init__(self, path: str = CRAWL_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                category TEXT,
+                state TEXT NOT NULL,
+                record TEXT,
+                error TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS urls_state ON urls (state);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _execute(self, sql: str, params=(), many: bool = False):
+        with self._lock:
+            cur = (self._conn.executemany if many else self._conn.execute)(sql, params)
+            self._conn.commit()
+            return cur
+
+    # ===== 実行単位のメタ情報 =====
+    def start(self, mode: str):
+        """新しい実行を開始（前回の記録は破棄）"""
+        self._execute("DELETE FROM urls")
+        self._execute("DELETE FROM meta")
+        self.set_meta("mode", mode)
+        self.set_meta("started_at", str(time.time()))
+
+    def set_meta(self, key: str, value: str):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def mark_listing_done(self):
+        self.set_meta("listing_done", "1")
+
+    def listing_done(self) -> bool:
+        return self.get_meta("listing_done") == "1"
+
+    # ===== URL単位の状態 =====
+    def discover(self, url: str, category=None) -> bool:
+        """URLを記録する。既に記録済みならFalse"""
+        cur = self._execute(
+            "INSERT OR IGNORE INTO urls (url, category, state, updated_at) VALUES (?, ?, ?, ?)",
+            (url, category, DISCOVERED, time.time()),
+        )
+        return cur.rowcount > 0
+
+    def mark(self, url: str, state: str, record: dict = None, error: str = None):
+        if record is not None:
+            self._execute(
+                "UPDATE urls SET state = ?, record = ?, error = NULL, updated_at = ? WHERE url = ?",
+                (state, json.dumps(record, ensure_ascii=False), time.time(), url),
+            )
+        else:
+            self._execute(
+                "UPDATE urls SET state = ?, error = ?, updated_at = ? WHERE url = ?",
+                (state, error, time.time(), url),
+            )
+
+    def mark_stored(self, urls: list):
+        """保存済みのURLをまとめて記録し、保持していたレコードを破棄"""
+        now = time.time()
+        self._execute(
+            "UPDATE urls SET state = ?, record = NULL, updated_at = ? WHERE url = ?",
+            [(STORED, now, url) for url in urls],
+            many=True,
+        )
+
+    def pending(self):
+        """
+        未完了（stored以外）のURLを (url, category, record) で返す
+        recordはparsed状態のものだけ入っている
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, category, record FROM urls WHERE state != ? ORDER BY rowid",
+                (STORED,),
+            ).fetchall()
+        return [(url, category, json.loads(record) if record else None) for url, category, record in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JournalSink:
+    """
+    パイプラインのsink: 書き出し済みのURLをstoredとして記録する（他のsinkの後に置く）
+    store（pipeline.MongoSink）を渡すと、そのバッチで書き込みに失敗した行はstoredにせず
+    failedとして記録する（--resumeで保存し直す）
+    """
+
+    def __init__(self, journal: CrawlJournal, store=None):
+        self.journal = journal
+        self.store = store
+
+    async def write(self, rows: list):
+        failed = self.store.failed if self.store is not None else {}
+        for url, error in failed.items():
+            self.journal.mark(url, FAILED, error=error)
+        self.journal.mark_stored([r["detailUrl"] for r in rows if r["detailUrl"] not in failed])
+
+    async def close(self):
+        pass
+
+
+async def journaled(source, journal: CrawlJournal, resume: bool):
+    """
+    リスト収集ステージをジャーナル経由にする
+    - resume=True: まず前回の未完了URLを流し、リスト収集が完了済みならそれで終わり
+      （未完了だった場合は収集をやり直し、記録済みのURLは飛ばす）
+    - resume=False: ジャーナルを初期化してから収集
+    """
+    if resume:
+        pending = journal.pending()
+        counts = journal.counts()
+        metrics.log_event(
+            "journal_resume",
+            f"  ♻️  前回の未完了URL: {len(pending)}件 {counts}",
+            pending=len(pending),
+            journal=counts,
+        )
+        for url, category, record in pending:
+            yield {"url": url, "category": category, "record": record}, url
+        if journal.listing_done():
+            return
+
+    async for meta, url in source:
+        if journal.discover(url, meta.get("category")):
+            yield meta, url
+    journal.mark_listing_done()
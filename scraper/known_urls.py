@@ -0,0 +1,138 @@
+# known_urls.py
+import hashlib
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from config import KNOWN_URLS_MAX_AGE, KNOWN_URLS_PATH, KNOWN_URLS_SYNC_WINDOW
+from storage import get_collection
+import metrics
+
+
+def url_digest(url: str) -> int:
+    """URLの64bitダイジェスト"""
+    d = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(d, "big")
+
+
+def _signed(n: int) -> int:
+    """SQLiteのINTEGER（符号付き64bit）に収まるよう変換"""
+    return n - (1 << 64) if n >= (1 << 63) else n
+
+
+class KnownUrlIndex:
+    """
+    MongoDBに登録済みのdetailUrlのローカル索引
+    - 実行ごとに1回だけロード（detailUrlと_idのみを射影した1回の走査）
+    - ローカルのスナップショット（SQLite）があれば、_id（ObjectId）の生成時刻が新しい分だけ差分同期
+    - 判定は64bitダイジェストの集合で行う（URL文字列そのものは保持しない）
+    """
+
+    def __init__(self):
+        self._digests = set()
+        # 取り込んだ文書の_idの生成時刻の最大値（UNIX秒）
+        self.high_water = 0.0
+
+    def __len__(self):
+        return len(self._digests)
+
+    def add(self, url: str):
+        self._digests.add(url_digest(url))
+
+    def __contains__(self, url: str) -> bool:
+        return url_digest(url) in self._digests
+
+    def known(self, urls: list) -> set:
+        """urlsのうち登録済みのものを返す（check_existing_recipesと同じ形）"""
+        return {u for u in urls if u in self}
+
+    # ===== MongoDBとの同期 =====
+    def sync(self, collection=None, window: float = KNOWN_URLS_SYNC_WINDOW) -> int:
+        """
+        _idの生成時刻がhigh_waterのwindow秒前より新しい文書を取り込む。返り値は追加件数
+        並行する実行・ワーカーの書き込みは_idの順にコミットされるとは限らないので、
+        前回の最大値より少し前から読み直す（取り込み済みのURLは重複して数えない）
+        """
+        col = collection if collection is not None else get_collection()
+        query = {}
+        if self.high_water:
+            since = datetime.fromtimestamp(max(0.0, self.high_water - window), timezone.utc)
+            query = {"_id": {"$gt": ObjectId.from_datetime(since)}}
+        added = 0
+        for doc in col.find(query, {"_id": 1, "detailUrl": 1}):
+            url = doc.get("detailUrl")
+            if not url:
+                continue
+            before = len(self._digests)
+            self.add(url)
+            added += len(self._digests) - before
+            if isinstance(doc["_id"], ObjectId):
+                self.high_water = max(self.high_water, doc["_id"].generation_time.timestamp())
+        return added
+
+    # ===== ローカルスナップショット =====
+    def save(self, path: str = KNOWN_URLS_PATH):
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS digests (h INTEGER PRIMARY KEY)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)")
+            conn.execute("DELETE FROM digests")
+            conn.executemany(
+                "INSERT INTO digests (h) VALUES (?)", ((_signed(h),) for h in self._digests)
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('high_water', ?), ('saved_at', ?)",
+                (self.high_water, time.time()),
+            )
+        conn.close()
+
+    @classmethod
+    def from_snapshot(cls, path: str = KNOWN_URLS_PATH, max_age: float = KNOWN_URLS_MAX_AGE):
+        """スナップショットを読み込む。存在しないか古すぎる場合はNone"""
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        except sqlite3.OperationalError:
+            return None
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            if time.time() - meta.get("saved_at", 0) > max_age:
+                return None
+            index = cls()
+            index._digests = {h & ((1 << 64) - 1) for (h,) in conn.execute("SELECT h FROM digests")}
+            index.high_water = meta.get("high_water", 0.0)
+            return index
+        except sqlite3.DatabaseError:
+            return None
+        finally:
+            conn.close()
+
+    @classmethod
+    def load(cls, path: str = KNOWN_URLS_PATH) -> "KnownUrlIndex":
+        """
+        実行開始時に1回呼ぶ
+        スナップショットがあれば差分同期、なければ全件を1回の射影スキャンで読み込む
+        （削除された文書を反映するため、KNOWN_URLS_MAX_AGEより古いスナップショットは使わない）
+        """
+        started = time.monotonic()
+        index = cls.from_snapshot(path) if path else None
+        mode = "差分同期"
+        if index is None:
+            index = cls()
+            mode = "全件読み込み"
+        with metrics.timer("mongo_exists_seconds", query="known_urls_sync"):
+            added = index.sync()
+        if path:
+            index.save(path)
+        elapsed = time.monotonic() - started
+        metrics.log_event(
+            "known_urls_loaded",
+            f"  📇 既知URL索引: {len(index)}件（{mode} +{added}件, {elapsed * 1000:.0f}ms）",
+            mode=mode,
+            urls=len(index),
+            added=added,
+            seconds=round(elapsed, 4),
+        )
+        return index
+
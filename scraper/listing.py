@@ -0,0 +1,110 @@
+# listing.py
+import re
+from urllib.parse import urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from charset import decode_body
+from extract import make_soup
+import metrics
+
+# 詳細ページURLのパターン（例: .../k_ryouri/search_menu/menu/xxx.html）
+DETAIL_URL_RE = re.compile(r"""[\w./:-]*?/search_menu/menu/[\w.-]+\.html""")
+
+# テキスト中の詳細ページURLの候補（相対URLの../menu/xxx.htmlも含む。解決後にDETAIL_URL_REで判定）
+MENU_LINK_RE = re.compile(r"""[\w./:-]*menu/[\w.-]+\.html""")
+
+# カード一覧のセレクタ（Seleniumで表示中のカードを読む場合と同じ構造）
+CARD_SELECTOR = "div[id^='SearchMenu'] div.list p.tit a[href]"
+
+
+def _unique(urls):
+    """順序を保ったまま重複を除く"""
+    seen = set()
+    result = []
+    for u in urls:
+        if u not in seen:
+            seen.add(u)
+            result.append(u)
+    return result
+
+
+def extract_card_urls(soup: BeautifulSoup, page_url: str) -> list:
+    """
+    カテゴリーページのマークアップからレシピカードのURLをすべて取り出す
+    JSでランダムに表示/非表示を切り替えているだけなら、非表示のカードも含めて
+    全候補がHTML内にあるので、1回の取得で全件を得られる
+    """
+    urls = []
+    for a in soup.select(CARD_SELECTOR):
+        href = a.get("href")
+        if href:
+            urls.append(urljoin(page_url, href))
+    return _unique(urls)
+
+
+def extract_urls_from_text(text: str, page_url: str) -> list:
+    """
+    スクリプトやJSONのテキストから詳細ページURLを正規表現で取り出す
+    相対URL（../menu/xxx.html）はページのURLで解決してから詳細ページかどうかを判定する
+    """
+    urls = (urljoin(page_url, m) for m in MENU_LINK_RE.findall(text))
+    return _unique(u for u in urls if DETAIL_URL_RE.fullmatch(u))
+
+
+def data_script_urls(soup: BeautifulSoup, page_url: str) -> list:
+    """
+    カテゴリーページが読み込む同一ホストのスクリプト/データファイルのURL一覧
+    （カード一覧をJSで生成している場合、候補データはここに含まれる）
+    """
+    host = urlsplit(page_url).netloc
+    urls = []
+    for tag in soup.find_all("script", src=True):
+        src = urljoin(page_url, tag["src"])
+        if urlsplit(src).netloc == host:
+            urls.append(src)
+    return _unique(urls)
+
+
+def extract_listing_urls(html: str, page_url: str) -> list:
+    """
+    カテゴリーページのHTMLから候補レシピURLを抽出する（ネットワークアクセスなし）
+    1. SearchMenuのカード（非表示分も含む）
+    2. インラインスクリプト内に埋め込まれたURL
+    """
+    soup = make_soup(html)
+    urls = extract_card_urls(soup, page_url)
+    for tag in soup.find_all("script", src=False):
+        urls.extend(extract_urls_from_text(tag.get_text(), page_url))
+    return _unique(urls)
+
+
+def _decode(res) -> str:
+    res.raise_for_status()
+    return decode_body(res.content, res.url, res.headers.get("Content-Type"))
+
+
+def fetch_listing_urls(cat_url: str, fetcher) -> list:
+    """
+    Seleniumを使わずにHTTPだけでカテゴリーの全候補URLを収集
+    ページ本体で見つからなければ、読み込まれているデータスクリプトも確認する
+    """
+    html = _decode(fetcher.get(cat_url))
+    urls = extract_listing_urls(html, cat_url)
+    if urls:
+        return urls
+
+    soup = make_soup(html)
+    for src in data_script_urls(soup, cat_url):
+        try:
+            text = _decode(fetcher.get(src))
+        except Exception as e:
+            metrics.log_event(
+                "listing_data_error",
+                f"  ⚠️  データファイル取得失敗: {src}: {e}",
+                url=src,
+                error=repr(e),
+            )
+            continue
+        urls.extend(extract_urls_from_text(text, cat_url))
+    return _unique(urls)
@@ -0,0 +1,108 @@
+# manifest.py
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config import MANIFEST_DIR, SCRAPE_RUNS_COLLECTION
+from storage import get_collection
+import metrics
+
+# scrape_runsコレクションの1件（実行ごと）:
+#     {
+#         "_id": "20261018T030000Z-1a2b3c4d",   # 実行ID（文字列順 = 開始時刻順）
+#         "status": "completed",                # 途中で例外が起きた場合は"failed"
+#         "startedAt": 1700000000.0,
+#         "finishedAt": 1700000042.0,
+#         "seconds": 42.0,
+#         "counts": {"inserted": 3, "modified": 1, "unchanged": 20, "errors": 0},
+#         "manifestPath": "manifests/20261018T030000Z-1a2b3c4d.jsonl",
+#         ...                                   # mode / pipelineなど呼び出し側の項目
+#     }
+# 変更の一覧はJSONLだけに書く（全件クロール・再パースでは全レシピが並び、1ドキュメントの16MB上限を超えうる）
+# JSONLの1行:
+#     {"runId": "...", "_id": "<ObjectIdの文字列>", "detailUrl": "...",
+#      "change": "inserted" | "modified", "oldHash": None | "...", "newHash": "..."}
+
+
+def new_run_id() -> str:
+    """実行ID（UTCの開始時刻 + ランダムな8文字）"""
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:8]
+
+
+class ChangeManifest:
+    """
+    1回の実行で新規作成・内容が変わったレシピの一覧（変更マニフェスト）
+    - add(stats)でbulk upsertの結果を受け取り、JSONLに逐次追記する（メモリには件数だけ持つ）
+    - close()でscrape_runsコレクションに実行のまとめ（件数とJSONLのパス）を保存する
+    バックエンド・CDNのキャッシュは、このリストのレシピだけを無効化・事前生成すればよい
+    """
+
+    def __init__(self, run_id: str = None, manifest_dir: str = MANIFEST_DIR):
+        self.run_id = run_id or new_run_id()
+        self.started_at = time.time()
+        self.path = os.path.join(manifest_dir, f"{self.run_id}.jsonl") if manifest_dir else None
+        self.counts = {"inserted": 0, "modified": 0, "unchanged": 0, "errors": 0}
+        self._file = None
+
+    def _open(self):
+        if self._file is None and self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def add(self, stats):
+        """storage.UpsertStatsの変更エントリと件数を追加する"""
+        self.counts["unchanged"] += stats.unchanged
+        self.counts["errors"] += stats.errors
+        for entry in stats.changes:
+            self.counts[entry["change"]] += 1
+
+        f = self._open()
+        if f is None or not stats.changes:
+            return
+        for entry in stats.changes:
+            line = {"runId": self.run_id, **entry, "_id": str(entry["_id"]) if entry["_id"] else None}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        f.flush()
+
+    def close(self, status: str = "completed", **fields) -> dict:
+        """
+        JSONLを閉じ、scrape_runsに実行のまとめを保存する（fieldsはそのまま追加）
+        変更がない実行も、空のJSONLとドキュメントを残す（「無効化するものがない」ことが分かるように）
+        """
+        self._open()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        finished_at = time.time()
+        doc = {
+            "_id": self.run_id,
+            "status": status,
+            "startedAt": self.started_at,
+            "finishedAt": finished_at,
+            "seconds": round(finished_at - self.started_at, 3),
+            "counts": dict(self.counts),
+            "manifestPath": self.path,
+            **fields,
+        }
+        try:
+            get_collection(SCRAPE_RUNS_COLLECTION).replace_one({"_id": self.run_id}, doc, upsert=True)
+        except Exception as e:
+            # JSONLは書き出し済みなので実行は止めない
+            metrics.log_event(
+                "change_manifest_error", f"  ⚠️  scrape_runsへの保存に失敗: {e}", error=repr(e)
+            )
+
+        metrics.log_event(
+            "change_manifest",
+            f"📝 変更マニフェスト {self.run_id}: "
+            f"新規{self.counts['inserted']}件, 更新{self.counts['modified']}件"
+            + (f" → {self.path}" if self.path else ""),
+            run_id=self.run_id,
+            path=self.path,
+            **self.counts,
+        )
+        return doc
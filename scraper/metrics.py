@@ -0,0 +1,273 @@
+# metrics.py
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from config import (
+    METRICS_JOB,
+    METRICS_JSON_LOGS,
+    METRICS_PROM_PATH,
+    METRICS_PUSHGATEWAY_URL,
+)
+
+# 所要時間ヒストグラムのバケット境界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Prometheusのメトリクス名の接頭辞
+PREFIX = "scraper_"
+
+
+def log_event(event: str, message: str = None, **fields):
+    """
+    イベントを1行だけ出力する（同じイベントを2つの形式で出さない）
+    - METRICS_JSON_LOGS=1: 構造化ログ（1行1JSON）
+    - METRICS_JSON_LOGS=0: message（人が読む表示）。messageがないイベントは出力しない
+    """
+    if not METRICS_JSON_LOGS:
+        if message is not None:
+            print(message)
+        return
+    record = {"ts": round(time.time(), 3), "event": event, **fields}
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+class Histogram:
+    """累積でないバケット数・合計・件数・最大値を持つヒストグラム"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """バケット内を線形補間して分位点を推定する（最上位バケットはmaxで打ち切り）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if n and seen + n >= target:
+                return min(self.max, lower + (upper - lower) * (target - seen) / n)
+            seen += n
+            lower = upper
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.quantile(0.5), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Metrics:
+    """
+    実行中のカウンターとヒストグラムを集める（スレッドセーフ）
+    記録は通常モジュール関数のinc / observe / timer経由で行う
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def merge(self, ops: list):
+        """capture()で記録した操作を取り込む（プロセスプールのワーカーで計測した分）"""
+        for kind, name, value, labels in ops:
+            getattr(self, kind)(name, value, **labels)
+
+    # ===== 出力 =====
+    def summary(self) -> dict:
+        with self._lock:
+            counters = {}
+            for (name, key), value in sorted(self.counters.items()):
+                counters[name + _format_labels(key)] = value
+            histograms = {}
+            for (name, key), hist in sorted(self.histograms.items()):
+                histograms[name + _format_labels(key)] = hist.to_dict()
+        return {
+            "duration_s": round(time.time() - self.started, 3),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def to_prometheus(self) -> str:
+        """Prometheusのテキスト形式（textfile collector / Pushgateway用）"""
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, key), value in sorted(self.counters.items()):
+                metric = PREFIX + name
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} counter")
+                    typed.add(metric)
+                lines.append(f"{metric}{_format_labels(key)} {value}")
+            for (name, key), hist in sorted(self.histograms.items()):
+                metric = PREFIX + name
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} histogram")
+                    typed.add(metric)
+                cumulative = 0
+                for bound, n in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                    cumulative += n
+                    le = (("le", str(bound)),)
+                    lines.append(f"{metric}_bucket{_format_labels(key, le)} {cumulative}")
+                lines.append(f"{metric}_sum{_format_labels(key)} {hist.sum}")
+                lines.append(f"{metric}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+# プロセス全体で共有するメトリクス
+METRICS = Metrics()
+
+# capture()中のスレッドでは、記録をMETRICSではなくリストに貯める
+_local = threading.local()
+
+
+def inc(name: str, value: float = 1, **labels):
+    """カウンターを増やす"""
+    ops = getattr(_local, "ops", None)
+    if ops is not None:
+        ops.append(("inc", name, value, labels))
+    else:
+        METRICS.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    """ヒストグラムに値（秒）を記録する"""
+    ops = getattr(_local, "ops", None)
+    if ops is not None:
+        ops.append(("observe", name, value, labels))
+    else:
+        METRICS.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """with文のブロックの所要時間をobserveする"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+@contextmanager
+def capture():
+    """
+    ブロック内の計測を記録したリストを返す（プロセスプールのワーカー用）
+    ワーカーから返したリストを親プロセスでMETRICS.merge()する
+    """
+    previous = getattr(_local, "ops", None)
+    ops = _local.ops = []
+    try:
+        yield ops
+    finally:
+        _local.ops = previous
+
+
+def write_prometheus(path: str = METRICS_PROM_PATH):
+    """Prometheusのテキスト形式でファイルに書き出す（node_exporterのtextfile collector用）"""
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(METRICS.to_prometheus())
+        # 書きかけのファイルを読まれないように置き換える
+        os.replace(tmp, path)
+    except OSError as e:
+        log_event("metrics_error", f"  ⚠️  メトリクスファイルの書き出しに失敗: {e}", error=repr(e))
+
+
+def push_gateway(url: str = METRICS_PUSHGATEWAY_URL, job: str = METRICS_JOB):
+    """Pushgatewayにメトリクスを送信する"""
+    if not url:
+        return
+    try:
+        res = requests.put(
+            f"{url.rstrip('/')}/metrics/job/{job}",
+            data=METRICS.to_prometheus().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4"},
+            timeout=10,
+        )
+        res.raise_for_status()
+    except Exception as e:
+        log_event("metrics_error", f"  ⚠️  Pushgatewayへの送信に失敗: {e}", error=repr(e))
+
+
+def _summary_message(fields: dict, summary: dict) -> str:
+    """run_summaryの人が読む表示（主なカウンターとヒストグラムのp50 / p99）"""
+    head = ", ".join(
+        f"{k}={v}" for k, v in fields.items() if v is not None and not isinstance(v, dict)
+    )
+    lines = [f"📊 実行サマリー（{summary['duration_s']:.1f}秒）: {head}"]
+    pipeline = fields.get("pipeline")
+    if pipeline:
+        lines.append("   → パイプライン: " + ", ".join(f"{k}={v}" for k, v in pipeline.items()))
+    for name, value in summary["counters"].items():
+        lines.append(f"   {name} {value:g}")
+    for name, hist in summary["histograms"].items():
+        lines.append(
+            f"   {name} count={hist['count']} "
+            f"p50={hist['p50']:.4g} p99={hist['p99']:.4g} max={hist['max']:.4g}"
+        )
+    return "\n".join(lines)
+
+
+def report_run(**fields):
+    """
+    実行終了時のまとめ: サマリー（ヒストグラム付き）を構造化ログに出力し、
+    設定されていればPrometheus形式のファイル・Pushgatewayにも書き出す
+    """
+    summary = METRICS.summary()
+    log_event("run_summary", _summary_message(fields, summary), **fields, **summary)
+    write_prometheus()
+    push_gateway()
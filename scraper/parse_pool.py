@@ -0,0 +1,37 @@
+# parse_pool.py
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from config import PARSE_PROCESSES
+
+
+class ParsePool:
+    """
+    CPUバウンドなHTML抽出をプロセスプールで実行する
+    - func(content: bytes, url: str, *args) -> dict はモジュール直下の関数（pickle可能）であること
+    - 生のレスポンスバイト列とURLだけを渡し、結果はプレーンなdictで受け取る
+    - workers=0の場合はプロセスを使わず、スレッドで実行（デバッグ用）
+    """
+
+    def __init__(self, func, workers: int = PARSE_PROCESSES):
+        self.func = func
+        self.workers = workers if workers > 0 else 0
+        self._executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers else None
+
+    async def parse(self, content: bytes, url: str, *args) -> dict:
+        """パイプラインから1件ずつ呼ぶ（argsはContent-Typeなど、funcへそのまま渡す）"""
+        if self._executor is None:
+            return await asyncio.to_thread(self.func, content, url, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.func, content, url, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
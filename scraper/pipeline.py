@@ -0,0 +1,286 @@
+# pipeline.py
+import asyncio
+import csv
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    FETCH_MAX_CONCURRENCY,
+    PIPELINE_FLUSH_INTERVAL,
+    PIPELINE_FLUSH_SIZE,
+    PIPELINE_PARSE_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+)
+from ingredient_index import update_postings
+import metrics
+from storage import bulk_upsert
+
+# ステージ終了を下流に伝える目印
+_DONE = object()
+
+# メトリクスのstageラベル（PipelineStatsの件数属性名 → ステージ名）
+_STAGE_LABELS = {"fetched": "fetch", "parsed": "parse"}
+
+
+class PipelineStats:
+    """パイプライン全体の件数集計"""
+
+    def __init__(self):
+        self.listed = 0
+        self.fetched = 0
+        self.parsed = 0
+        self.stored = 0
+        self.failed = 0
+        self.started = time.monotonic()
+
+    def to_dict(self) -> dict:
+        return {
+            "listed": self.listed,
+            "fetched": self.fetched,
+            "parsed": self.parsed,
+            "stored": self.stored,
+            "failed": self.failed,
+            "seconds": round(time.monotonic() - self.started, 3),
+        }
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return (
+            f"listed={self.listed}, fetched={self.fetched}, parsed={self.parsed}, "
+            f"stored={self.stored}, failed={self.failed}, {elapsed:.1f}秒"
+        )
+
+
+class MongoSink:
+    """
+    マイクロバッチをMotor経由でbulk upsertする
+    manifest（manifest.ChangeManifest）を渡すと、新規・内容が変わったレシピを記録する
+    scraped=False（アーカイブからの再パース）ではscrapeCountを増やさない
+    バッチごとに、内容・カテゴリーが変わったレシピの分だけingredient_indexを差分更新する
+    （実行が途中で止められても、書き込んだレシピの差分は適用済み）
+    failedは直前のバッチで書き込みに失敗した行（detailUrl → エラー、JournalSinkが参照する）
+    """
+
+    def __init__(self, manifest=None, scraped: bool = True):
+        self.manifest = manifest
+        self.scraped = scraped
+        self.failed = {}
+
+    async def write(self, rows: list):
+        stats = await bulk_upsert(rows, scraped=self.scraped)
+        self.failed = stats.failed
+        if self.manifest is not None:
+            self.manifest.add(stats)
+        if stats.posting_changes:
+            try:
+                await asyncio.to_thread(update_postings, stats.posting_changes)
+            except Exception as e:
+                # 検索用の索引なので失敗しても実行は止めない（ingredient_index.pyで作り直せる）
+                metrics.log_event(
+                    "ingredient_index_error",
+                    f"  ⚠️  ingredient_indexの更新に失敗: {e}",
+                    error=repr(e),
+                )
+
+    async def close(self):
+        pass
+
+
+class CsvSink:
+    """
+    レコードをCSVに逐次追記する
+    最初の書き込み時にファイルを作成してヘッダーを出力（0件ならファイルを作らない）
+    append=Trueの場合は既存ファイルに追記する（ヘッダーはファイルが空のときのみ）
+    書き込みとfsyncはイベントループを止めないようスレッドで行う
+    """
+
+    def __init__(self, path: str, keys: list, row_formatter=None, append: bool = False):
+        self.path = path
+        self.keys = keys
+        self.row_formatter = row_formatter
+        self.append = append
+        self._file = None
+        self._writer = None
+
+    async def write(self, rows: list):
+        await asyncio.to_thread(self._write_rows, rows)
+
+    def _write_rows(self, rows: list):
+        if self._file is None:
+            exists = self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+            self._file = open(
+                self.path,
+                "a" if exists else "w",
+                newline="",
+                # 追記時にBOMを重複して書かないようにする
+                encoding="utf-8" if exists else "utf-8-sig",
+            )
+            self._writer = csv.DictWriter(self._file, fieldnames=self.keys)
+            if not exists:
+                self._writer.writeheader()
+        for row in rows:
+            out = {k: row.get(k, "") for k in self.keys}
+            if self.row_formatter:
+                out = self.row_formatter(row, out)
+            self._writer.writerow(out)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+async def _source_stage(source, out_q: asyncio.Queue, stats: PipelineStats, n_workers: int):
+    async for item in source:
+        stats.listed += 1
+        await out_q.put(item)
+    for _ in range(n_workers):
+        await out_q.put(_DONE)
+
+
+async def _worker_stage(name, func, in_q, out_q, stats, counter, executor):
+    """
+    in_qから取り出した(meta, value)にfuncを適用し、結果をout_qへ流す
+    funcがコルーチン関数ならそのままawait、通常の関数ならexecutorのスレッドで実行
+    """
+    is_async = asyncio.iscoroutinefunction(func)
+    stage = _STAGE_LABELS[counter]
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await in_q.get()
+        if item is _DONE:
+            return
+        meta, value = item
+        started = time.perf_counter()
+        try:
+            if is_async:
+                result = await func(value, meta)
+            else:
+                result = await loop.run_in_executor(executor, functools.partial(func, value, meta))
+        except Exception as e:
+            stats.failed += 1
+            metrics.inc("pipeline_failed_total", stage=stage)
+            metrics.log_event(
+                "pipeline_error",
+                f"  ❌ {name}エラー: {meta.get('url')}: {e}",
+                stage=stage,
+                url=meta.get("url"),
+                error=repr(e),
+            )
+            continue
+        metrics.observe("pipeline_stage_seconds", time.perf_counter() - started, stage=stage)
+        setattr(stats, counter, getattr(stats, counter) + 1)
+        await out_q.put((meta, result))
+
+
+async def _sink_stage(in_q, sinks, stats, flush_size, flush_interval):
+    """
+    レコードをマイクロバッチにまとめて各sinkへ書き出す
+    flush_size件たまるか、flush_interval秒経過した時点でflush
+    """
+    batch = []
+    deadline = time.monotonic() + flush_interval
+
+    async def flush():
+        nonlocal batch, deadline
+        if batch:
+            for sink in sinks:
+                await sink.write(batch)
+            stats.stored += len(batch)
+            batch = []
+        deadline = time.monotonic() + flush_interval
+
+    while True:
+        timeout = max(0.0, deadline - time.monotonic())
+        try:
+            item = await asyncio.wait_for(in_q.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await flush()
+            continue
+        if item is _DONE:
+            await flush()
+            return
+        _, record = item
+        batch.append(record)
+        if len(batch) >= flush_size:
+            await flush()
+
+
+async def run_pipeline(
+    source,
+    fetch,
+    parse,
+    sinks: list,
+    fetch_workers: int = FETCH_MAX_CONCURRENCY,
+    parse_workers: int = PIPELINE_PARSE_WORKERS,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    flush_size: int = PIPELINE_FLUSH_SIZE,
+    flush_interval: float = PIPELINE_FLUSH_INTERVAL,
+) -> PipelineStats:
+    """
+    listing → fetch → parse → sink のストリーミングパイプライン
+    - source: (meta, url) を生成する非同期イテレータ（metaは"url"を含むdict）
+    - fetch(url, meta): 生レスポンスを返す同期関数（スレッドで実行）
+    - parse(raw, meta): レコードdictを返す関数（同期ならスレッド、コルーチンならそのまま実行）
+    - sinks: write(rows) / close() を持つ書き出し先
+    ステージ間は上限付きキューでつなぐので、メモリ使用量は件数に依存しない
+    fetch_workersは同時リクエスト数の上限（実際の同時数はFetcherのHostControllerが決める）
+    """
+    # 同期関数は専用のスレッドプールで動かすので、全ワーカーが同時に動ける数のスレッドを用意する
+    # （既定のスレッド数はCPUコア数+4で、取得ワーカーが増えるとスレッド待ちになる）
+    # 1回の実行ごとに作って終了時に閉じる（ワーカーモードや再パースでは何度も呼ばれる）
+    executor = ThreadPoolExecutor(
+        max_workers=fetch_workers + parse_workers + 4, thread_name_prefix="pipeline"
+    )
+    stats = PipelineStats()
+    fetch_q = asyncio.Queue(maxsize=queue_size)
+    parse_q = asyncio.Queue(maxsize=queue_size)
+    sink_q = asyncio.Queue(maxsize=queue_size)
+
+    sink_task = asyncio.create_task(
+        _sink_stage(sink_q, sinks, stats, flush_size, flush_interval)
+    )
+    parse_tasks = [
+        asyncio.create_task(
+            _worker_stage("パース", parse, parse_q, sink_q, stats, "parsed", executor)
+        )
+        for _ in range(parse_workers)
+    ]
+    fetch_tasks = [
+        asyncio.create_task(
+            _worker_stage("取得", fetch, fetch_q, parse_q, stats, "fetched", executor)
+        )
+        for _ in range(fetch_workers)
+    ]
+
+    async def drive():
+        """リスト収集を行い、各ステージが終わったら下流に終了の目印を流す"""
+        await _source_stage(source, fetch_q, stats, fetch_workers)
+        await asyncio.gather(*fetch_tasks)
+        for _ in range(parse_workers):
+            await parse_q.put(_DONE)
+        await asyncio.gather(*parse_tasks)
+        await sink_q.put(_DONE)
+        await sink_task
+
+    tasks = [asyncio.create_task(drive()), sink_task, *parse_tasks, *fetch_tasks]
+    try:
+        # どれかのステージが例外で終わったら（MongoDBの障害でsinkが落ちた場合など）、
+        # 上流がキュー待ちで止まったままにならないよう、残りを取り消して例外を送出する
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for sink in sinks:
+            await sink.close()
+        # 取り消したワーカーのスレッドは、実行中の取得が終わりしだい終了する
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return stats
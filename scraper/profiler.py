@@ -0,0 +1,317 @@
+# profiler.py
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from config import (
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_SNAPSHOT_INTERVAL,
+    PROFILE_TRACEMALLOC_FRAMES,
+)
+
+STAGES = ("listing", "fetch", "parse", "store")
+
+# スタック上にあればそのステージとみなす関数（co_qualname）
+# 呼び出し元（スタックの根元）側から順に見て最初に一致したものを採用するので、
+# リスト収集中のfetch_htmlはlisting、詳細ページ取得中はfetchに振り分けられる
+STAGE_FUNCTIONS = {
+    "collect_listings": "listing",
+    "collect_all_categories": "listing",
+    "collect_top5_from_category": "listing",
+    "iter_new_links": "listing",
+    "iter_crawl_links": "listing",
+    "load_known_urls": "listing",
+    "fetch_listing_urls": "listing",
+    "CatalogCrawler.iter_detail_urls": "listing",
+    "DetailStages.fetch": "fetch",
+    "DetailStages.parse": "parse",
+    "parse_detail_measured": "parse",
+    "parse_detail_bytes": "parse",
+    "parse_detail_html": "parse",
+    "_sink_stage": "store",
+    "bulk_upsert": "store",
+    "save_to_mongo": "store",
+    "MongoSink.write": "store",
+    "MongoSink.close": "store",
+    "CsvSink.write": "store",
+    "CsvSink._write_rows": "store",
+    "JournalSink.write": "store",
+}
+
+# スクレイパー以外のスレッド（Motorの実行スレッドなど）で動くライブラリ
+STAGE_PACKAGES = {
+    f"{os.sep}motor{os.sep}": "store",
+    f"{os.sep}pymongo{os.sep}": "store",
+}
+
+SCRAPER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _qualname(code) -> str:
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def _frame_label(code) -> str:
+    return f"{_qualname(code)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _package_stage(filename: str):
+    for marker, stage in STAGE_PACKAGES.items():
+        if marker in filename:
+            return stage
+    return None
+
+
+def _function_ranges() -> dict:
+    """
+    STAGE_FUNCTIONSの関数のソース行範囲 {ファイル名: [(開始行, 終了行, ステージ)]}
+    tracemallocのフレームは関数名を持たないため、ファイル名と行番号で振り分ける
+    """
+    ranges = {}
+    for module in list(sys.modules.values()):
+        path = getattr(module, "__file__", None)
+        if not path or os.path.dirname(os.path.abspath(path)) != SCRAPER_DIR:
+            continue
+        for _, obj in inspect.getmembers(module):
+            members = [obj]
+            if inspect.isclass(obj) and obj.__module__ == module.__name__:
+                members = [m for _, m in inspect.getmembers(obj, inspect.isfunction)]
+            for func in members:
+                if not inspect.isfunction(func) or func.__qualname__ not in STAGE_FUNCTIONS:
+                    continue
+                lines, start = inspect.getsourcelines(func)
+                ranges.setdefault(func.__code__.co_filename, []).append(
+                    (start, start + len(lines) - 1, STAGE_FUNCTIONS[func.__qualname__])
+                )
+    return ranges
+
+
+class RunProfiler:
+    """
+    実行全体のサンプリングプロファイラー（--profile用）
+    - interval秒ごとに全スレッドのスタックを採取し、listing / fetch / parse / store に振り分ける
+      （スレッドやイベントループをまたいでも、スタック上の関数でステージが決まる）
+    - tracemallocでメモリ確保を追跡し、snapshot_interval秒ごとのスナップショットから
+      ステージごとのピーク使用量と確保箇所の上位を求める
+      （tracemallocは確保の多い処理を数倍遅くするので、CPU時間だけを見たい場合は
+      tracemalloc_frames=0で無効にする）
+    - 結果はcollapsed stack（flamegraph.pl / speedscope用）、speedscope JSON、メモリのJSONで書き出す
+    """
+
+    def __init__(
+        self,
+        interval: float = PROFILE_SAMPLE_INTERVAL,
+        snapshot_interval: float = PROFILE_SNAPSHOT_INTERVAL,
+        tracemalloc_frames: int = PROFILE_TRACEMALLOC_FRAMES,
+    ):
+        self.interval = interval
+        self.snapshot_interval = snapshot_interval
+        self.tracemalloc_frames = tracemalloc_frames
+        self.stacks = Counter()
+        self.ticks = 0
+        self.unclassified = 0
+        self.memory = {stage: {"peak_bytes": 0, "top": []} for stage in STAGES}
+        self.peak_bytes = 0
+        self.started = None
+        self.elapsed = 0.0
+        self._stage_cache = {}
+        self._ranges = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ===== CPUサンプリング =====
+    def _code_stage(self, code):
+        stage = self._stage_cache.get(code)
+        if stage is None:
+            stage = STAGE_FUNCTIONS.get(_qualname(code))
+            if stage is None and os.path.dirname(code.co_filename) != SCRAPER_DIR:
+                stage = _package_stage(code.co_filename)
+            self._stage_cache[code] = stage or ""
+        return stage or None
+
+    def _sample(self):
+        self.ticks += 1
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            stage = next((s for s in map(self._code_stage, codes) if s), None)
+            if stage is None:
+                # 待機中のスレッドプールやイベントループ本体はステージに含めない
+                self.unclassified += 1
+                continue
+            self.stacks[(stage, tuple(codes))] += 1
+
+    # ===== メモリ =====
+    def _traceback_stage(self, traceback):
+        # tracemallocのフレームは古い順（根元側から）に並んでいる
+        for frame in traceback:
+            for start, end, stage in self._ranges.get(frame.filename, ()):
+                if start <= frame.lineno <= end:
+                    return stage
+            stage = _package_stage(frame.filename)
+            if stage:
+                return stage
+        return None
+
+    def _snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        totals = Counter()
+        sites = {stage: Counter() for stage in STAGES}
+        for stat in snapshot.statistics("traceback"):
+            stage = self._traceback_stage(stat.traceback)
+            if stage is None:
+                continue
+            totals[stage] += stat.size
+            leaf = stat.traceback[-1]
+            sites[stage][f"{leaf.filename}:{leaf.lineno}"] += stat.size
+        for stage, size in totals.items():
+            if size > self.memory[stage]["peak_bytes"]:
+                self.memory[stage] = {
+                    "peak_bytes": size,
+                    "top": [
+                        {"site": site, "bytes": n} for site, n in sites[stage].most_common(10)
+                    ],
+                }
+
+    @property
+    def trace_memory(self) -> bool:
+        return self.tracemalloc_frames > 0
+
+    def _run(self):
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        while not self._stop.wait(self.interval):
+            self._sample()
+            if self.trace_memory and time.monotonic() >= next_snapshot:
+                self._snapshot()
+                next_snapshot = time.monotonic() + self.snapshot_interval
+
+    def start(self):
+        if self.trace_memory:
+            self._ranges = _function_ranges()
+            tracemalloc.start(self.tracemalloc_frames)
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self.trace_memory:
+            self._snapshot()
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.elapsed = time.monotonic() - self.started
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ===== 出力 =====
+    @property
+    def tick_seconds(self) -> float:
+        """1サンプルあたりの実時間（採取自体の時間で間隔は設定値より長くなる）"""
+        return self.elapsed / self.ticks if self.ticks else self.interval
+
+    def stage_seconds(self) -> dict:
+        """ステージごとのスレッド時間（並行して動いたスレッドの分は重複して数える）"""
+        seconds = Counter()
+        for (stage, _), n in self.stacks.items():
+            seconds[stage] += n * self.tick_seconds
+        return {stage: round(seconds[stage], 3) for stage in STAGES}
+
+    def collapsed(self) -> str:
+        """flamegraph.pl / speedscopeで読めるcollapsed stack形式（先頭フレームはステージ名）"""
+        lines = []
+        for (stage, codes), n in sorted(self.stacks.items(), key=lambda kv: -kv[1]):
+            lines.append(";".join([stage] + [_frame_label(c) for c in codes]) + f" {n}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> dict:
+        """speedscopeのファイル形式（ステージごとに1つのsampledプロファイル）"""
+        frames = []
+        index = {}
+        profiles = {stage: {"samples": [], "weights": []} for stage in STAGES}
+        for (stage, codes), n in self.stacks.items():
+            stack = []
+            for code in codes:
+                if code not in index:
+                    index[code] = len(frames)
+                    frames.append(
+                        {
+                            "name": _qualname(code),
+                            "file": code.co_filename,
+                            "line": code.co_firstlineno,
+                        }
+                    )
+                stack.append(index[code])
+            profiles[stage]["samples"].append(stack)
+            profiles[stage]["weights"].append(n * self.tick_seconds)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": "scraper",
+            "exporter": "scraper/profiler.py",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": stage,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(p["weights"]),
+                    "samples": p["samples"],
+                    "weights": p["weights"],
+                }
+                for stage, p in profiles.items()
+                if p["samples"]
+            ],
+        }
+
+    def memory_report(self) -> dict:
+        return {
+            "tracemalloc": self.trace_memory,
+            "tracemalloc_peak_bytes": self.peak_bytes,
+            "stages": self.memory,
+        }
+
+    def write(self, base_path: str) -> list:
+        """base_path + .collapsed.txt / .speedscope.json / .memory.json に書き出す"""
+        paths = [
+            f"{base_path}.collapsed.txt",
+            f"{base_path}.speedscope.json",
+            f"{base_path}.memory.json",
+        ]
+        with open(paths[0], "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        with open(paths[1], "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(), f)
+        with open(paths[2], "w", encoding="utf-8") as f:
+            json.dump(self.memory_report(), f, ensure_ascii=False, indent=2)
+        return paths
+
+    def report(self) -> str:
+        seconds = self.stage_seconds()
+        if not self.trace_memory:
+            parts = ", ".join(f"{stage}={seconds[stage]:.1f}秒" for stage in STAGES)
+            return f"{parts}（{self.elapsed:.1f}秒）"
+        parts = ", ".join(
+            f"{stage}={seconds[stage]:.1f}秒/{self.memory[stage]['peak_bytes'] / 2**20:.1f}MB"
+            for stage in STAGES
+        )
+        return f"{parts}（メモリピーク {self.peak_bytes / 2**20:.1f}MB, {self.elapsed:.1f}秒）"
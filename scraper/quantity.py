@@ -0,0 +1,190 @@
+# quantity.py
+import argparse
+import re
+import time
+import unicodedata
+from functools import lru_cache
+
+from config import MONGO_BATCH_SIZE
+from storage import backfill_documents, close_clients
+import metrics
+
+# 単位の規則表: (表記, 正規化後の単位, 換算係数)
+# 表記はNFKC正規化・小文字化した後の文字列。長い表記から順に照合する
+UNIT_RULES = [
+    # 重さ → g
+    ("kg", "g", 1000),
+    ("キロ", "g", 1000),
+    ("グラム", "g", 1),
+    ("g", "g", 1),
+    # 容量 → ml（大さじ15ml、小さじ5ml、カップ200ml）
+    ("ml", "ml", 1),
+    ("cc", "ml", 1),
+    ("ミリリットル", "ml", 1),
+    ("リットル", "ml", 1000),
+    ("l", "ml", 1000),
+    ("大さじ", "ml", 15),
+    ("小さじ", "ml", 5),
+    ("カップ", "ml", 200),
+    ("合", "合", 1),
+    # 個数（単位はそのまま）
+    ("本", "本", 1),
+    ("個", "個", 1),
+    ("尾", "尾", 1),
+    ("枚", "枚", 1),
+    ("切れ", "切れ", 1),
+    ("束", "束", 1),
+    ("株", "株", 1),
+    ("かけ", "かけ", 1),
+    ("片", "片", 1),
+    ("丁", "丁", 1),
+    ("玉", "玉", 1),
+    ("袋", "袋", 1),
+    ("缶", "缶", 1),
+    ("杯", "杯", 1),
+    ("房", "房", 1),
+    ("粒", "粒", 1),
+    ("匹", "匹", 1),
+    ("%", "%", 1),
+]
+_UNITS = {text: (unit, factor) for text, unit, factor in UNIT_RULES}
+_UNIT_PATTERN = "|".join(
+    re.escape(text) for text in sorted(_UNITS, key=len, reverse=True)
+)
+
+# 数値: 1 / 1.5 / 1/2 / 1と1/2（帯分数）
+_NUMBER = r"\d+/\d+|\d+(?:\.\d+)?(?:と\d+/\d+)?"
+# 範囲: 1〜2（「〜」はNFKCでそのまま、全角の「～」は「~」になる）
+_RANGE = rf"(?P<value>{_NUMBER})(?:\s*[〜~\-]\s*(?P<max>{_NUMBER}))?"
+# 単位が数値の前に付く表記（大さじ2、カップ1/2）と、後に付く表記（450g、2本）
+PREFIX_RE = re.compile(rf"(?P<unit>大さじ|小さじ|カップ)\s*{_RANGE}")
+SUFFIX_RE = re.compile(rf"{_RANGE}\s*(?P<unit>{_UNIT_PATTERN})?")
+# 「約」「およそ」などの概数
+APPROX_RE = re.compile(r"約|およそ|程度|くらい|ぐらい")
+# 括弧内の別表記（例: 450g（3合） の「3合」）。全角括弧はNFKCで半角になる
+BRACKET_RE = re.compile(r"\(([^()]*)\)")
+# 分数の1文字（½など）。NFKCでは「1⁄2」になり、直前の整数とつながる（1½ → 11⁄2）ので先に帯分数にする
+VULGAR_FRACTION_RE = re.compile(r"(\d?)([\u00bc-\u00be\u2150-\u215e])")
+
+
+def _vulgar_fraction(m) -> str:
+    fraction = unicodedata.normalize("NFKC", m.group(2))
+    return f"{m.group(1)}と{fraction}" if m.group(1) else fraction
+
+
+def _number(text: str):
+    """数値の表記を数にする（分母が0ならNone）"""
+    whole, _, fraction = text.partition("と")
+    if "/" in whole:
+        fraction, whole = whole, "0"
+    value = float(whole)
+    if fraction:
+        numerator, denominator = fraction.split("/")
+        if not int(denominator):
+            return None
+        value += int(numerator) / int(denominator)
+    return value
+
+
+def _parse_simple(text: str):
+    """括弧を除いた表記から (値, 上限, 単位, 概数か) を取り出す（数値がなければNone）"""
+    m = PREFIX_RE.search(text) or SUFFIX_RE.search(text)
+    if not m:
+        return None
+    unit, factor = _UNITS.get(m.group("unit") or "", (None, 1))
+    value = _number(m.group("value"))
+    if value is None:
+        return None
+    high = _number(m.group("max")) if m.group("max") else None
+    value = round(value * factor, 3)
+    high = round(high * factor, 3) if high is not None else None
+    return value, high, unit, bool(APPROX_RE.search(text))
+
+
+def _as_dict(parsed) -> dict:
+    value, high, unit, approx = parsed
+    result = {"value": value, "unit": unit}
+    if high is not None:
+        result["max"] = high
+    if approx:
+        result["approx"] = True
+    return result
+
+
+@lru_cache(maxsize=4096)
+def _parse(amount: str):
+    text = VULGAR_FRACTION_RE.sub(_vulgar_fraction, amount)
+    text = unicodedata.normalize("NFKC", text).casefold().replace("⁄", "/")
+    alt = None
+    bracket = BRACKET_RE.search(text)
+    if bracket:
+        alt = _parse_simple(bracket.group(1))
+        text = text[: bracket.start()] + text[bracket.end() :]
+    main = _parse_simple(text)
+    if main is None:
+        # 「適量（約10g）」のように括弧内にだけ数値がある場合はそちらを使う
+        return alt, None
+    return main, alt
+
+
+def parse_quantity(amount: str):
+    """
+    分量の文字列を構造化する（数値のない「適量」「少々」などはNone）
+    例: "450g（3合）" → {"value": 450.0, "unit": "g", "alt": {"value": 3.0, "unit": "合"}}
+        "大さじ1と1/2" → {"value": 22.5, "unit": "ml"}
+        "1〜2本" → {"value": 1.0, "max": 2.0, "unit": "本"}
+    - 全角数字・分数・帯分数（1と1/2、1½）・範囲（1〜2）に対応
+    - g / ml / 合 / 本 / 個などに正規化し、kg・リットル・大さじ・小さじ・カップは換算する
+    - 単位が分からない数値（「2」など）はunit=None
+    """
+    if not amount:
+        return None
+    main, alt = _parse(amount)
+    if main is None:
+        return None
+    result = _as_dict(main)
+    if alt is not None:
+        result["alt"] = _as_dict(alt)
+    return result
+
+
+def with_quantities(ingredients: list) -> list:
+    """材料リストの各要素に、amountを構造化したquantityを付ける"""
+    return [{**item, "quantity": parse_quantity(item.get("amount") or "")} for item in ingredients]
+
+
+def backfill(batch_size: int = MONGO_BATCH_SIZE) -> dict:
+    """既存ドキュメントのingredients[].quantityを現在の規則で作り直す"""
+    started = time.monotonic()
+    counts = backfill_documents(
+        lambda doc: {"ingredients": with_quantities(doc.get("ingredients") or [])}
+        if doc.get("ingredients")
+        else None,
+        batch_size,
+    )
+    elapsed = time.monotonic() - started
+    metrics.log_event(
+        "quantity_backfill",
+        f"⚖️  quantity更新: {counts['updated']}/{counts['scanned']}件 {elapsed:.1f}秒",
+        **counts,
+        seconds=round(elapsed, 3),
+    )
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="既存レシピの材料の分量（ingredients[].quantity）を作り直す"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=MONGO_BATCH_SIZE, help="1回のbulk_writeで送る件数"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        backfill(batch_size=args.batch_size)
+    finally:
+        close_clients()
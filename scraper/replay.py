@@ -0,0 +1,124 @@
+# replay.py
+import argparse
+import asyncio
+
+from archive import ResponseArchive
+from config import ARCHIVE_INDEX_PATH, ARCHIVE_PATH, PARSE_PROCESSES, PIPELINE_PARSE_WORKERS
+from frontier import is_detail_url
+from manifest import ChangeManifest
+import metrics
+from parse_pool import ParsePool
+from pipeline import MongoSink, run_pipeline
+from scraper import parse_detail_measured
+from storage import close_clients
+
+
+async def iter_archived(archive: ResponseArchive, url_prefix: str = ""):
+    """
+    リスト収集ステージの代わり: アーカイブにある詳細ページの最新の200応答を
+    (meta, (オフセット, 長さ)) として記録した順に流す
+    categoryはレスポンスに含まれないので付けない（contentHashに含まれず、保存済みの値はそのまま残る）
+    """
+    for url, _, _, offset, length in await asyncio.to_thread(archive.latest):
+        if is_detail_url(url) and url.startswith(url_prefix):
+            yield {"url": url}, (offset, length)
+
+
+class ReplayStages:
+    """取得ステージはアーカイブからの読み出し、パースステージは通常の実行と同じプロセスプール"""
+
+    def __init__(self, archive: ResponseArchive, parse_pool: ParsePool):
+        self.archive = archive
+        self.parse_pool = parse_pool
+
+    def fetch(self, location, meta: dict):
+        record = self.archive.read(*location)
+        metrics.inc("replay_records_total")
+        metrics.inc("replay_bytes_total", len(record["content"]))
+        return record["content"], record["headers"].get("Content-Type")
+
+    async def parse(self, body, meta: dict) -> dict:
+        content, content_type = body
+        data, ops = await self.parse_pool.parse(content, meta["url"], content_type)
+        metrics.METRICS.merge(ops)
+        return data
+
+
+def replay(
+    path: str = ARCHIVE_PATH,
+    index_path: str = ARCHIVE_INDEX_PATH,
+    url_prefix: str = "",
+    parse_processes: int = PARSE_PROCESSES,
+):
+    """
+    アーカイブの詳細ページを現在の抽出処理でパースし直し、bulk upsertする（ネットワークには出ない）
+    - 内容が変わったレシピだけを書き込み、scrapeCountは増やさない
+    - categoryはレスポンスに含まれないので、保存済みのレシピの値をそのまま残す
+    - 変更マニフェスト（mode=replay）とingredient_indexの差分更新は通常の実行と同じ
+    """
+    archive = ResponseArchive(path, index_path)
+    manifest = ChangeManifest()
+    parse_pool = ParsePool(parse_detail_measured, workers=parse_processes)
+    stages = ReplayStages(archive, parse_pool)
+    archive_stats = archive.stats()
+    metrics.log_event(
+        "replay_started",
+        "=" * 60 + f"\n⏪ アーカイブから再パース: {path} {archive_stats}\n" + "=" * 60,
+        archive=path,
+        **archive_stats,
+    )
+    stats = None
+    try:
+        stats = asyncio.run(
+            run_pipeline(
+                iter_archived(archive, url_prefix),
+                fetch=stages.fetch,
+                parse=stages.parse,
+                sinks=[MongoSink(manifest, scraped=False)],
+                parse_workers=max(PIPELINE_PARSE_WORKERS, parse_pool.workers),
+            )
+        )
+    finally:
+        parse_pool.close()
+        archive.close()
+        manifest.close(
+            status="completed" if stats else "failed",
+            mode="replay",
+            archive=path,
+            pipeline=stats.to_dict() if stats else None,
+        )
+        metrics.report_run(
+            run_id=manifest.run_id, mode="replay", pipeline=stats.to_dict() if stats else None
+        )
+    metrics.log_event(
+        "replay_done",
+        f"\n✅ 再パース完了: {stats.summary()}\n"
+        f"   → 新規: {manifest.counts['inserted']}件, 更新: {manifest.counts['modified']}件",
+        inserted=manifest.counts["inserted"],
+        modified=manifest.counts["modified"],
+    )
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="レスポンスアーカイブ（--recordで記録）を現在の抽出処理でパースし直してMongoDBに保存する"
+    )
+    parser.add_argument("--path", default=ARCHIVE_PATH, help="アーカイブファイル")
+    parser.add_argument("--index", default=ARCHIVE_INDEX_PATH, help="索引ファイル")
+    parser.add_argument("--prefix", default="", help="このURLで始まる詳細ページだけを処理する")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=PARSE_PROCESSES,
+        help="パースを行うプロセス数（0でスレッドで実行）",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        replay(args.path, args.index, args.prefix, args.processes)
+    finally:
+        close_clients()
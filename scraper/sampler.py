@@ -0,0 +1,65 @@
+# sampler.py
+from config import LISTING_MIN_REFRESHES, LISTING_TARGET_COVERAGE
+
+
+class CoverageSampler:
+    """
+    ランダム表示されるカードのリフレッシュ結果から、カテゴリーの総レシピ数を推定する
+    （捕獲再捕獲法のSchnabel推定）
+
+    各リフレッシュtで
+    - C_t: 表示されたURL数
+    - M_t: それまでに見たURL数（標識済み個体数）
+    - R_t: 表示されたうち既に見ていたURL数（再捕獲数）
+    として N ≈ Σ(C_t × M_t) / Σ(R_t)
+    推定カバー率（収集済み / 推定総数）が目標に達したら打ち切る
+    """
+
+    def __init__(
+        self,
+        target_coverage: float = LISTING_TARGET_COVERAGE,
+        min_refreshes: int = LISTING_MIN_REFRESHES,
+    ):
+        self.target_coverage = target_coverage
+        self.min_refreshes = min_refreshes
+        self.seen = set()
+        self.refreshes = 0
+        self._sum_cm = 0
+        self._sum_r = 0
+
+    def observe(self, urls) -> int:
+        """1回のリフレッシュで表示されたURLを記録し、新規URL数を返す"""
+        sample = set(u for u in urls if u)
+        recaptured = len(sample & self.seen)
+        self._sum_cm += len(sample) * len(self.seen)
+        self._sum_r += recaptured
+        before = len(self.seen)
+        self.seen |= sample
+        self.refreshes += 1
+        return len(self.seen) - before
+
+    @property
+    def estimated_total(self):
+        """推定総数（再捕獲がまだない場合はNone）"""
+        if self._sum_r == 0:
+            return None
+        return max(len(self.seen), self._sum_cm / self._sum_r)
+
+    @property
+    def coverage(self) -> float:
+        """推定カバー率（0〜1）。推定できない間は0"""
+        total = self.estimated_total
+        if not total:
+            return 0.0
+        return len(self.seen) / total
+
+    def done(self) -> bool:
+        return self.refreshes >= self.min_refreshes and self.coverage >= self.target_coverage
+
+    def report(self) -> str:
+        total = self.estimated_total
+        total_text = f"{total:.0f}" if total is not None else "不明"
+        return (
+            f"収集 {len(self.seen)}件 / 推定総数 {total_text}件"
+            f"（推定カバー率 {self.coverage:.0%}、リフレッシュ {self.refreshes}回）"
+        )
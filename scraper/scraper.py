@@ -1,18 +1,42 @@
+import argparse
+import asyncio
 import os
 import time
-import csv
-import glob
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from dotenv import load_dotenv
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-
-from pymongo import MongoClient
+from archive import ResponseArchive
+from browser import BrowserSession
+from charset import RESOLVER, decode_body, iter_decode
+from config import (
+    IMAGE_PROCESSES,
+    LISTING_MODE,
+    LISTING_REFRESH_MAX,
+    LISTING_WAIT_TIMEOUT,
+    MAX_NEW_PER_CATEGORY,
+    PARSE_PROCESSES,
+    PIPELINE_PARSE_WORKERS,
+)
+from crawl_queue import CrawlQueue, SharedRateLimit
+from extract import PageSections, as_sections, make_soup, read_required
+from fetcher import Fetcher
+from frontier import CatalogCrawler
+from images import ImageSink
+from ingredient_tokens import ensure_index, ingredient_tokens
+from journal import FAILED, FETCHED, PARSED, CrawlJournal, JournalSink, journaled
+from known_urls import KnownUrlIndex
+from listing import CARD_SELECTOR, fetch_listing_urls
+from manifest import ChangeManifest
+import metrics
+from parse_pool import ParsePool
+from pipeline import CsvSink, MongoSink, run_pipeline
+from profiler import RunProfiler
+from quantity import with_quantities
+from sampler import CoverageSampler
+from storage import TOKENS_FIELD, close_clients, get_collection
 
 # 環境変数を読み込む
 load_dotenv()
@@ -40,29 +64,43 @@ CATEGORY_LIST_PAGES = [
 CATEGORY_LIST_PAGES = [urljoin(BASE_URL, u) for u in CATEGORY_LIST_PAGES]
 
 # ========================
-# MongoDB設定
+# ユーティリティ関数
 # ========================
-# MONGODB_URIを優先、なければMONGO_URIを試行（後方互換性のため）
-MONGO_URI = os.getenv("MONGODB_URI") or os.getenv("MONGO_URI")
-if not MONGO_URI:
-    raise ValueError(
-        "MONGODB_URI環境変数が設定されていません。"
-        "Heroku環境変数または.envファイルでMONGODB_URIを設定してください。"
-    )
-DB_NAME = os.getenv("DB_NAME", "recipe")
-COLLECTION_NAME = os.getenv("COLLECTION_NAME", "recipes")
+_fetcher = None
 
 
-# ========================
-# ユーティリティ関数
-# ========================
-def get_soup(url: str) -> BeautifulSoup:
-    """requestsでHTMLを取得してBeautifulSoupオブジェクトを返す"""
-    print(f"[GET] {url}")
-    res = requests.get(url, headers=HEADERS, timeout=15)
-    res.encoding = res.apparent_encoding
+def use_shared_rate_limit():
+    """ワーカーモード: ホストごとのレート制限をcrawl_rate_limits経由で他のワーカーと共有する"""
+    global _fetcher
+    if _fetcher is not None:
+        _fetcher.close()
+    _fetcher = Fetcher(headers=HEADERS, bucket_factory=SharedRateLimit)
+
+
+def get_fetcher() -> Fetcher:
+    """プロセス全体で共有するFetcher（接続プール + レートリミッター）を返す"""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher(headers=HEADERS)
+    return _fetcher
+
+
+def fetch_body(url: str):
+    """共有Fetcher経由でHTMLを取得し、(デコード前のバイト列, Content-Type) を返す"""
+    res = get_fetcher().get(url)
     res.raise_for_status()
-    return BeautifulSoup(res.text, "html.parser")
+    return res.content, res.headers.get("Content-Type")
+
+
+def fetch_html(url: str) -> str:
+    """共有Fetcher経由でHTMLを取得してデコード済みの文字列を返す"""
+    content, content_type = fetch_body(url)
+    return decode_body(content, url, content_type)
+
+
+def get_soup(url: str) -> BeautifulSoup:
+    """共有Fetcher経由でHTMLを取得してBeautifulSoupオブジェクトを返す"""
+    return make_soup(fetch_html(url))
 
 
 def parse_ingredients(soup: BeautifulSoup):
@@ -79,7 +117,7 @@ def parse_ingredients(soup: BeautifulSoup):
       ...
     """
     result = []
-    ul = soup.select_one("ul.menu_material")
+    ul = as_sections(soup).material_ul
     if not ul:
         return result
 
@@ -114,14 +152,8 @@ def parse_cooking_method(soup: BeautifulSoup) -> str:
       ...
     </ul>
     """
-    # "作り方"タイトルを探す
-    h2 = soup.find("h2", class_="tit05", string=lambda text: text and "作り方" in text)
-    if not h2:
-        # 他の形式も試行: h2内に"作り方"テキストが含まれている場合
-        for h in soup.find_all("h2", class_="tit05"):
-            if h.get_text(strip=True) and "作り方" in h.get_text():
-                h2 = h
-                break
+    # "作り方"タイトルを探す（h2内に"作り方"テキストが含まれている形式も含む）
+    h2 = as_sections(soup).tit05_header("作り方")
     
     if not h2:
         return ""
@@ -181,20 +213,8 @@ def get_section_clean(soup: BeautifulSoup, keyword: str) -> str:
     歴史/由来/時季/保存など他の説明が混ざって入ってくるのを
     一部切り取るための簡単なフィルターも含む。
     """
-    header = None
-
-    # まずh3から探す
-    for h in soup.find_all("h3"):
-        if keyword in h.get_text():
-            header = h
-            break
-
-    # なければh4でも試行
-    if not header:
-        for h in soup.find_all("h4"):
-            if keyword in h.get_text():
-                header = h
-                break
+    # まずh3から探し、なければh4でも試行
+    header = as_sections(soup).section_header(keyword)
 
     if not header:
         return ""
@@ -226,160 +246,166 @@ def get_section_clean(soup: BeautifulSoup, keyword: str) -> str:
     return text
 
 
-def collect_top5_from_category(cat_url: str, refresh_max: int = 20):
-    """
-    カテゴリーページでランダムに表示されるレシピを何度もリフレッシュして
-    最大5個まで詳細ページURLを収集
-    """
-    print(f"\n🔹 カテゴリーリスト収集: {cat_url}")
-
-    options = Options()
-    options.add_argument("--headless=new")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--disable-software-rasterizer")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-background-networking")
-    options.add_argument("--disable-background-timer-throttling")
-    options.add_argument("--disable-backgrounding-occluded-windows")
-    options.add_argument("--disable-breakpad")
-    options.add_argument("--disable-client-side-phishing-detection")
-    options.add_argument("--disable-default-apps")
-    options.add_argument("--disable-features=TranslateUI")
-    options.add_argument("--disable-hang-monitor")
-    options.add_argument("--disable-ipc-flooding-protection")
-    options.add_argument("--disable-popup-blocking")
-    options.add_argument("--disable-prompt-on-repost")
-    options.add_argument("--disable-renderer-backgrounding")
-    options.add_argument("--disable-sync")
-    options.add_argument("--disable-translate")
-    options.add_argument("--metrics-recording-only")
-    options.add_argument("--no-first-run")
-    options.add_argument("--safebrowsing-disable-auto-update")
-    options.add_argument("--enable-automation")
-    options.add_argument("--password-store=basic")
-    options.add_argument("--use-mock-keychain")
-    options.add_argument("--window-size=1920,1080")
-    
-    # Heroku環境でのChromeDriverパス設定
-    # heroku-buildpack-chrome-for-testingが設定する環境変数を優先
-    chrome_binary = os.getenv("GOOGLE_CHROME_BIN") or os.getenv("CHROME_BIN")
-    chromedriver_path = os.getenv("CHROMEDRIVER_PATH") or os.getenv("CHROMEDRIVER_BIN")
-    
-    # Heroku buildpackがインストールしたChromeのデフォルトパス
-    # chrome-for-testing buildpackのパスを優先
-    if not chrome_binary:
-        default_chrome_paths = [
-            "/app/.chrome-for-testing/chrome-linux64/chrome",  # chrome-for-testing (直接パス)
-            "/app/.chrome-for-testing/chrome/linux-*/chrome-linux64/chrome",  # chrome-for-testing (glob)
-            "/app/.chromedriver/bin/google-chrome",  # 旧buildpack
-            "/usr/bin/google-chrome",
-        ]
-        for path_pattern in default_chrome_paths:
-            if "*" in path_pattern:
-                # globパターンの場合
-                matches = glob.glob(path_pattern)
-                if matches:
-                    chrome_binary = matches[0]
-                    break
-            elif os.path.exists(path_pattern):
-                chrome_binary = path_pattern
-                break
-    
-    if chrome_binary:
-        options.binary_location = chrome_binary
-        print(f"  🔧 Chrome binary: {chrome_binary}")
-    
-    # Heroku環境でのChromeDriver Service設定
-    # chrome-for-testing buildpackのパスを優先
-    if not chromedriver_path:
-        default_chromedriver_paths = [
-            "/app/.chrome-for-testing/chromedriver-linux64/chromedriver",  # chrome-for-testing (直接パス)
-            "/app/.chrome-for-testing/chromedriver/linux-*/chromedriver-linux64/chromedriver",  # chrome-for-testing (glob)
-            "/app/.chromedriver/bin/chromedriver",  # 旧buildpack
-            "/usr/local/bin/chromedriver",
-            "/app/vendor/chromedriver/bin/chromedriver",
-        ]
-        for path_pattern in default_chromedriver_paths:
-            if "*" in path_pattern:
-                # globパターンの場合
-                matches = glob.glob(path_pattern)
-                if matches:
-                    chromedriver_path = matches[0]
-                    print(f"  🔍 Found ChromeDriver at: {chromedriver_path}")
-                    break
-            elif os.path.exists(path_pattern):
-                chromedriver_path = path_pattern
-                print(f"  🔍 Found ChromeDriver at: {chromedriver_path}")
-                break
-    
-    if chromedriver_path and os.path.exists(chromedriver_path):
-        service = Service(chromedriver_path)
-        print(f"  🔧 Using ChromeDriver: {chromedriver_path}")
-        try:
-            driver = webdriver.Chrome(service=service, options=options)
-        except Exception as e:
-            print(f"  ❌ Failed to start Chrome with Service: {e}")
-            print("  ⚠️  Falling back to default ChromeDriver")
-            driver = webdriver.Chrome(options=options)
-    else:
-        # ローカル環境ではデフォルトのChromeDriverを使用
-        print("  ⚠️  ChromeDriver path not found, using default")
-        print("  💡 Make sure Chrome buildpacks are added to Heroku")
-        try:
-            driver = webdriver.Chrome(options=options)
-        except Exception as e:
-            print(f"  ❌ Failed to start Chrome: {e}")
-            raise
+def collect_top5_from_category(
+    cat_url: str, refresh_max: int = LISTING_REFRESH_MAX, session: BrowserSession = None
+):
+    """
+    カテゴリーページでランダムに表示されるレシピを何度もリフレッシュして詳細ページURLを収集
+    固定の待機時間ではなくカードの描画を待ち、新規URLの出現率からカテゴリーの総数を推定して
+    推定カバー率がLISTING_TARGET_COVERAGEに達した時点で打ち切る（refresh_maxは安全上の上限）
+    sessionを渡すと起動済みChromeのタブを1つ借りて使う（渡さない場合は単独で起動・終了）
+    """
+    metrics.log_event("listing_category_start", f"\n🔹 カテゴリーリスト収集: {cat_url}", url=cat_url)
 
-    urls = set()
-    no_new = 0
+    if session is None:
+        with BrowserSession(max_tabs=1) as own_session:
+            return collect_top5_from_category(cat_url, refresh_max, own_session)
 
-    try:
-        for i in range(refresh_max):
-            driver.get(cat_url)
-            time.sleep(2)
+    sampler = CoverageSampler()
+    name = cat_url.split("/")[-1]
+    total_bytes = 0
 
-            sections = driver.find_elements(By.CSS_SELECTOR, "div[id^='SearchMenu']")
-            if not sections:
-                print("  [WARN] SearchMenuセクションが見つかりません")
+    with session.tab() as tab:
+        for i in range(refresh_max):
+            started = time.perf_counter()
+            tab.load(cat_url)
+            if not tab.wait_for(CARD_SELECTOR, timeout=LISTING_WAIT_TIMEOUT):
+                metrics.inc("listing_refresh_timeouts_total", category=name)
+                metrics.log_event(
+                    "listing_refresh_timeout",
+                    "  [WARN] SearchMenuセクションが見つかりません",
+                    category=name,
+                    refresh=i + 1,
+                )
                 break
 
-            sec_id = sections[0].get_attribute("id")
-
-            cards = driver.find_elements(
-                By.CSS_SELECTOR, f"div#{sec_id} div.list p.tit a[href]"
+            section_ids = tab.attrs("div[id^='SearchMenu']", "id")
+            sec_id = section_ids[0]
+
+            hrefs = tab.attrs(f"div#{sec_id} div.list p.tit a[href]", "href")
+
+            added = sampler.observe(hrefs)
+            page_bytes = tab.transferred_bytes()
+            total_bytes += page_bytes
+            elapsed = time.perf_counter() - started
+            metrics.observe("listing_refresh_seconds", elapsed, category=name)
+            metrics.inc("listing_refresh_bytes_total", page_bytes, category=name)
+            metrics.log_event(
+                "listing_refresh",
+                f"  ↺ {name} {i+1}回リフレッシュ: +{added}個（累計 {len(sampler.seen)}個）"
+                f" {page_bytes / 1024:.1f}KB",
+                category=name,
+                refresh=i + 1,
+                added=added,
+                seen=len(sampler.seen),
+                bytes=page_bytes,
+                seconds=round(elapsed, 4),
             )
 
-            before = len(urls)
-            for c in cards:
-                href = c.get_attribute("href")
-                if href:
-                    urls.add(href)
-
-            added = len(urls) - before
-            print(f"  ↺ {i+1}回リフレッシュ: +{added}個（累計 {len(urls)}個）")
-
-            if added == 0:
-                no_new += 1
-            else:
-                no_new = 0
-
-            if no_new >= 3:
-                print("  ✅ 新しいURLがもうないため終了")
+            if sampler.done():
+                metrics.log_event(
+                    "listing_coverage_reached",
+                    "  ✅ 目標カバー率に達したため終了",
+                    category=name,
+                    refresh=i + 1,
+                )
                 break
 
-            if len(urls) >= 5:
-                print("  ✅ 5個以上収集完了")
-                break
+    message = f"  📈 {name}: {sampler.report()}"
+    if sampler.refreshes:
+        message += (
+            f"\n  📦 {name}: 転送量 平均{total_bytes / sampler.refreshes / 1024:.1f}KB/リフレッシュ"
+            f"（リソースブロック: {'有効' if session.block_resources else '無効'}）"
+        )
+    metrics.log_event(
+        "listing_category_done",
+        message,
+        category=name,
+        refreshes=sampler.refreshes,
+        seen=len(sampler.seen),
+        estimated_total=sampler.estimated_total,
+        coverage=round(sampler.coverage, 4),
+        bytes=total_bytes,
+        block_resources=session.block_resources,
+    )
+    return list(sampler.seen)
 
-    finally:
-        driver.quit()
 
-    urls = list(urls)[:5]
-    print(f"  ➤ 最終選択されたURL {len(urls)}個")
-    return urls
+def collect_all_categories(cat_urls: list, refresh_max: int = LISTING_REFRESH_MAX) -> dict:
+    """
+    Chromeを1回だけ起動し、全カテゴリーのリフレッシュ処理を別タブで並行実行
+    同時実行数はBROWSER_MAX_TABSで制限
+    返り値: {カテゴリーURL: [詳細ページURL, ...]}
+    """
+    results = {}
+    with BrowserSession() as session:
+        with ThreadPoolExecutor(max_workers=session.max_tabs) as ex:
+            futures = {
+                ex.submit(collect_top5_from_category, url, refresh_max, session): url
+                for url in cat_urls
+            }
+            for fut, url in futures.items():
+                try:
+                    results[url] = fut.result()
+                except Exception as e:
+                    metrics.log_event(
+                        "listing_error",
+                        f"  ❌ エラー: {url} のリスト収集に失敗: {e}",
+                        url=url,
+                        mode="selenium",
+                        error=repr(e),
+                    )
+                    results[url] = []
+    return results
+
+
+def collect_listings(
+    cat_urls: list, mode: str = LISTING_MODE, refresh_max: int = LISTING_REFRESH_MAX
+) -> dict:
+    """
+    全カテゴリーの候補URLを収集
+    - http: カテゴリーページ（と読み込まれるデータファイル）をHTTPで1回取得して全候補を抽出
+    - selenium: Chromeでリフレッシュを繰り返して表示中のカードを収集
+    - auto: httpで試し、候補が取れなかったカテゴリーだけSeleniumにフォールバック
+    返り値: {カテゴリーURL: [詳細ページURL, ...]}
+    """
+    results = {}
+    if mode in ("http", "auto"):
+        for url, links, err in get_fetcher().map(
+            lambda u: fetch_listing_urls(u, get_fetcher()), cat_urls
+        ):
+            if err is not None:
+                metrics.log_event(
+                    "listing_error",
+                    f"  ⚠️  HTTPリスト収集に失敗: {url}: {err}",
+                    url=url,
+                    mode="http",
+                    error=repr(err),
+                )
+                links = []
+            metrics.inc("listing_candidates_total", len(links), mode="http")
+            metrics.log_event(
+                "listing_candidates",
+                f"  📄 {url.split('/')[-1]}: HTTPで{len(links)}個の候補を取得",
+                url=url,
+                mode="http",
+                candidates=len(links),
+            )
+            results[url] = links
+
+    if mode == "http":
+        return {url: results.get(url, []) for url in cat_urls}
+
+    fallback = [url for url in cat_urls if not results.get(url)]
+    if fallback:
+        if mode == "auto":
+            metrics.log_event(
+                "listing_fallback",
+                f"  🌐 {len(fallback)}カテゴリーをSeleniumで収集します",
+                categories=len(fallback),
+            )
+        results.update(collect_all_categories(fallback, refresh_max=refresh_max))
+    return {url: results.get(url, []) for url in cat_urls}
 
 
 def scrape_detail_page(url: str) -> dict:
@@ -390,32 +416,87 @@ def scrape_detail_page(url: str) -> dict:
     - main_ingredients (主な使用食材セクションテキスト)
     - eating_method (飲食方法セクションテキスト)
     - cooking_method (作り方セクションテキスト) - 新規追加
-    - ingredients (材料 + 分量リスト)
+    - ingredients (材料 + 分量リスト、分量は構造化したquantity付き)
+    - ingredientTokens (材料名の検索用トークン)
     - detailUrl (ページURL)
     """
-    print(f"[GET 詳細] {url}")
-    soup = get_soup(url)
+    return parse_detail_html(fetch_html(url), url)
+
+
+def parse_detail_measured(content: bytes, url: str, content_type: str = None):
+    """
+    パース用プロセスプールで実行: レコードと、ワーカー内で記録したメトリクスを返す
+    （ワーカープロセスのメトリクスは親プロセスでMETRICS.merge()する）
+    """
+    with metrics.capture() as ops:
+        data = parse_detail_bytes(content, url, content_type)
+    return data, ops
+
+
+def read_detail_sections(content: bytes, url: str, content_type: str = None) -> str:
+    """
+    本文を先頭から少しずつデコードして逐次パーサーに流し、
+    抽出に使うセクションがすべて閉じた時点で打ち切ったHTMLを返す
+    （文字コードはBOM・ヘッダー・meta・ホストごとのキャッシュの順に決め、推定は最後の手段）
+    """
+    with metrics.timer("parse_seconds", extractor="incremental"):
+        html, truncated = RESOLVER.apply(
+            lambda encoding, errors: read_required(
+                iter_decode(content, encoding, errors),
+                ("主な使用食材", "飲食方法"),
+                "作り方",
+            ),
+            url,
+            content,
+            content_type,
+        )
+    metrics.inc("parse_truncated_total" if truncated else "parse_full_total")
+    return html
+
+
+def parse_detail_bytes(content: bytes, url: str, content_type: str = None) -> dict:
+    """
+    生のレスポンスバイト列からレコードを抽出（パース用プロセスプールで実行）
+    引数・返り値ともプレーンな値だけなのでプロセス間で受け渡しできる
+    """
+    return parse_detail_html(read_detail_sections(content, url, content_type), url)
+
+
+def parse_detail_html(html: str, url: str) -> dict:
+    """取得済みの詳細ページHTMLからレコードを抽出（項目はscrape_detail_pageと同じ）"""
+    # 見出し→セクションの対応表を1回の走査で作り、各抽出関数で共有
+    with metrics.timer("parse_seconds", extractor="make_soup"):
+        soup = make_soup(html)
+    with metrics.timer("parse_seconds", extractor="sections"):
+        sections = PageSections(soup)
 
     # タイトル
-    title_span = soup.select_one("span.name")
+    title_span = sections.title_span
     title = title_span.get_text(strip=True) if title_span else ""
 
     # メイン画像
-    img_tag = soup.select_one("div.menu_main img.resp_img")
+    img_tag = sections.main_image
     if img_tag and img_tag.get("src"):
         main_image = urljoin(url, img_tag["src"])
     else:
         main_image = ""
 
     # 主な使用食材 / 飲食方法
-    main_ingredients = get_section_clean(soup, "主な使用食材")
-    eating_method = get_section_clean(soup, "飲食方法")
+    with metrics.timer("parse_seconds", extractor="get_section_clean"):
+        main_ingredients = get_section_clean(sections, "主な使用食材")
+        eating_method = get_section_clean(sections, "飲食方法")
 
     # 作り方
-    cooking_method = parse_cooking_method(soup)
+    with metrics.timer("parse_seconds", extractor="parse_cooking_method"):
+        cooking_method = parse_cooking_method(sections)
 
     # 材料 + 分量
-    ingredients = parse_ingredients(soup)
+    with metrics.timer("parse_seconds", extractor="parse_ingredients"):
+        ingredients = parse_ingredients(sections)
+
+    # 分量を構造化（取り込み時に1回だけ解析し、amountの文字列と並べて保存）
+    with metrics.timer("parse_seconds", extractor="parse_quantities"):
+        ingredients = with_quantities(ingredients)
 
     return {
         "title": title,
@@ -424,183 +505,462 @@ def scrape_detail_page(url: str) -> dict:
         "eating_method": eating_method,
         "cooking_method": cooking_method,  # 新規追加
         "ingredients": ingredients,  # DBに配列として保存
+        # 材料検索用（正規化済みトークン、マルチキーインデックス）
+        TOKENS_FIELD: ingredient_tokens(main_ingredients, ingredients),
         "detailUrl": url,
     }
 
 
 # ========================
-# DB保存
+# メイン実行
 # ========================
-def save_to_mongo(rows):
-    """
-    MongoDBにupsertで保存
-    - key: detailUrl
-    - 重複の場合はscrapeCount増加 + データ更新
-    """
-    if not rows:
-        return
+CSV_FILE = "maff_recipe_top5_each_category.csv"
+CSV_KEYS = [
+    "title",
+    "main_image",
+    "main_ingredients",
+    "eating_method",
+    "cooking_method",  # 新規追加
+    "ingredients",   # 材料+分量を文字列に変換して入れる
+    "detailUrl",
+    "category",
+]
 
-    client = MongoClient(
-        MONGO_URI,
-        serverSelectionTimeoutMS=30000,  # 30秒でタイムアウト
-        connectTimeoutMS=30000,
-    )
-    db = client[DB_NAME]
-    col = db[COLLECTION_NAME]
-
-    count = 0
-    for doc in rows:
-        col.update_one(
-            {"detailUrl": doc["detailUrl"]},
-            {
-                "$set": doc,
-                "$inc": {"scrapeCount": 1},
-                "$setOnInsert": {"createdAt": time.time()},
-            },
-            upsert=True,
-        )
-        count += 1
 
-    client.close()
-    print(f"💾 MongoDB保存/更新完了: {count}件")
+def _csv_row(row: dict, out: dict) -> dict:
+    # ingredientsはリスト → 文字列に変換
+    out["ingredients"] = ingredients_to_string(row.get("ingredients", []))
+    return out
 
 
-# ========================
-# メイン実行
-# ========================
-def check_existing_recipes(urls: list) -> set:
-    """
-    MongoDBに既に存在するレシピのURLを確認
-    返り値: 既存のURLのセット
-    """
-    if not urls:
-        return set()
-    
+def load_known_urls() -> KnownUrlIndex:
+    """登録済みURLの索引を読み込む（失敗した場合は空の索引で続行）"""
     try:
-        client = MongoClient(
-            MONGO_URI,
-            serverSelectionTimeoutMS=10000,  # 10秒でタイムアウト
-            connectTimeoutMS=10000,
-        )
-        db = client[DB_NAME]
-        col = db[COLLECTION_NAME]
-        
-        existing = col.find(
-            {"detailUrl": {"$in": urls}},
-            {"detailUrl": 1}
-        )
-        existing_urls = {doc["detailUrl"] for doc in existing}
-        
-        client.close()
-        return existing_urls
+        return KnownUrlIndex.load()
     except Exception as e:
-        print(f"⚠️  既存レシピ確認中にエラー: {e}")
-        return set()
+        metrics.log_event(
+            "known_urls_error", f"⚠️  既存レシピ確認中にエラー: {e}", error=repr(e)
+        )
+        return KnownUrlIndex()
+
 
+class ListingSummary:
+    """リスト収集ステージの集計（新規/既存件数）"""
 
-def main():
-    all_rows = []
-    total_new_count = 0
-    total_existing_count = 0
-    no_new_data_categories = 0
+    def __init__(self):
+        self.new = 0
+        self.existing = 0
+        self.no_new_data_categories = 0
 
-    print("=" * 60)
-    print("🚀 スクレイピング開始")
-    print("=" * 60)
 
-    for cat_url in CATEGORY_LIST_PAGES:
+async def iter_new_links(cat_urls: list, summary: ListingSummary):
+    """
+    リスト収集ステージ: 各カテゴリーの新規URLを (meta, url) として順に流す
+    既存レシピの確認はカテゴリーごとにスレッドで実行
+    """
+    # 全カテゴリーの候補URLを収集（HTTP優先、必要な場合のみChrome）
+    listings = await asyncio.to_thread(collect_listings, cat_urls)
+    known = await asyncio.to_thread(load_known_urls)
+
+    for cat_url in cat_urls:
         category_name = cat_url.split("/")[-1].replace(".html", "")  # rice, soupなど
-        print(f"\n📂 カテゴリー: {category_name}")
-        
-        # カテゴリーページからURLを収集
-        links = collect_top5_from_category(cat_url, refresh_max=20)
-        
+        links = listings.get(cat_url, [])
+
         if not links:
-            print(f"  ⚠️  {category_name}カテゴリーからURLが見つかりませんでした")
-            no_new_data_categories += 1
+            metrics.log_event(
+                "category_links",
+                f"\n📂 カテゴリー: {category_name}\n"
+                f"  ⚠️  {category_name}カテゴリーからURLが見つかりませんでした",
+                category=category_name,
+                links=0,
+                new=0,
+                existing=0,
+            )
+            summary.no_new_data_categories += 1
             continue
 
-        # 既存のレシピを確認
-        existing_urls = check_existing_recipes(links)
+        # 既存のレシピを確認（ローカルの既知URL索引で判定）
+        existing_urls = known.known(links)
         new_links = [link for link in links if link not in existing_urls]
-        
-        print(f"  📊 収集URL: {len(links)}個")
-        print(f"  ✅ 新規URL: {len(new_links)}個")
-        print(f"  🔄 既存URL: {len(existing_urls)}個")
+        # 1回の実行でスクレイピングする新規レシピ数の上限
+        new_links = new_links[:MAX_NEW_PER_CATEGORY]
+
+        message = (
+            f"\n📂 カテゴリー: {category_name}\n"
+            f"  📊 収集URL: {len(links)}個\n"
+            f"  ✅ 新規URL: {len(new_links)}個\n"
+            f"  🔄 既存URL: {len(existing_urls)}個"
+        )
+        if not new_links:
+            message += f"\n  ⏸️  {category_name}カテゴリーには新しいデータがありません。スキップします。"
+        metrics.log_event(
+            "category_links",
+            message,
+            category=category_name,
+            links=len(links),
+            new=len(new_links),
+            existing=len(existing_urls),
+        )
+        summary.existing += len(existing_urls)
 
         # 新しいデータがない場合
         if not new_links:
-            print(f"  ⏸️  {category_name}カテゴリーには新しいデータがありません。スキップします。")
-            no_new_data_categories += 1
-            total_existing_count += len(existing_urls)
-            
-            # すべてのカテゴリーで新しいデータがない場合、早期終了
-            if no_new_data_categories >= len(CATEGORY_LIST_PAGES):
-                print("\n" + "=" * 60)
-                print("⏹️  すべてのカテゴリーで新しいデータがありません。")
-                print("   スクレイピングを終了します。")
-                print("=" * 60)
-                return
+            summary.no_new_data_categories += 1
             continue
 
-        # 新しいレシピをスクレイピング
-        category_new_count = 0
+        summary.new += len(new_links)
         for link in new_links:
-            try:
-                data = scrape_detail_page(link)
-                data["category"] = category_name
-                all_rows.append(data)
-                category_new_count += 1
-                total_new_count += 1
-                time.sleep(1)
-            except Exception as e:
-                print(f"  ❌ エラー: {link} のスクレイピングに失敗: {e}")
+            yield {"url": link, "category": category_name}, link
+
+
+async def iter_crawl_links(cat_urls: list, summary: ListingSummary, chunk_size: int = 100):
+    """
+    クロールモードのリスト収集ステージ
+    カテゴリーページと、そこからリンクされた一覧ページをたどって見つけた
+    全詳細ページのうち、未登録のものを (meta, url) として流す
+    """
+    crawler = CatalogCrawler(fetch_html)
+    found = crawler.iter_detail_urls(cat_urls)
+    known = await asyncio.to_thread(load_known_urls)
+
+    while True:
+        chunk = await asyncio.to_thread(lambda: list(islice(found, chunk_size)))
+        if not chunk:
+            break
+        existing_urls = known.known([url for url, _ in chunk])
+        summary.existing += len(existing_urls)
+        for url, category in chunk:
+            if url in existing_urls:
                 continue
+            summary.new += 1
+            yield {"url": url, "category": category}, url
+
+    metrics.log_event(
+        "crawl_done",
+        f"  🕸  クロール完了: 一覧ページ {crawler.index_pages}件、"
+        f"詳細ページ {len(crawler.details)}件（新規 {summary.new}件）",
+        index_pages=crawler.index_pages,
+        details=len(crawler.details),
+        new=summary.new,
+    )
 
-        total_existing_count += len(existing_urls)
-        print(f"  ✅ {category_name}カテゴリー: 新規 {category_new_count}件を追加")
 
-    # 新しいデータがない場合
-    if not all_rows:
-        print("\n" + "=" * 60)
-        print("⏹️  新しいデータがありませんでした。")
-        print(f"   既存レシピ: {total_existing_count}件")
-        print("   スクレイピングを終了します。")
-        print("=" * 60)
+def listing_source(crawl: bool, summary: ListingSummary):
+    """モードに応じたリスト収集ステージ（未登録の詳細ページを (meta, url) で流す）"""
+    if crawl:
+        return iter_crawl_links(CATEGORY_LIST_PAGES, summary)
+    return iter_new_links(CATEGORY_LIST_PAGES, summary)
+
+
+async def _enqueue(queue: CrawlQueue, crawl: bool, batch_size: int = 500) -> int:
+    summary = ListingSummary()
+    added = 0
+    batch = []
+    async for meta, url in listing_source(crawl, summary):
+        batch.append((url, meta.get("category")))
+        if len(batch) >= batch_size:
+            added += await asyncio.to_thread(queue.enqueue, batch)
+            batch = []
+    if batch:
+        added += await asyncio.to_thread(queue.enqueue, batch)
+    return added
+
+
+def enqueue_links(crawl: bool = False) -> int:
+    """
+    リスト収集だけを行い、未登録の詳細ページをcrawl_queueに登録する（取得は--workerが行う）
+    返り値: 新しく登録（または完了済みから再登録）した件数
+    """
+    queue = CrawlQueue()
+    metrics.log_event(
+        "enqueue_started",
+        "=" * 60
+        + "\n📥 キューへの登録開始"
+        + ("（全件クロールモード）" if crawl else "")
+        + "\n"
+        + "=" * 60,
+        crawl=crawl,
+    )
+    added = asyncio.run(_enqueue(queue, crawl))
+    counts = queue.counts()
+    metrics.log_event(
+        "enqueue_done",
+        f"\n✅ crawl_queueに登録: {added}件\n   → 状態: {counts}",
+        enqueued=added,
+        queue=counts,
+    )
+    metrics.report_run(mode="enqueue", crawl=crawl, enqueued=added)
+    return added
+
+
+class DetailStages:
+    """
+    詳細ページの取得・パースステージ
+    各URLの進行状況（fetched / parsed / failed）をジャーナルに記録する
+    ジャーナルにパース済みレコードが残っているURL（再開時）は取得・パースを省略
+    """
+
+    def __init__(self, journal: CrawlJournal, parse_pool: ParsePool):
+        self.journal = journal
+        self.parse_pool = parse_pool
+
+    def fetch(self, url: str, meta: dict):
+        if meta.get("record"):
+            return None
+        try:
+            body = fetch_body(url)
+        except Exception as e:
+            self.journal.mark(url, FAILED, error=repr(e))
+            raise
+        self.journal.mark(url, FETCHED)
+        return body
+
+    async def parse(self, body, meta: dict) -> dict:
+        if meta.get("record"):
+            return meta["record"]
+        try:
+            # 文字コード判定とHTML抽出はプロセスプールで実行
+            content, content_type = body
+            data, ops = await self.parse_pool.parse(content, meta["url"], content_type)
+        except Exception as e:
+            self.journal.mark(meta["url"], FAILED, error=repr(e))
+            raise
+        metrics.METRICS.merge(ops)
+        # クロールモードでカテゴリーが分からない場合は既存の値を上書きしない
+        if meta.get("category"):
+            data["category"] = meta["category"]
+        self.journal.mark(meta["url"], PARSED, record=data)
+        return data
+
+
+def main(
+    crawl: bool = False,
+    resume: bool = False,
+    profile: bool = False,
+    enqueue: bool = False,
+    worker: bool = False,
+    record: bool = False,
+):
+    """
+    crawl=False: 各カテゴリーから新規レシピを最大MAX_NEW_PER_CATEGORY件ずつ取得
+    crawl=True: カテゴリーページから到達できる全レシピを列挙し、未登録分をすべて取得
+    resume=True: ジャーナルに残っている前回の未完了分から再開（モードも前回に合わせる）
+    profile=True: 実行全体をプロファイルし、ステージごとの結果をCSVと同じ場所に書き出す
+    enqueue=True: 取得はせず、crawlに応じた未登録URLをcrawl_queueに登録するだけ
+    worker=True: crawl_queueからURLを取り出して処理する（複数のプロセス・dynoで同時に実行できる）
+    record=True: 受け取ったレスポンスをすべてARCHIVE_PATHに記録する（replay.pyで再パースに使う）
+    """
+    if enqueue:
+        enqueue_links(crawl)
+        return
+    if profile:
+        profiler = RunProfiler().start()
+        try:
+            _run(crawl, resume, parse_processes=0, worker=worker, record=record)
+        finally:
+            profiler.stop()
+            base = os.path.splitext(CSV_FILE)[0] + ".profile"
+            paths = profiler.write(base)
+            metrics.log_event(
+                "profile_written",
+                "".join(f"   → プロファイル: {path}\n" for path in paths)
+                + f"   → ステージ別: {profiler.report()}",
+                paths=paths,
+            )
         return
+    _run(crawl, resume, worker=worker, record=record)
 
-    # DB保存
-    print(f"\n🔥 合計 {len(all_rows)}件の新規データをDBにupsert")
-    save_to_mongo(all_rows)
-
-    # CSVバックアップ生成
-    file = "maff_recipe_top5_each_category.csv"
-    keys = [
-        "title",
-        "main_image",
-        "main_ingredients",
-        "eating_method",
-        "cooking_method",  # 新規追加
-        "ingredients",   # 材料+分量を文字列に変換して入れる
-        "detailUrl",
-        "category",
+
+def _run(
+    crawl: bool,
+    resume: bool,
+    parse_processes: int = PARSE_PROCESSES,
+    worker: bool = False,
+    record: bool = False,
+):
+    """
+    mainの本体
+    parse_processes=0ではパースをプロセスではなくスレッドで実行する
+    （プロファイル時は全ステージを同じプロセス内で採取するため）
+    worker=Trueではcrawl_queueからURLを取り出して処理する（進行状況はジャーナルの代わりにキューに記録）
+    record=Trueではリスト・詳細ページの生のレスポンスをアーカイブに記録する
+    """
+    if worker:
+        use_shared_rate_limit()
+        journal = CrawlQueue()
+        mode = "worker"
+        resume = False
+    else:
+        journal = CrawlJournal()
+        if resume and journal.get_meta("mode"):
+            crawl = journal.get_meta("mode") == "crawl"
+        else:
+            if resume:
+                metrics.log_event(
+                    "resume_unavailable", "  ⚠️  再開できるジャーナルがないため、最初から実行します"
+                )
+            resume = False
+            journal.start("crawl" if crawl else "top")
+        mode = "crawl" if crawl else "top"
+
+    if worker:
+        title = f"🚀 スクレイピング開始（ワーカーモード: {journal.owner}）"
+    else:
+        title = "🚀 スクレイピング開始" + ("（全件クロールモード）" if crawl else "")
+    metrics.log_event(
+        "run_started", "=" * 60 + f"\n{title}\n" + "=" * 60, mode=mode, resume=resume
+    )
+
+    archive = ResponseArchive() if record else None
+    if archive is not None:
+        get_fetcher().archive = archive
+        metrics.log_event("archive_recording", f"🗂  レスポンスを記録: {archive.path}", path=archive.path)
+
+    try:
+        ensure_index(get_collection())
+    except Exception as e:
+        metrics.log_event(
+            "ensure_index_error",
+            f"⚠️  ingredientTokensのインデックス作成に失敗: {e}",
+            error=repr(e),
+        )
+
+    # listing → fetch → parse → sink を上限付きキューでつなぎ、
+    # MongoDB / CSVには数秒ごとのマイクロバッチで逐次書き出す
+    summary = ListingSummary()
+    if worker:
+        # 処理中のURLのリースを延長し続ける（落ちたワーカーのURLは他のワーカーが取り直す）
+        journal.start_heartbeat()
+        source = journal.iter_claimed()
+    else:
+        source = journaled(listing_source(crawl, summary), journal, resume)
+    # 再開時はCSVを上書きせず追記
+    manifest = ChangeManifest()
+    store = MongoSink(manifest)
+    sinks = [
+        store,
+        # プロファイル時は画像のサムネイル作成も同じプロセス内で行う
+        ImageSink(get_fetcher(), processes=IMAGE_PROCESSES if parse_processes else 0),
+        CsvSink(CSV_FILE, CSV_KEYS, row_formatter=_csv_row, append=resume),
+        # MongoDBへの書き込みに失敗した行はstoredにしない
+        JournalSink(journal, store),
     ]
+    parse_pool = ParsePool(parse_detail_measured, workers=parse_processes)
+    stages = DetailStages(journal, parse_pool)
+    stats = None
+    try:
+        stats = asyncio.run(
+            run_pipeline(
+                source,
+                fetch=stages.fetch,
+                parse=stages.parse,
+                sinks=sinks,
+                # プロセス数ぶんのパースを同時に投入して全コアを使う
+                parse_workers=max(PIPELINE_PARSE_WORKERS, parse_pool.workers),
+            )
+        )
+    finally:
+        parse_pool.close()
+        journal.close()
+        if archive is not None:
+            get_fetcher().archive = None
+            archive.close()
+        # 新規・内容が変わったレシピの一覧（キャッシュの無効化用）をJSONLに、件数をscrape_runsに保存
+        manifest.close(
+            status="completed" if stats else "failed",
+            mode=mode,
+            resume=resume,
+            pipeline=stats.to_dict() if stats else None,
+        )
+        # 実行サマリー（ステージごとのヒストグラム付き）を構造化ログ・Prometheus形式で出力
+        metrics.report_run(
+            run_id=manifest.run_id,
+            mode=mode,
+            resume=resume,
+            pipeline=stats.to_dict() if stats else None,
+        )
+
+    if worker:
+        counts = journal.counts()
+        metrics.log_event("crawl_queue_counts", f"📋 crawl_queue: {counts}", queue=counts)
+
+    # 新しいデータがない場合
+    if stats.stored == 0:
+        if summary.no_new_data_categories >= len(CATEGORY_LIST_PAGES):
+            reason = "⏹️  すべてのカテゴリーで新しいデータがありません。"
+        else:
+            reason = "⏹️  新しいデータがありませんでした。"
+        metrics.log_event(
+            "run_no_new_data",
+            "\n" + "=" * 60 + f"\n{reason}\n"
+            f"   既存レシピ: {summary.existing}件\n"
+            "   スクレイピングを終了します。\n" + "=" * 60,
+            existing=summary.existing,
+        )
+        return
+
+    metrics.log_event(
+        "run_done",
+        "\n✅ スクレイピング + DB保存 + CSVバックアップ完了!\n"
+        f"   → 新規データ: {stats.stored}件\n"
+        f"   → 既存データ: {summary.existing}件\n"
+        f"   → CSVファイル: {CSV_FILE}\n"
+        f"   → パイプライン: {stats.summary()}\n" + "=" * 60,
+        stored=stats.stored,
+        existing=summary.existing,
+        csv=CSV_FILE,
+    )
 
-    with open(file, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=keys)
-        writer.writeheader()
-        for row in all_rows:
-            out = {k: row.get(k, "") for k in keys}
-            # ingredientsはリスト → 文字列に変換
-            out["ingredients"] = ingredients_to_string(row.get("ingredients", []))
-            writer.writerow(out)
 
-    print(f"\n✅ スクレイピング + DB保存 + CSVバックアップ完了!")
-    print(f"   → 新規データ: {len(all_rows)}件")
-    print(f"   → 既存データ: {total_existing_count}件")
-    print(f"   → CSVファイル: {file}")
-    print("=" * 60)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="日本全国郷土料理レシピのスクレイピング")
+    parser.add_argument(
+        "--crawl",
+        action="store_true",
+        help="カテゴリー・一覧ページから到達できる全レシピを取得する（初回の一括取得用）",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="クロールジャーナルに残っている前回の未完了分から再開する",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="実行全体をプロファイルし、listing / fetch / parse / store別のフレームグラフと"
+        "メモリ使用量をCSVと同じ場所に書き出す",
+    )
+    parser.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="リスト収集だけを行い、未登録のレシピURLをcrawl_queueに登録する（--crawlと併用可）",
+    )
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help="受け取ったレスポンスをすべてARCHIVE_PATH（WARC形式）に記録する（replay.pyで再パース）",
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="crawl_queueからURLを取り出して取得・保存する（複数のプロセス・dynoで同時に実行できる）",
+    )
+    args = parser.parse_args(argv)
+    if args.worker and (args.enqueue or args.resume):
+        parser.error("--workerは--enqueue / --resumeと同時に指定できません")
+    return args
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    try:
+        main(
+            crawl=args.crawl,
+            resume=args.resume,
+            profile=args.profile,
+            enqueue=args.enqueue,
+            worker=args.worker,
+            record=args.record,
+        )
+    finally:
+        close_clients()
@@ -0,0 +1,434 @@
+# storage.py
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import (
+    COLLECTION_NAME,
+    DB_NAME,
+    MONGO_BATCH_SIZE,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_URI,
+)
+from fingerprint import content_hash
+import metrics
+
+# 材料名の検索用トークンのフィールド（ingredient_tokens.pyで作成、ingredient_indexの差分更新に使う）
+TOKENS_FIELD = "ingredientTokens"
+
+# プロセス全体で共有するクライアント（プログラム開始～終了まで1つだけ使用）
+_client = None
+_async_client = None
+
+
+def _require_uri() -> str:
+    if not MONGO_URI:
+        raise ValueError(
+            "MONGODB_URI環境変数が設定されていません。"
+            "Heroku環境変数または.envファイルでMONGODB_URIを設定してください。"
+        )
+    return MONGO_URI
+
+
+def get_client() -> MongoClient:
+    """同期クライアント（コネクションプール付き）を返す"""
+    global _client
+    if _client is None:
+        _client = MongoClient(
+            _require_uri(),
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=30000,  # 30秒でタイムアウト
+            connectTimeoutMS=30000,
+        )
+    return _client
+
+
+def get_collection(name: str = COLLECTION_NAME):
+    return get_client()[DB_NAME][name]
+
+
+def get_async_client() -> AsyncIOMotorClient:
+    """非同期（Motor）クライアントを返す"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncIOMotorClient(
+            _require_uri(),
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            serverSelectionTimeoutMS=30000,
+            connectTimeoutMS=30000,
+        )
+    return _async_client
+
+
+def get_async_collection(name: str = COLLECTION_NAME):
+    return get_async_client()[DB_NAME][name]
+
+
+def close_clients():
+    """プログラム終了時にクライアントを閉じる"""
+    global _client, _async_client
+    if _client is not None:
+        _client.close()
+        _client = None
+    if _async_client is not None:
+        _async_client.close()
+        _async_client = None
+
+
+def _chunks(rows: list, size: int):
+    size = max(1, size)
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def _build_ops(rows: list, stored: dict, scraped: bool = True):
+    """
+    upsert用のUpdateOneリストを作る
+    内容ハッシュ（contentHash）が保存済みと同じ行はscrapeCountの増加のみ
+    （categoryはハッシュに含めないので、保存済みと違う場合だけ書き換える）
+    scraped=False（取得せずに作り直した行）ではscrapeCountを増やさず、内容が同じ行は書き込まない
+    返り値: (ops, opsの位置ごとのdetailUrl, 内容変更なしの件数,
+            {opsの位置: ingredient_indexの差分（新旧の材料トークンとカテゴリー）},
+            {opsの位置: 変更マニフェストのエントリ（新規の_idは書き込み後に埋める）})
+    """
+    ops = []
+    urls = []
+    unchanged = 0
+    postings = {}
+    changes = {}
+    now = time.time()
+    inc = {"$inc": {"scrapeCount": 1}} if scraped else {}
+    for r in rows:
+        digest = content_hash(r)
+        old = stored.get(r["detailUrl"]) or {}
+        if old.get("contentHash") == digest:
+            unchanged += 1
+            category = r.get("category")
+            recategorize = {}
+            if category and category != old.get("category"):
+                recategorize = {"$set": {"category": category}}
+                # ingredient_indexのカテゴリー別件数も直す
+                postings[len(ops)] = _posting_diff(old, old.get(TOKENS_FIELD), category)
+            if scraped or recategorize:
+                ops.append(UpdateOne({"detailUrl": r["detailUrl"]}, {**inc, **recategorize}))
+                urls.append(r["detailUrl"])
+            continue
+        # categoryがない行は保存済みの値が残る
+        postings[len(ops)] = _posting_diff(
+            old, r.get(TOKENS_FIELD), r.get("category") or old.get("category")
+        )
+        changes[len(ops)] = {
+            "_id": old.get("_id"),
+            "detailUrl": r["detailUrl"],
+            "change": "modified" if old else "inserted",
+            "oldHash": old.get("contentHash"),
+            "newHash": digest,
+        }
+        ops.append(
+            UpdateOne(
+                {"detailUrl": r["detailUrl"]},
+                {
+                    "$set": {**r, "contentHash": digest},
+                    **inc,
+                    "$setOnInsert": {"createdAt": now},
+                },
+                upsert=True,
+            )
+        )
+        urls.append(r["detailUrl"])
+    return ops, urls, unchanged, postings, changes
+
+
+def _posting_diff(old: dict, tokens, category) -> dict:
+    """ingredient_index.update_postingsに渡す1件分の差分（新規の_idは書き込み後に埋める）"""
+    return {
+        "_id": old.get("_id"),
+        "old": (list(old.get(TOKENS_FIELD) or ()), old.get("category")),
+        "new": (list(tokens or ()), category),
+    }
+
+
+def _applied_postings(postings: dict, upserted: dict, failed=()) -> list:
+    """書き込みに成功した行のingredient_indexの差分（_idが分からない行は除く）"""
+    applied = []
+    for index, diff in postings.items():
+        if index in failed:
+            continue
+        _id = upserted.get(index, diff["_id"])
+        if _id is not None:
+            applied.append({**diff, "_id": _id})
+    return applied
+
+
+def _applied_changes(changes: dict, upserted: dict, failed=()) -> list:
+    """
+    書き込みに成功した行の変更エントリ
+    upsertedは{opsの位置: 新規作成された_id}、failedは書き込みに失敗したopsの位置
+    """
+    applied = []
+    for index, entry in changes.items():
+        if index in failed:
+            continue
+        if index in upserted:
+            entry = {**entry, "_id": upserted[index], "change": "inserted"}
+        elif entry["change"] == "inserted":
+            # 読み込み後に他の実行が同じURLを登録していた（更新として扱う）
+            entry = {**entry, "change": "modified"}
+        applied.append(entry)
+    return applied
+
+
+def _hash_query(rows: list):
+    return (
+        {"detailUrl": {"$in": [r["detailUrl"] for r in rows]}},
+        {"_id": 1, "detailUrl": 1, "contentHash": 1, "category": 1, TOKENS_FIELD: 1},
+    )
+
+
+class UpsertStats:
+    """バッチupsertの集計（scraped=Falseは内容が同じ行を書き込まない場合）"""
+
+    def __init__(self, scraped: bool = True):
+        self.scraped = scraped
+        self.inserted = 0
+        self.modified = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.batches = 0
+        self.latencies = []
+        # 内容・カテゴリーが変わったレシピの新旧の材料トークン（ingredient_indexの差分更新に使う）
+        self.posting_changes = []
+        # 新規・内容が変わったレシピ（変更マニフェストのエントリ）
+        self.changes = []
+        # 書き込みに失敗した行（detailUrl → エラーメッセージ）。ジャーナル・キューでは保存済みにしない
+        self.failed = {}
+
+    def add(
+        self, result, unchanged: int, elapsed: float, changes: dict = None, postings: dict = None
+    ):
+        inserted = modified = 0
+        if result is not None:
+            inserted = result.upserted_count
+            # 内容変更なしの行もscrapeCountの増加でmodifiedに数えられるので差し引く
+            modified = result.modified_count - (unchanged if self.scraped else 0)
+            upserted = result.upserted_ids or {}
+            self.changes.extend(_applied_changes(changes or {}, upserted))
+            self.posting_changes.extend(_applied_postings(postings or {}, upserted))
+        self._add_batch(elapsed, inserted, modified, unchanged, 0)
+
+    def add_error(
+        self,
+        e: BulkWriteError,
+        unchanged: int,
+        elapsed: float,
+        changes: dict = None,
+        urls=(),
+        postings: dict = None,
+    ):
+        """一部の行が失敗したバッチ（urlsはopsの位置ごとのdetailUrl）"""
+        details = e.details or {}
+        for err in details.get("writeErrors", []):
+            if err["index"] < len(urls):
+                self.failed[urls[err["index"]]] = err.get("errmsg")
+        upserted = {u["index"]: u["_id"] for u in details.get("upserted", [])}
+        failed = {err["index"] for err in details.get("writeErrors", [])}
+        self.changes.extend(_applied_changes(changes or {}, upserted, failed))
+        self.posting_changes.extend(_applied_postings(postings or {}, upserted, failed))
+        self._add_batch(
+            elapsed,
+            details.get("nUpserted", 0),
+            max(0, details.get("nModified", 0) - (unchanged if self.scraped else 0)),
+            unchanged,
+            len(details.get("writeErrors", [])),
+        )
+
+    def _add_batch(self, elapsed, inserted, modified, unchanged, errors):
+        self.batches += 1
+        self.latencies.append(elapsed)
+        self.inserted += inserted
+        self.modified += modified
+        self.unchanged += unchanged
+        self.errors += errors
+        metrics.observe("mongo_upsert_batch_seconds", elapsed)
+        for result, n in (
+            ("inserted", inserted),
+            ("modified", modified),
+            ("unchanged", unchanged),
+            ("error", errors),
+        ):
+            if n:
+                metrics.inc("mongo_upsert_rows_total", n, result=result)
+
+    def to_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "modified": self.modified,
+            "unchanged": self.unchanged,
+            "errors": self.errors,
+            "batches": self.batches,
+            "seconds": round(sum(self.latencies), 4),
+        }
+
+    def summary(self) -> str:
+        total_ms = sum(self.latencies) * 1000
+        return (
+            f"inserted={self.inserted}, modified={self.modified}, "
+            f"unchanged={self.unchanged}, errors={self.errors}, "
+            f"batches={self.batches}, {total_ms:.0f}ms"
+        )
+
+
+def _log_batch(index: int, total: int, size: int, elapsed: float):
+    metrics.log_event(
+        "mongo_upsert_batch",
+        f"  🗄  batch {index}/{total}: {size}件 {elapsed * 1000:.0f}ms",
+        batch=index,
+        batches=total,
+        rows=size,
+        seconds=round(elapsed, 4),
+    )
+
+
+def _log_write_errors(index: int, e: BulkWriteError):
+    errors = (e.details or {}).get("writeErrors", [])
+    metrics.log_event(
+        "mongo_write_errors",
+        f"  ❌ batch {index}: 一部の書き込みに失敗: {errors[:1]}",
+        batch=index,
+        errors=len(errors),
+        first=errors[0].get("errmsg") if errors else None,
+    )
+
+
+def backfill_documents(update, batch_size: int = MONGO_BATCH_SIZE) -> dict:
+    """
+    既存ドキュメント全件にupdate(doc)を適用し、値が変わったものだけを書き戻す（バックフィル用）
+    update(doc)は$setするフィールドのdictを返す（現在の値と同じフィールドは書き込まない）
+    contentHashも更新後の内容で計算し直す
+    （次回のスクレイピングで内容が変わっていないページを「変更あり」と扱わないため）
+    返り値: {"scanned": 走査した件数, "updated": 書き込んだ件数}
+    """
+    col = get_collection()
+    counts = {"scanned": 0, "updated": 0}
+    ops = []
+
+    def flush():
+        if ops:
+            col.bulk_write(ops, ordered=False)
+            counts["updated"] += len(ops)
+            ops.clear()
+
+    for doc in col.find({}):
+        counts["scanned"] += 1
+        fields = {k: v for k, v in (update(doc) or {}).items() if doc.get(k) != v}
+        if not fields:
+            continue
+        doc.update(fields)
+        ops.append(
+            UpdateOne({"_id": doc["_id"]}, {"$set": {**fields, "contentHash": content_hash(doc)}})
+        )
+        if len(ops) >= batch_size:
+            flush()
+    flush()
+    return counts
+
+
+def check_existing_recipes(urls: list) -> set:
+    """
+    MongoDBに既に存在するレシピのURLを確認
+    返り値: 既存のURLのセット
+    """
+    if not urls:
+        return set()
+
+    try:
+        with metrics.timer("mongo_exists_seconds", query="detailUrl_in"):
+            existing = get_collection().find({"detailUrl": {"$in": urls}}, {"detailUrl": 1})
+            return {doc["detailUrl"] for doc in existing}
+    except Exception as e:
+        metrics.log_event(
+            "mongo_exists_error", f"⚠️  既存レシピ確認中にエラー: {e}", error=repr(e)
+        )
+        return set()
+
+
+def save_to_mongo(rows: list, batch_size: int = MONGO_BATCH_SIZE) -> UpsertStats:
+    """
+    MongoDBにupsertで保存（同期版）
+    - key: detailUrl
+    - 重複の場合はscrapeCount増加 + データ更新
+    - batch_size件ずつbulk_write(ordered=False)で送信
+    """
+    stats = UpsertStats()
+    if not rows:
+        return stats
+
+    col = get_collection()
+    batches = list(_chunks(rows, batch_size))
+    for i, batch in enumerate(batches, 1):
+        started = time.monotonic()
+        query, projection = _hash_query(batch)
+        stored = {d["detailUrl"]: d for d in col.find(query, projection)}
+        ops, urls, unchanged, postings, changes = _build_ops(batch, stored)
+        try:
+            result = col.bulk_write(ops, ordered=False)
+            stats.add(result, unchanged, time.monotonic() - started, changes, postings)
+        except BulkWriteError as e:
+            stats.add_error(e, unchanged, time.monotonic() - started, changes, urls, postings)
+            _log_write_errors(i, e)
+        _log_batch(i, len(batches), len(batch), stats.latencies[-1])
+
+    metrics.log_event(
+        "mongo_upsert_done", f"💾 MongoDB保存/更新完了: {stats.summary()}", **stats.to_dict()
+    )
+    return stats
+
+
+async def bulk_upsert(
+    rows: list, batch_size: int = MONGO_BATCH_SIZE, scraped: bool = True
+) -> UpsertStats:
+    """
+    rowsリストをdetailUrl基準でupsert（Motor版、処理内容は同期版と同じ）
+    scraped=False: アーカイブからの再パースなど、取得していない行（scrapeCountを増やさない）
+    """
+    stats = UpsertStats(scraped)
+    if not rows:
+        return stats
+
+    col = get_async_collection()
+    batches = list(_chunks(rows, batch_size))
+    metrics.log_event("mongo_upsert_start", f"🗄  DB upsert開始: {len(rows)}件", rows=len(rows))
+    for i, batch in enumerate(batches, 1):
+        started = time.monotonic()
+        query, projection = _hash_query(batch)
+        stored = {}
+        async for d in col.find(query, projection):
+            stored[d["detailUrl"]] = d
+        ops, urls, unchanged, postings, changes = _build_ops(batch, stored, scraped)
+        try:
+            # 内容が同じ行しかない（scraped=False）バッチは書き込まない
+            result = await col.bulk_write(ops, ordered=False) if ops else None
+            stats.add(result, unchanged, time.monotonic() - started, changes, postings)
+        except BulkWriteError as e:
+            stats.add_error(e, unchanged, time.monotonic() - started, changes, urls, postings)
+            _log_write_errors(i, e)
+        _log_batch(i, len(batches), len(batch), stats.latencies[-1])
+
+    metrics.log_event("mongo_upsert_done", f"✅ upsert完了: {stats.summary()}", **stats.to_dict())
+    return stats
+
+
+async def print_collection_count():
+    """現在のコレクションに何件あるか出力"""
+    try:
+        total = await get_async_collection().count_documents({})
+        metrics.log_event(
+            "mongo_count",
+            f"📊 MongoDB '{DB_NAME}.{COLLECTION_NAME}' 文書数: {total}件",
+            collection=f"{DB_NAME}.{COLLECTION_NAME}",
+            documents=total,
+        )
+    except Exception as e:
+        metrics.log_event("mongo_count_error", f"❌ count_documents中エラー: {e!r}", error=repr(e))
@@ -0,0 +1,59 @@
+# tests/conftest.py
+"""
+スクレイパーのテスト（scraper/ディレクトリで python -m pytest tests を実行）
+本番サイト・本番DBにはアクセスしない
+"""
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+SCRAPER_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SCRAPER_DIR))
+
+# config.pyは読み込み時に環境変数を読むので、スクレイパーのモジュールより先に設定する
+TEST_ENV = {
+    "HTTP_CACHE_PATH": "",
+    "KNOWN_URLS_PATH": "",
+    "MANIFEST_DIR": "",
+    "METRICS_JSON_LOGS": "0",
+    "IMAGE_ENABLED": "0",
+    "LISTING_MODE": "http",
+}
+for _key, _value in TEST_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+# MongoDBを使うテストの接続先（届かなければそのテストはスキップする）
+TEST_MONGODB_URI = os.getenv("TEST_MONGODB_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="session")
+def mongo_client():
+    """ローカルのmongodへの接続（なければ、使うテストをすべてスキップ）"""
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    client = MongoClient(TEST_MONGODB_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"mongodに接続できません: {TEST_MONGODB_URI}")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def mongo_db(mongo_client, monkeypatch):
+    """テストごとの使い捨てデータベースを作り、storageの共有クライアントをそこに向ける"""
+    import storage
+
+    name = f"recipe_test_{uuid.uuid4().hex[:8]}"
+    monkeypatch.setattr(storage, "_client", mongo_client)
+    monkeypatch.setattr(storage, "DB_NAME", name)
+    try:
+        yield mongo_client[name]
+    finally:
+        mongo_client.drop_database(name)
@@ -0,0 +1,51 @@
+# tests/test_archive.py
+from archive import ResponseArchive
+
+URL = "https://www.maff.go.jp/j/keikaku/syokubunka/k_ryouri/search_menu/menu/torimeshi_oita.html"
+
+
+class StubResponse:
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.status_code = status_code
+        self.reason = "OK"
+        self.headers = {"Content-Type": "text/html; charset=utf-8"}
+        self.content = content
+
+
+def _archive(tmp_path) -> ResponseArchive:
+    return ResponseArchive(str(tmp_path / "a.warc.gz"), str(tmp_path / "a.idx.sqlite3"))
+
+
+def _latest_body(archive: ResponseArchive) -> bytes:
+    [(url, _, _, offset, length)] = archive.latest()
+    assert url == URL
+    return archive.read(offset, length)["content"]
+
+
+def test_latest_follows_revisit_back_to_the_first_body(tmp_path):
+    archive = _archive(tmp_path)
+    try:
+        for content, fetched_at in ((b"A", 1.0), (b"B", 2.0), (b"A", 3.0)):
+            archive.record(URL, StubResponse(content), fetched_at)
+        # 3件目はrevisitとして記録され、最新の本文は1件目のA
+        kinds = [k for (k,) in archive._conn.execute("SELECT type FROM records ORDER BY id")]
+        assert kinds == ["response", "response", "revisit"]
+        assert _latest_body(archive) == b"A"
+        assert archive.latest()[0][2] == 3.0
+
+        # 索引を作り直しても同じ
+        archive.reindex()
+        assert _latest_body(archive) == b"A"
+    finally:
+        archive.close()
+
+
+def test_latest_ignores_later_errors(tmp_path):
+    archive = _archive(tmp_path)
+    try:
+        archive.record(URL, StubResponse(b"A"), 1.0)
+        archive.record(URL, StubResponse(b"B"), 2.0)
+        archive.record(URL, StubResponse(b"gone", status_code=404), 3.0)
+        assert _latest_body(archive) == b"B"
+    finally:
+        archive.close()
@@ -0,0 +1,56 @@
+# tests/test_charset.py
+import codecs
+
+from charset import CharsetResolver
+
+UTF8_PAGE = '<html><head><meta charset="utf-8"></head><body>鶏めし</body></html>'.encode()
+BARE_PAGE = "<html><body>ぶり大根</body></html>"
+
+
+def test_utf8_meta_wins_over_a_default_latin1_header():
+    resolver = CharsetResolver()
+    text = resolver.decode("https://a.example/1.html", UTF8_PAGE, "text/html; charset=ISO-8859-1")
+    assert "鶏めし" in text
+
+
+def test_single_byte_header_is_rejected_for_utf8_body():
+    resolver = CharsetResolver()
+    sources = [
+        source
+        for _, source in resolver.candidates(
+            "https://a.example/1.html", BARE_PAGE.encode(), "text/html; charset=windows-1252"
+        )
+    ]
+    assert sources[0] == "utf8"
+    assert "ぶり大根" in resolver.decode(
+        "https://a.example/1.html", BARE_PAGE.encode(), "text/html; charset=windows-1252"
+    )
+
+
+def test_single_byte_header_is_kept_for_non_utf8_body():
+    resolver = CharsetResolver()
+    body = "<p>café</p>".encode("latin-1")
+    assert resolver.decode("https://b.example/", body, "text/html; charset=ISO-8859-1") == "<p>café</p>"
+
+
+def test_declared_charset_outranks_the_host_cache():
+    resolver = CharsetResolver()
+    resolver.remember("https://c.example/1.html", "cp932")
+    body = "<p>ぶり大根</p>".encode()
+    # このUTF-8の本文はcp932としてもエラーなくデコードできてしまう
+    assert str(body, "cp932") != "<p>ぶり大根</p>"
+    text = resolver.decode("https://c.example/2.html", body, "text/html; charset=utf-8")
+    assert text == "<p>ぶり大根</p>"
+
+
+def test_host_cache_is_used_when_the_page_declares_nothing():
+    resolver = CharsetResolver()
+    resolver.remember("https://c.example/1.html", "cp932")
+    body = BARE_PAGE.encode("cp932")
+    assert resolver.decode("https://c.example/2.html", body, "text/html") == BARE_PAGE
+
+
+def test_bom_is_used_first():
+    resolver = CharsetResolver()
+    body = codecs.BOM_UTF8 + BARE_PAGE.encode()
+    assert resolver.decode("https://d.example/", body, "text/html; charset=cp932") == BARE_PAGE
@@ -0,0 +1,157 @@
+# tests/test_crawl_queue.py
+# ローカルのmongodが必要（TEST_MONGODB_URI、既定はmongodb://localhost:27017）。なければスキップ
+import asyncio
+import threading
+import time
+
+from crawl_queue import DONE, LEASED, PENDING, CrawlQueue
+from journal import FAILED, JournalSink
+
+URLS = [(f"https://www.maff.go.jp/detail/{i}.html", "rice") for i in range(60)]
+
+
+def _claim_all(queue: CrawlQueue, claimed: list, start: threading.Event):
+    start.wait()
+    while True:
+        doc = queue.claim()
+        if doc is None:
+            return
+        claimed.append(doc["_id"])
+
+
+def test_enqueue_is_idempotent_and_requeues_finished(mongo_db):
+    queue = CrawlQueue(owner="a")
+    assert queue.enqueue(URLS) == len(URLS)
+    # 未処理のURLを登録し直しても増えない
+    assert queue.enqueue(URLS) == 0
+
+    url = URLS[0][0]
+    queue.claim()
+    queue.mark_stored([url])
+    assert mongo_db.crawl_queue.find_one({"_id": url})["status"] == DONE
+    # doneになったURLはもう一度pendingに戻る
+    assert queue.enqueue(URLS[:1]) == 1
+    doc = mongo_db.crawl_queue.find_one({"_id": url})
+    assert doc["status"] == PENDING and doc["attempts"] == 0
+
+
+def test_two_workers_never_claim_the_same_url(mongo_db):
+    a, b = CrawlQueue(owner="a"), CrawlQueue(owner="b")
+    a.enqueue(URLS)
+    claimed_a, claimed_b = [], []
+    start = threading.Event()
+    threads = [
+        threading.Thread(target=_claim_all, args=(a, claimed_a, start)),
+        threading.Thread(target=_claim_all, args=(b, claimed_b, start)),
+    ]
+    for t in threads:
+        t.start()
+    start.set()
+    for t in threads:
+        t.join()
+
+    assert not set(claimed_a) & set(claimed_b)
+    assert sorted(claimed_a + claimed_b) == sorted(url for url, _ in URLS)
+    for doc in mongo_db.crawl_queue.find():
+        assert doc["status"] == LEASED
+        assert doc["attempts"] == 1
+        assert doc["leaseOwner"] == ("a" if doc["_id"] in claimed_a else "b")
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(mongo_db):
+    crashed = CrawlQueue(owner="crashed", lease_seconds=0.2)
+    other = CrawlQueue(owner="other", lease_seconds=60)
+    crashed.enqueue(URLS[:1])
+    url = crashed.claim()["_id"]
+    # リースが有効な間は取り出せない
+    assert other.claim() is None
+
+    # ハートビートが止まったままリースが切れる
+    time.sleep(0.3)
+    doc = other.claim()
+    assert doc["_id"] == url
+    assert doc["attempts"] == 2 and doc["leaseOwner"] == "other"
+
+    # 落ちたワーカーが後から完了を記録しても、取り直したワーカーのリースは奪わない
+    crashed.mark_stored([url])
+    assert mongo_db.crawl_queue.find_one({"_id": url})["status"] == LEASED
+    other.mark_stored([url])
+    assert mongo_db.crawl_queue.find_one({"_id": url})["status"] == DONE
+
+
+def test_heartbeat_keeps_the_lease(mongo_db):
+    worker = CrawlQueue(owner="worker", lease_seconds=0.3, heartbeat_interval=0.05)
+    other = CrawlQueue(owner="other")
+    worker.enqueue(URLS[:1])
+    worker.claim()
+    worker.start_heartbeat()
+    try:
+        time.sleep(0.8)
+        assert other.claim() is None
+    finally:
+        worker._stop.set()
+        worker._heartbeat.join()
+    time.sleep(0.4)
+    assert other.claim()["_id"] == URLS[0][0]
+
+
+def test_fail_retries_until_max_attempts(mongo_db):
+    a = CrawlQueue(owner="a", max_attempts=2)
+    b = CrawlQueue(owner="b", max_attempts=2)
+    a.enqueue(URLS[:1])
+    url = URLS[0][0]
+
+    a.claim()
+    a.fail(url, "HTTP 500")
+    doc = mongo_db.crawl_queue.find_one({"_id": url})
+    assert doc["status"] == PENDING and doc["error"] == "HTTP 500"
+    assert "leaseOwner" not in doc
+
+    b.claim()
+    b.fail(url, "HTTP 500")
+    doc = mongo_db.crawl_queue.find_one({"_id": url})
+    assert doc["status"] == FAILED and doc["attempts"] == 2
+    assert a.claim() is None
+    assert not a.has_unfinished()
+
+    assert a.retry_failed() == 1
+    assert a.claim()["_id"] == url
+
+
+def test_expired_lease_at_max_attempts_becomes_failed(mongo_db):
+    queue = CrawlQueue(owner="a", lease_seconds=0.1, max_attempts=1)
+    queue.enqueue(URLS[:1])
+    queue.claim()
+    time.sleep(0.2)
+    assert queue.claim() is None
+    assert queue.expire_exhausted() == 1
+    assert mongo_db.crawl_queue.find_one({"_id": URLS[0][0]})["status"] == FAILED
+
+
+def test_close_releases_held_leases(mongo_db):
+    queue = CrawlQueue(owner="a")
+    queue.enqueue(URLS[:3])
+    for _ in range(3):
+        queue.claim()
+    queue.mark_stored([URLS[0][0]])
+    queue.close()
+    statuses = {doc["_id"]: doc["status"] for doc in mongo_db.crawl_queue.find()}
+    assert statuses == {URLS[0][0]: DONE, URLS[1][0]: PENDING, URLS[2][0]: PENDING}
+
+
+class StubStore:
+    """直前のバッチで2件目を書き込めなかったMongoSink"""
+
+    failed = {URLS[1][0]: "E11000 duplicate key"}
+
+
+def test_rows_that_failed_to_store_are_retried(mongo_db):
+    queue = CrawlQueue(owner="a")
+    queue.enqueue(URLS[:3])
+    rows = [{"detailUrl": queue.claim()["_id"]} for _ in range(3)]
+    asyncio.run(JournalSink(queue, StubStore()).write(rows))
+
+    statuses = {doc["_id"]: doc["status"] for doc in mongo_db.crawl_queue.find()}
+    assert statuses == {URLS[0][0]: DONE, URLS[1][0]: PENDING, URLS[2][0]: DONE}
+    doc = queue.claim()
+    assert doc["_id"] == URLS[1][0] and doc["attempts"] == 2
@@ -0,0 +1,46 @@
+# tests/test_fetcher.py
+from fetcher import HostController
+
+
+def _controller(**kwargs) -> HostController:
+    return HostController("example.com", initial=2, minimum=1, maximum=8, latency_target=1, **kwargs)
+
+
+def _succeed(controller: HostController, elapsed: float = 0.1):
+    controller.acquire()
+    try:
+        controller.on_success(elapsed)
+    finally:
+        controller.release()
+
+
+def test_limit_does_not_grow_while_the_window_is_idle():
+    controller = _controller()
+    for _ in range(20):
+        _succeed(controller)
+    assert controller.limit == 2
+
+
+def test_limit_grows_when_the_window_is_full():
+    controller = _controller()
+    controller.acquire()
+    for _ in range(4):
+        _succeed(controller)
+    controller.release()
+    assert int(controller.limit) == 3
+
+
+def test_slow_responses_do_not_grow_the_limit():
+    controller = _controller()
+    controller.acquire()
+    for _ in range(4):
+        _succeed(controller, elapsed=5)
+    controller.release()
+    assert controller.limit == 2
+
+
+def test_congestion_halves_the_limit():
+    controller = _controller()
+    controller.limit = 8.0
+    controller.on_failure(congestion=True)
+    assert controller.limit == 4
@@ -0,0 +1,67 @@
+# tests/test_ingredient_index.py
+# ローカルのmongodが必要（TEST_MONGODB_URI、既定はmongodb://localhost:27017）。なければスキップ
+from config import INGREDIENT_INDEX_COLLECTION
+from ingredient_index import rebuild, update_postings
+from storage import save_to_mongo
+
+
+def _recipe(url, tokens, category=None):
+    row = {"detailUrl": url, "title": url, "ingredientTokens": tokens}
+    if category:
+        row["category"] = category
+    return row
+
+
+def _index(db):
+    return {
+        e["_id"]: (e["recipeIds"], e["count"], e["categories"], e["recipeCategories"])
+        for e in db[INGREDIENT_INDEX_COLLECTION].find({}, {"updatedAt": 0})
+    }
+
+
+def _save(rows):
+    stats = save_to_mongo(rows)
+    update_postings(stats.posting_changes)
+
+
+def test_diff_updates_match_a_full_rebuild(mongo_db):
+    _save(
+        [
+            _recipe("a", ["米", "塩"], "rice"),
+            _recipe("b", ["ごぼう", "塩"], "soup"),
+            _recipe("c", ["米", "ごぼう"]),
+        ]
+    )
+    # aは塩がなくなり鶏肉が増える、bはカテゴリーだけ変わる、cは内容が同じ
+    _save(
+        [
+            _recipe("a", ["米", "鶏肉"], "rice"),
+            _recipe("b", ["ごぼう", "塩"], "rice"),
+            _recipe("c", ["米", "ごぼう"]),
+        ]
+    )
+    incremental = _index(mongo_db)
+    assert incremental["塩"][1:3] == (1, {"rice": 1})
+    assert incremental["ごぼう"][2] == {"rice": 1}
+
+    rebuild()
+    assert incremental == _index(mongo_db)
+
+
+def test_token_without_recipes_is_deleted(mongo_db):
+    _save([_recipe("a", ["米", "塩"], "rice")])
+    _save([_recipe("a", ["米"], "rice")])
+    assert set(_index(mongo_db)) == {"米"}
+
+
+
+def test_applying_the_same_diff_twice_is_a_no_op(mongo_db):
+    _save([_recipe("a", ["米", "塩"], "rice"), _recipe("b", ["米"], "soup")])
+    # aは塩がなくなり、bはカテゴリーだけ変わる
+    stats = save_to_mongo([_recipe("a", ["米"], "rice"), _recipe("b", ["米"], "rice")])
+    update_postings(stats.posting_changes)
+    once = _index(mongo_db)
+    update_postings(stats.posting_changes)
+    assert _index(mongo_db) == once
+    assert once["米"][1:3] == (2, {"rice": 2})
+    assert set(once) == {"米"}
@@ -0,0 +1,40 @@
+# tests/test_ingredient_tokens.py
+import pytest
+
+from ingredient_tokens import ingredient_tokens, normalize_ingredient, split_ingredients
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        # NFKC: 全角英数・半角カナ・全角空白
+        ("ＭＣＴオイル", "mctおいる"),
+        ("ｻﾗﾀﾞ油", "さらだ油"),
+        ("鶏　もも肉", "鶏もも肉"),
+        # カタカナ → ひらがな
+        ("ゴボウ", "ごぼう"),
+        ("サラダ油", "さらだ油"),
+        ("ヴィネガー", "ゔぃねがー"),
+        # 括弧で囲まれた分量・補足を除く（入れ子も外側まで）
+        ("米（3合）", "米"),
+        ("しょうゆ【濃口】", "しょうゆ"),
+        ("だし汁（かつお（削り節））", "だし汁"),
+        ("塩〔少々〕 ", "塩"),
+    ],
+)
+def test_normalize_ingredient(name, expected):
+    assert normalize_ingredient(name) == expected
+
+
+def test_separators_inside_brackets_do_not_split():
+    assert split_ingredients("米（うるち米、3合）、ゴボウ・にんじん") == ["米", "ゴボウ", "にんじん"]
+
+
+def test_tokens_are_deduplicated_in_order():
+    ingredients = [{"name": "ごぼう"}, {"name": "サラダ油（大さじ1）"}, {"name": None}]
+    assert ingredient_tokens("ゴボウ、鶏肉", ingredients) == ["ごぼう", "鶏肉", "さらだ油"]
+
+
+def test_empty_input():
+    assert ingredient_tokens(None, None) == []
+    assert normalize_ingredient("（少々）") == ""
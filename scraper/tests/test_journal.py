@@ -0,0 +1,26 @@
+# tests/test_journal.py
+import asyncio
+
+from journal import FAILED, PARSED, STORED, CrawlJournal, JournalSink
+
+
+class StubStore:
+    """直前のバッチでbを書き込めなかったMongoSink"""
+
+    failed = {"b": "E11000 duplicate key"}
+
+
+def test_journal_sink_does_not_mark_failed_rows_as_stored(tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.sqlite3"))
+    journal.start("top")
+    rows = [{"detailUrl": url} for url in ("a", "b", "c")]
+    for row in rows:
+        journal.discover(row["detailUrl"])
+        journal.mark(row["detailUrl"], PARSED, record=row)
+
+    asyncio.run(JournalSink(journal, StubStore()).write(rows))
+
+    assert journal.counts() == {STORED: 2, FAILED: 1}
+    # --resumeでは、失敗した行を抽出済みのレコードから保存し直す
+    assert journal.pending() == [("b", None, {"detailUrl": "b"})]
+    journal.close()
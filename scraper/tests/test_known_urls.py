@@ -0,0 +1,39 @@
+# tests/test_known_urls.py
+# ローカルのmongodが必要（TEST_MONGODB_URI、既定はmongodb://localhost:27017）。なければスキップ
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from known_urls import KnownUrlIndex
+
+
+def _object_id(seconds_ago: float) -> ObjectId:
+    return ObjectId.from_datetime(datetime.fromtimestamp(time.time() - seconds_ago, timezone.utc))
+
+
+def test_sync_picks_up_documents_committed_late(mongo_db):
+    recipes = mongo_db.recipes
+    recipes.insert_one({"_id": _object_id(10), "detailUrl": "a"})
+    index = KnownUrlIndex()
+    assert index.sync(recipes) == 1
+
+    # 並行する実行が、aより前に生成した_idの文書を後からコミットした
+    recipes.insert_one({"_id": _object_id(30), "detailUrl": "b"})
+    recipes.insert_one({"_id": _object_id(0), "detailUrl": "c"})
+    assert index.sync(recipes, window=60) == 2
+    assert index.known(["a", "b", "c", "d"]) == {"a", "b", "c"}
+    # 読み直した範囲の取り込み済みURLは数えない
+    assert index.sync(recipes, window=60) == 0
+
+
+def test_snapshot_round_trip(mongo_db, tmp_path):
+    mongo_db.recipes.insert_many([{"detailUrl": u} for u in ("a", "b")])
+    path = str(tmp_path / "known.sqlite3")
+    index = KnownUrlIndex()
+    index.sync(mongo_db.recipes)
+    index.save(path)
+
+    restored = KnownUrlIndex.from_snapshot(path)
+    assert len(restored) == 2 and "a" in restored and "x" not in restored
+    assert restored.high_water == index.high_water > 0
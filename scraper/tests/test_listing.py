@@ -0,0 +1,69 @@
+# tests/test_listing.py
+from pathlib import Path
+
+from listing import extract_listing_urls, fetch_listing_urls
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+BASE = "https://www.maff.go.jp/j/keikaku/syokubunka/k_ryouri/search_menu"
+RICE_URL = f"{BASE}/type/rice.html"
+NOODLES_URL = f"{BASE}/type/noodles.html"
+
+
+def _fixture(name: str) -> str:
+    return (FIXTURE_DIR / name).read_text(encoding="utf-8")
+
+
+class StubResponse:
+    def __init__(self, url: str, text: str):
+        self.url = url
+        self.content = text.encode("utf-8")
+        self.headers = {"Content-Type": "text/html; charset=utf-8"}
+
+    def raise_for_status(self):
+        pass
+
+
+class StubFetcher:
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, *args):
+        self.requested.append(url)
+        return StubResponse(url, self.pages[url])
+
+
+def test_extract_listing_urls_includes_hidden_cards():
+    urls = extract_listing_urls(_fixture("category_rice.html"), RICE_URL)
+    assert urls == [
+        f"{BASE}/menu/torimeshi_oita.html",
+        f"{BASE}/menu/barazushi_okayama.html",
+        # display:noneのカードも含む
+        f"{BASE}/menu/ikameshi_hokkaido.html",
+        f"{BASE}/menu/kiritanpo_akita.html",
+        f"{BASE}/menu/kakinohazushi_nara.html",
+        # インラインスクリプトにだけあるURL（カードと重複するものは1回だけ）
+        f"{BASE}/menu/fukagawameshi_tokyo.html",
+    ]
+
+
+def test_fetch_listing_urls_needs_one_request_when_cards_are_in_markup():
+    fetcher = StubFetcher({RICE_URL: _fixture("category_rice.html")})
+    assert len(fetch_listing_urls(RICE_URL, fetcher)) == 6
+    assert fetcher.requested == [RICE_URL]
+
+
+def test_fetch_listing_urls_falls_back_to_same_host_data_scripts():
+    script_url = "https://www.maff.go.jp/j/keikaku/syokubunka/k_ryouri/js/menu_noodles.js"
+    fetcher = StubFetcher(
+        {
+            NOODLES_URL: _fixture("category_script_only.html"),
+            script_url: 'var menus = ["../menu/houtou_yamanashi.html", "../menu/wanko_iwate.html"];',
+        }
+    )
+    assert fetch_listing_urls(NOODLES_URL, fetcher) == [
+        f"{BASE}/menu/houtou_yamanashi.html",
+        f"{BASE}/menu/wanko_iwate.html",
+    ]
+    # 別ホストのスクリプトは取得しない
+    assert fetcher.requested == [NOODLES_URL, script_url]
@@ -0,0 +1,37 @@
+# tests/test_manifest.py
+# ローカルのmongodが必要（TEST_MONGODB_URI、既定はmongodb://localhost:27017）。なければスキップ
+import json
+
+from config import SCRAPE_RUNS_COLLECTION
+from manifest import ChangeManifest
+from storage import UpsertStats
+
+
+def _stats(changes) -> UpsertStats:
+    stats = UpsertStats()
+    stats.changes = changes
+    stats.unchanged = 2
+    return stats
+
+
+def test_changes_go_to_jsonl_and_only_counts_to_scrape_runs(mongo_db, tmp_path):
+    manifest = ChangeManifest(manifest_dir=str(tmp_path))
+    manifest.add(
+        _stats(
+            [
+                {"_id": 1, "detailUrl": "a", "change": "inserted", "oldHash": None, "newHash": "x"},
+                {"_id": 2, "detailUrl": "b", "change": "modified", "oldHash": "y", "newHash": "z"},
+            ]
+        )
+    )
+    manifest.close(mode="top")
+
+    run = mongo_db[SCRAPE_RUNS_COLLECTION].find_one({"_id": manifest.run_id})
+    assert "changes" not in run
+    assert run["counts"] == {"inserted": 1, "modified": 1, "unchanged": 2, "errors": 0}
+    assert run["manifestPath"] == manifest.path and run["mode"] == "top"
+
+    with open(manifest.path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [(line["_id"], line["change"]) for line in lines] == [("1", "inserted"), ("2", "modified")]
+    assert {line["runId"] for line in lines} == {manifest.run_id}
@@ -0,0 +1,53 @@
+# tests/test_parser_backends.py
+# html.parserとlxmlの抽出結果を比べる（一致しないページがある間はPARSER_BACKENDの既定をhtml.parserにする）
+from pathlib import Path
+
+import pytest
+
+import extract
+from listing import extract_listing_urls
+from scraper import parse_detail_bytes
+
+pytest.importorskip("lxml")
+
+TESTS_DIR = Path(__file__).resolve().parent
+PAGES = sorted(
+    [
+        *(TESTS_DIR.parent / "bench" / "fixtures").glob("*.html"),
+        *(TESTS_DIR / "fixtures").glob("*.html"),
+    ]
+)
+# 閉じタグの抜け・余分な閉じタグを含むページ（両者の木の形が変わる）
+DIVERGENT = {"detail_malformed.html"}
+BASE = "https://www.maff.go.jp/j/keikaku/syokubunka/k_ryouri/search_menu"
+
+
+def _url(page: Path) -> str:
+    if page.stem.startswith("category_"):
+        return f"{BASE}/type/{page.stem.removeprefix('category_')}.html"
+    return f"{BASE}/menu/{page.stem.removeprefix('detail_')}.html"
+
+
+def _extract(page: Path, backend: str, monkeypatch) -> tuple:
+    monkeypatch.setattr(extract, "_resolved_backend", backend)
+    content = page.read_bytes()
+    url = _url(page)
+    return (
+        parse_detail_bytes(content, url, "text/html; charset=utf-8"),
+        extract_listing_urls(content.decode("utf-8"), url),
+    )
+
+
+@pytest.mark.parametrize(
+    "page",
+    [
+        pytest.param(
+            page,
+            id=page.name,
+            marks=pytest.mark.xfail(page.name in DIVERGENT, reason="lxmlと木の形が違う", strict=True),
+        )
+        for page in PAGES
+    ],
+)
+def test_backends_extract_the_same_output(page, monkeypatch):
+    assert _extract(page, "lxml", monkeypatch) == _extract(page, "html.parser", monkeypatch)
@@ -0,0 +1,98 @@
+# tests/test_pipeline.py
+import asyncio
+
+import pytest
+
+from pipeline import run_pipeline
+
+
+async def _source(n: int):
+    for i in range(n):
+        yield {"url": f"https://example.com/{i}"}, i
+
+
+class FailingSink:
+    """2回目の書き込みで落ちるsink（MongoDBの障害を想定）"""
+
+    def __init__(self):
+        self.writes = 0
+        self.closed = False
+
+    async def write(self, rows: list):
+        self.writes += 1
+        if self.writes >= 2:
+            raise RuntimeError("sink down")
+
+    async def close(self):
+        self.closed = True
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+        self.closed = False
+
+    async def write(self, rows: list):
+        self.rows.extend(rows)
+
+    async def close(self):
+        self.closed = True
+
+
+def _run(sink, n=500, **kwargs):
+    return asyncio.run(
+        asyncio.wait_for(
+            run_pipeline(
+                _source(n),
+                fetch=lambda value, meta: value,
+                parse=lambda value, meta: {"url": meta["url"], "value": value},
+                sinks=[sink],
+                fetch_workers=4,
+                parse_workers=2,
+                queue_size=4,
+                flush_size=10,
+                flush_interval=0.5,
+                **kwargs,
+            ),
+            timeout=20,
+        )
+    )
+
+
+def test_pipeline_stores_all_records():
+    sink = ListSink()
+    stats = _run(sink, n=200)
+    assert stats.listed == stats.fetched == stats.parsed == stats.stored == 200
+    assert sorted(r["value"] for r in sink.rows) == list(range(200))
+    assert sink.closed
+
+
+def test_sink_error_propagates_and_closes_sinks():
+    sink = FailingSink()
+    with pytest.raises(RuntimeError, match="sink down"):
+        _run(sink)
+    assert sink.closed
+
+
+def test_source_error_propagates():
+    async def broken_source():
+        yield {"url": "https://example.com/0"}, 0
+        raise ValueError("listing failed")
+
+    sink = ListSink()
+    with pytest.raises(ValueError, match="listing failed"):
+        asyncio.run(
+            asyncio.wait_for(
+                run_pipeline(
+                    broken_source(),
+                    fetch=lambda value, meta: value,
+                    parse=lambda value, meta: {"value": value},
+                    sinks=[sink],
+                    fetch_workers=2,
+                    parse_workers=1,
+                    queue_size=1,
+                ),
+                timeout=20,
+            )
+        )
+    assert sink.closed
@@ -0,0 +1,42 @@
+# tests/test_quantity.py
+import pytest
+
+from quantity import parse_quantity, with_quantities
+
+CASES = [
+    ("450g（3合）", {"value": 450.0, "unit": "g", "alt": {"value": 3.0, "unit": "合"}}),
+    ("大さじ1と1/2", {"value": 22.5, "unit": "ml"}),
+    ("小さじ１／２", {"value": 2.5, "unit": "ml"}),
+    ("カップ1/2", {"value": 100.0, "unit": "ml"}),
+    ("1/2個", {"value": 0.5, "unit": "個"}),
+    ("1½個", {"value": 1.5, "unit": "個"}),
+    ("½本", {"value": 0.5, "unit": "本"}),
+    ("２００ｇ", {"value": 200.0, "unit": "g"}),
+    ("１．５kg", {"value": 1500.0, "unit": "g"}),
+    ("1〜2本", {"value": 1.0, "max": 2.0, "unit": "本"}),
+    ("100-150ml", {"value": 100.0, "max": 150.0, "unit": "ml"}),
+    ("約100g", {"value": 100.0, "unit": "g", "approx": True}),
+    ("適量（約10g）", {"value": 10.0, "unit": "g", "approx": True}),
+    ("1/2本（80g）", {"value": 0.5, "unit": "本", "alt": {"value": 80.0, "unit": "g"}}),
+    ("2", {"value": 2.0, "unit": None}),
+]
+
+UNPARSEABLE = ["少々", "適量", "ひとつまみ", "お好みで", "大さじ", "1/0個", "", None]
+
+
+@pytest.mark.parametrize("amount, expected", CASES)
+def test_parse_quantity(amount, expected):
+    assert parse_quantity(amount) == expected
+
+
+@pytest.mark.parametrize("amount", UNPARSEABLE)
+def test_unparseable_amounts_are_none(amount):
+    assert parse_quantity(amount) is None
+
+
+def test_with_quantities_keeps_the_original_fields():
+    rows = with_quantities([{"name": "塩", "amount": "少々"}, {"name": "米", "amount": "2合"}])
+    assert rows == [
+        {"name": "塩", "amount": "少々", "quantity": None},
+        {"name": "米", "amount": "2合", "quantity": {"value": 2.0, "unit": "合"}},
+    ]
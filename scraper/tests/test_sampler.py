@@ -0,0 +1,38 @@
+# tests/test_sampler.py
+from sampler import CoverageSampler
+
+
+def test_schnabel_estimate_with_known_counts():
+    sampler = CoverageSampler(target_coverage=0.8, min_refreshes=3)
+    # C=4, M=0, R=0
+    assert sampler.observe(["a", "b", "c", "d"]) == 4
+    # C=4, M=4, R=2
+    assert sampler.observe(["c", "d", "e", "f"]) == 2
+    assert sampler.estimated_total == 8  # 16 / 2
+    assert not sampler.done()  # min_refreshes未満
+    # C=4, M=6, R=2 → N = (16 + 24) / (2 + 2) = 10
+    assert sampler.observe(["a", "e", "g", "h", None, ""]) == 2
+    assert sampler.estimated_total == 10
+    assert sampler.coverage == 0.8
+    assert sampler.done()
+    assert sampler.report() == "収集 8件 / 推定総数 10件（推定カバー率 80%、リフレッシュ 3回）"
+
+
+def test_estimate_is_never_below_the_urls_seen():
+    sampler = CoverageSampler()
+    sampler.observe(["a", "b"])
+    sampler.observe(["a", "b"])
+    sampler.observe(["a", "b", "c"])  # N = (4 + 6) / (2 + 2) = 2.5 だが3件見ている
+    assert sampler.estimated_total == 3
+    assert sampler.coverage == 1.0
+
+
+def test_no_recapture_has_no_estimate():
+    sampler = CoverageSampler(target_coverage=0.5, min_refreshes=1)
+    assert sampler.report() == "収集 0件 / 推定総数 不明件（推定カバー率 0%、リフレッシュ 0回）"
+    for i in range(5):
+        sampler.observe([f"u{i}-{j}" for j in range(3)])
+    assert sampler.estimated_total is None
+    assert sampler.coverage == 0.0
+    assert not sampler.done()
+    assert sampler.report().startswith("収集 15件 / 推定総数 不明件")
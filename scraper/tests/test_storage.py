@@ -0,0 +1,56 @@
+# tests/test_storage.py
+from pymongo.errors import BulkWriteError
+
+from storage import UpsertStats, _build_ops
+
+
+def test_build_ops_lists_detail_urls_in_op_order():
+    rows = [{"detailUrl": "a", "title": "A"}, {"detailUrl": "b", "title": "B"}]
+    ops, urls, unchanged, _, changes = _build_ops(rows, {})
+    assert urls == ["a", "b"] and len(ops) == 2
+    assert unchanged == 0 and [c["change"] for c in changes.values()] == ["inserted", "inserted"]
+
+
+def test_add_error_reports_failed_detail_urls():
+    rows = [{"detailUrl": u, "title": u} for u in ("a", "b", "c")]
+    ops, urls, unchanged, _, changes = _build_ops(rows, {})
+    error = BulkWriteError(
+        {
+            "writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"}],
+            "upserted": [{"index": 0, "_id": "id-a"}, {"index": 2, "_id": "id-c"}],
+            "nUpserted": 2,
+            "nModified": 0,
+        }
+    )
+    stats = UpsertStats()
+    stats.add_error(error, unchanged, 0.01, changes, urls)
+    assert stats.failed == {"b": "E11000 duplicate key"}
+    assert stats.errors == 1 and stats.inserted == 2
+    assert [c["detailUrl"] for c in stats.changes] == ["a", "c"]
+
+
+def test_category_does_not_change_content_hash():
+    from fingerprint import content_hash
+
+    page = {"detailUrl": "a", "title": "鶏めし", "ingredients": ["米"]}
+    assert content_hash({**page, "category": "rice"}) == content_hash(page)
+
+
+def test_unchanged_row_only_sets_a_missing_category():
+    from fingerprint import content_hash
+
+    page = {"detailUrl": "a", "title": "鶏めし", "ingredientTokens": ["米"]}
+    stored = {
+        "a": {"_id": 1, "detailUrl": "a", "contentHash": content_hash(page), "ingredientTokens": ["米"]}
+    }
+
+    # クロールモード（categoryなし）: scrapeCountの増加のみ
+    ops, _, unchanged, postings, changes = _build_ops([page], stored)
+    assert unchanged == 1 and not changes and not postings
+    assert ops[0]._doc == {"$inc": {"scrapeCount": 1}}
+
+    # 上位5件モード（categoryあり）: 内容の変更としては扱わずcategoryだけ書き込む
+    ops, _, unchanged, postings, changes = _build_ops([{**page, "category": "rice"}], stored)
+    assert unchanged == 1 and not changes
+    assert postings == {0: {"_id": 1, "old": (["米"], None), "new": (["米"], "rice")}}
+    assert ops[0]._doc == {"$inc": {"scrapeCount": 1}, "$set": {"category": "rice"}}